@@ -1,5 +1,6 @@
 """Kolibri agent API."""
 
 from .engine import KolibriAgent, TraceNode
+from .result_cache import InferenceResultCache, state_fingerprint
 
-__all__ = ["KolibriAgent", "TraceNode"]
+__all__ = ["InferenceResultCache", "KolibriAgent", "TraceNode", "state_fingerprint"]
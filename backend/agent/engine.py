@@ -10,6 +10,7 @@ from core.memory import LongTermMemory, WorkingMemoryBuffer
 from core.representations import SymbolicEmbeddingSpace
 
 from ..feedback_service.theta import ThetaState, ThetaUpdater
+from .result_cache import InferenceResultCache, state_fingerprint
 
 
 def _splitmix64(value: int) -> int:
@@ -93,9 +94,15 @@ class TraceNode:
 class KolibriAgent:
     """High level agent orchestrating Kolibri Nano steps."""
 
-    def __init__(self, *, theta_path: str | None = None) -> None:
+    def __init__(
+        self,
+        *,
+        theta_path: str | None = None,
+        result_cache: InferenceResultCache | None = None,
+    ) -> None:
         self.seed_base = 0xD1B54A32D192ED03
         self.theta_updater = ThetaUpdater(path=Path(theta_path) if theta_path else None)
+        self.result_cache = result_cache
         self.embedding = SymbolicEmbeddingSpace()
         self.long_memory = LongTermMemory(self.embedding, ttl_seconds=7 * 24 * 3600)
         self.working_memory = WorkingMemoryBuffer(capacity=48, decay=0.88)
@@ -112,7 +119,7 @@ class KolibriAgent:
         modulated_q = self._modulate_query(q, state.pi)
         beam = max(1, min(beam, 256))
         depth = max(1, min(depth, 64))
-        best, trace = self._infer_with_trace(modulated_q, state, beam, depth)
+        best, trace = self._cached_infer(modulated_q, state, beam, depth)
         self.working_memory.add(q, tau=best.chi, kappa=best.phi, tags=["step"] + (tags or []))
         self.long_memory.append(
             f"step q={q} score={best.score:.4f}",
@@ -152,6 +159,31 @@ class KolibriAgent:
             "working_memory": self.working_memory.as_dict(),
         }
 
+    def _cached_infer(
+        self,
+        q: int,
+        state: ThetaState,
+        beam: int,
+        depth: int,
+    ) -> tuple[TraceNode, List[TraceNode]]:
+        cache = self.result_cache
+        if cache is None:
+            return self._infer_with_trace(q, state, beam, depth)
+        version = state_fingerprint(state.theta, state.pi, state.rho)
+        cache.observe_version(version)
+        key = ("agent", q, beam, depth, version, self.seed_base)
+        cached = cache.get(key)
+        if cached is not None:
+            trace = [TraceNode(*node) for node in cached]
+            return max(trace, key=lambda node: node.score), trace
+        best, trace = self._infer_with_trace(q, state, beam, depth)
+        cache.put(
+            key,
+            [[n.level, n.identifier, n.chi, n.phi, n.score] for n in trace],
+            size=96 * len(trace),
+        )
+        return best, trace
+
     def _infer_with_trace(
         self,
         q: int,
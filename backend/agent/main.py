@@ -6,14 +6,18 @@ from typing import Optional
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, conint
 
-from backend.federation.router import router as federation_router
+from backend.feedback_service.theta import get_theta_updater
+from backend.federation.router import FEDERATION_KEY, router as federation_router
+from backend.federation.scheduler import FederationSyncScheduler, scheduler_from_env
 
 from .engine import KolibriAgent
+from .result_cache import InferenceResultCache
 
 app = FastAPI(title="Kolibri Agent API", version="0.5.0")
 app.include_router(federation_router)
 
 _agent: Optional[KolibriAgent] = None
+_sync_scheduler: Optional[FederationSyncScheduler] = None
 
 
 class StepRequest(BaseModel):
@@ -25,8 +29,20 @@ class StepRequest(BaseModel):
 
 @app.on_event("startup")
 async def _startup() -> None:
-    global _agent
-    _agent = KolibriAgent()
+    global _agent, _sync_scheduler
+    _agent = KolibriAgent(result_cache=InferenceResultCache.from_env("KOLIBRI_AGENT_CACHE"))
+    updater = await get_theta_updater()
+    _sync_scheduler = scheduler_from_env(updater, FEDERATION_KEY)
+    if _sync_scheduler is not None:
+        _sync_scheduler.start()
+
+
+@app.on_event("shutdown")
+async def _shutdown() -> None:
+    global _sync_scheduler
+    if _sync_scheduler is not None:
+        await _sync_scheduler.stop()
+        _sync_scheduler = None
 
 
 def _parse_q(value: str | int) -> int:
@@ -60,4 +76,13 @@ async def agent_state():
     return await _agent.snapshot()
 
 
+@app.get("/api/agent/cache")
+async def agent_cache():
+    if _agent is None:
+        raise HTTPException(status_code=503, detail="Agent not ready")
+    if _agent.result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **_agent.result_cache.stats()}
+
+
 __all__ = ["app"]
@@ -0,0 +1,248 @@
+"""Кэш результатов детерминированного инференса Kolibri Nano.
+
+Ключ включает входы инференса (``q``, ``beam``, ``depth``, ``seed_base``) и
+отпечаток θ/π/ρ, поэтому смена параметров автоматически делает старые записи
+недостижимыми, а :meth:`InferenceResultCache.observe_version` сразу освобождает
+память. Горячий уровень — LRU с допуском TinyLFU и ограничением по числу
+записей и объёму; опциональный уровень SQLite разделяется между воркерами
+uvicorn.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Hashable, Iterable, Optional
+
+
+def state_fingerprint(*vectors: Iterable[float]) -> str:
+    """Возвращает короткий отпечаток набора векторов (версию θ по содержимому)."""
+
+    digest = hashlib.blake2b(digest_size=8)
+    for vector in vectors:
+        values = list(vector)
+        digest.update(struct.pack(f"<I{len(values)}d", len(values), *values))
+    return digest.hexdigest()
+
+
+class _FrequencySketch:
+    """Count-min sketch с 4-битными счётчиками и периодическим старением (TinyLFU)."""
+
+    _DEPTH = 4
+    _SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+
+    def __init__(self, capacity: int) -> None:
+        width = 16
+        while width < capacity * 2:
+            width <<= 1
+        self._mask = width - 1
+        self._table = [bytearray(width) for _ in range(self._DEPTH)]
+        self._sample_size = max(10 * capacity, 64)
+        self._additions = 0
+
+    def increment(self, key: Hashable) -> None:
+        base = hash(key)
+        for row, seed in zip(self._table, self._SEEDS):
+            index = (base ^ seed) * 0x9E3779B97F4A7C15 >> 17 & self._mask
+            if row[index] < 15:
+                row[index] += 1
+        self._additions += 1
+        if self._additions >= self._sample_size:
+            self._age()
+
+    def frequency(self, key: Hashable) -> int:
+        base = hash(key)
+        return min(
+            row[(base ^ seed) * 0x9E3779B97F4A7C15 >> 17 & self._mask]
+            for row, seed in zip(self._table, self._SEEDS)
+        )
+
+    def _age(self) -> None:
+        for row in self._table:
+            for index, value in enumerate(row):
+                if value:
+                    row[index] = value >> 1
+        self._additions //= 2
+
+
+class _DiskTier:
+    """Общий для процессов уровень кэша поверх SQLite (WAL-режим)."""
+
+    def __init__(self, path: Path, *, max_entries: int) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(str(path), timeout=1.0, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+        )
+        self._max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            try:
+                row = self._connection.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error:
+                return None
+        return row[0] if row else None
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            try:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", (key, value)
+                )
+                self._writes += 1
+                if self._writes % 256 == 0:
+                    self._connection.execute(
+                        "DELETE FROM results WHERE rowid <= "
+                        "(SELECT MAX(rowid) FROM results) - ?",
+                        (self._max_entries,),
+                    )
+                self._connection.commit()
+            except sqlite3.Error:
+                return
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class InferenceResultCache:
+    """Ограниченный по памяти LRU/TinyLFU-кэш результатов инференса."""
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = 4096,
+        max_bytes: int = 32 * 1024 * 1024,
+        admission: bool = True,
+        disk_path: Path | str | None = None,
+        max_disk_entries: int = 100_000,
+        encode: Callable[[Any], str] = json.dumps,
+        decode: Callable[[str], Any] = json.loads,
+    ) -> None:
+        self._max_entries = max(1, max_entries)
+        self._max_bytes = max(1, max_bytes)
+        self._entries: "OrderedDict[Hashable, tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._sketch = _FrequencySketch(self._max_entries) if admission else None
+        self._disk = _DiskTier(Path(disk_path), max_entries=max_disk_entries) if disk_path else None
+        self._encode = encode
+        self._decode = decode
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    @classmethod
+    def from_env(cls, prefix: str, **kwargs: Any) -> Optional["InferenceResultCache"]:
+        """Создаёт кэш по переменным ``{prefix}_SIZE`` и ``{prefix}_PATH``; размер 0 отключает."""
+
+        size = int(os.getenv(f"{prefix}_SIZE", "4096"))
+        if size <= 0:
+            return None
+        disk_path = os.getenv(f"{prefix}_PATH") or None
+        return cls(max_entries=size, disk_path=disk_path, **kwargs)
+
+    def observe_version(self, version: str) -> None:
+        """Сбрасывает горячий уровень, если отпечаток θ/π/ρ изменился."""
+
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._entries.clear()
+                self._bytes = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if self._sketch is not None:
+                self._sketch.increment(key)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        if self._disk is not None:
+            raw = self._disk.get(self._disk_key(key))
+            if raw is not None:
+                value = self._decode(raw)
+                self.disk_hits += 1
+                self._store(key, value, len(raw))
+                return value
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any, *, size: Optional[int] = None) -> None:
+        raw: Optional[str] = None
+        if self._disk is not None or size is None:
+            raw = self._encode(value)
+            size = len(raw) if size is None else size
+        self._store(key, value, size)
+        if self._disk is not None and raw is not None:
+            self._disk.put(self._disk_key(key), raw)
+
+    def stats(self) -> dict[str, float | int]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "rejections": self.rejections,
+            "hit_ratio": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+            self._disk = None
+
+    def _store(self, key: Hashable, value: Any, size: int) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            while self._entries and (
+                len(self._entries) >= self._max_entries or self._bytes + size > self._max_bytes
+            ):
+                victim_key = next(iter(self._entries))
+                if self._sketch is not None and previous is None:
+                    if self._sketch.frequency(key) < self._sketch.frequency(victim_key):
+                        self.rejections += 1
+                        return
+                _, victim_size = self._entries.pop(victim_key)
+                self._bytes -= victim_size
+                self.evictions += 1
+            if size > self._max_bytes:
+                self.rejections += 1
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+
+    @staticmethod
+    def _disk_key(key: Hashable) -> str:
+        return repr(key)
+
+
+__all__ = ["InferenceResultCache", "state_fingerprint"]
@@ -1,6 +1,30 @@
 """Kolibri federation helpers."""
 
-from .delta import ThetaDelta, sign_delta, verify_and_load
-from .merge import merge_deltas
+from .aggregate import PartialAggregate, aggregate, sign_aggregate, verify_aggregate
+from .delta import ThetaDelta, sign_delta, verify_and_load, verify_many
+from .merge import merge_deltas, merge_deltas_batch
+from .privacy import NoiseGenerator, NoiseSpec, PrivacyAccountant, PrivacyBudgetExceeded
+from .sparse import NeedFullState, PeerBaseStore, SparseDeltaEncoder
+from .wire import decode_delta, encode_delta
 
-__all__ = ["ThetaDelta", "sign_delta", "verify_and_load", "merge_deltas"]
+__all__ = [
+    "NeedFullState",
+    "NoiseGenerator",
+    "NoiseSpec",
+    "PartialAggregate",
+    "PeerBaseStore",
+    "PrivacyAccountant",
+    "PrivacyBudgetExceeded",
+    "SparseDeltaEncoder",
+    "ThetaDelta",
+    "aggregate",
+    "decode_delta",
+    "encode_delta",
+    "merge_deltas",
+    "merge_deltas_batch",
+    "sign_aggregate",
+    "sign_delta",
+    "verify_aggregate",
+    "verify_and_load",
+    "verify_many",
+]
@@ -0,0 +1,148 @@
+"""Partial aggregates for tree-shaped federation merges.
+
+An intermediate node folds the deltas of its children into a
+:class:`PartialAggregate` — total weight plus weighted sums of θ/π/ρ, σ and the
+EMA reward — and forwards it, signed, to its parent. The root then merges
+O(fan-in) inputs instead of O(nodes).
+
+Sums are kept in fixed point as Python integers (values are quantised to
+``2**-FIXED_POINT_BITS`` once, at the leaf), so combining aggregates is exactly
+associative and commutative: any tree shape and any arrival order produce the
+same bits at the root.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+from dataclasses import dataclass, field
+from functools import reduce
+from typing import Iterable, List, Sequence
+
+from ..feedback_service.theta import ThetaState
+from .delta import ThetaDelta
+
+FIXED_POINT_BITS = 48
+_ONE = 1 << FIXED_POINT_BITS
+_KIND = "aggregate"
+
+
+def _fixed(value: float) -> int:
+    return round(value * _ONE)
+
+
+def _add_vectors(left: Sequence[int], right: Sequence[int]) -> List[int]:
+    if len(left) < len(right):
+        left, right = right, left
+    return [value + (right[index] if index < len(right) else 0) for index, value in enumerate(left)]
+
+
+@dataclass(frozen=True)
+class PartialAggregate:
+    weight: int = 0
+    nodes: int = 0
+    theta: List[int] = field(default_factory=list)
+    pi: List[int] = field(default_factory=list)
+    rho: List[int] = field(default_factory=list)
+    sigma: int = 0
+    ema_reward: int = 0
+
+    @classmethod
+    def from_delta(cls, delta: ThetaDelta) -> "PartialAggregate":
+        weight = max(1, int(delta.updates))
+        return cls(
+            weight=weight,
+            nodes=1,
+            theta=[_fixed(value) * weight for value in delta.theta],
+            pi=[_fixed(value) * weight for value in delta.pi],
+            rho=[_fixed(value) * weight for value in delta.rho],
+            sigma=_fixed(delta.sigma) * weight,
+            ema_reward=_fixed(delta.ema_reward) * weight,
+        )
+
+    def combine(self, other: "PartialAggregate") -> "PartialAggregate":
+        return PartialAggregate(
+            weight=self.weight + other.weight,
+            nodes=self.nodes + other.nodes,
+            theta=_add_vectors(self.theta, other.theta),
+            pi=_add_vectors(self.pi, other.pi),
+            rho=_add_vectors(self.rho, other.rho),
+            sigma=self.sigma + other.sigma,
+            ema_reward=self.ema_reward + other.ema_reward,
+        )
+
+    __add__ = combine
+
+    def apply_to(self, state: ThetaState) -> ThetaState:
+        """Merge into ``state`` with the semantics of :func:`merge_deltas` (state weight 1)."""
+
+        if self.weight == 0:
+            return state
+        denominator = _ONE * (1 + self.weight)
+
+        def _mean(base: Sequence[float], sums: Sequence[int]) -> List[float]:
+            width = max(len(base), len(sums))
+            fixed_base = [_fixed(value) for value in base] + [0] * (width - len(base))
+            return [numerator / denominator for numerator in _add_vectors(fixed_base, sums)]
+
+        return ThetaState(
+            theta=_mean(state.theta, self.theta),
+            pi=_mean(state.pi, self.pi),
+            rho=_mean(state.rho, self.rho),
+            updates=state.updates + 1,
+            ema_reward=(_fixed(state.ema_reward) + self.ema_reward) / denominator,
+            sigma=max(0.05, (_fixed(state.sigma) + self.sigma) / denominator),
+        )
+
+    def to_json(self) -> dict[str, object]:
+        return {
+            "kind": _KIND,
+            "bits": FIXED_POINT_BITS,
+            "weight": self.weight,
+            "nodes": self.nodes,
+            "theta": self.theta,
+            "pi": self.pi,
+            "rho": self.rho,
+            "sigma": self.sigma,
+            "ema_reward": self.ema_reward,
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, object]) -> "PartialAggregate":
+        if data.get("kind") != _KIND or data.get("bits") != FIXED_POINT_BITS:
+            raise ValueError("not a partial aggregate of this format")
+        return cls(
+            weight=int(data["weight"]),
+            nodes=int(data.get("nodes", 0)),
+            theta=[int(value) for value in data.get("theta", [])],
+            pi=[int(value) for value in data.get("pi", [])],
+            rho=[int(value) for value in data.get("rho", [])],
+            sigma=int(data.get("sigma", 0)),
+            ema_reward=int(data.get("ema_reward", 0)),
+        )
+
+
+def aggregate(items: Iterable[PartialAggregate | ThetaDelta]) -> PartialAggregate:
+    """Fold deltas and/or aggregates of children into one aggregate."""
+
+    parts = (item if isinstance(item, PartialAggregate) else PartialAggregate.from_delta(item) for item in items)
+    return reduce(PartialAggregate.combine, parts, PartialAggregate())
+
+
+def sign_aggregate(value: PartialAggregate, key: bytes) -> str:
+    payload = json.dumps(value.to_json(), separators=(",", ":"))
+    signature = hmac.new(key, payload.encode("utf-8"), hashlib.sha256).hexdigest()
+    return json.dumps({"payload": payload, "signature": signature})
+
+
+def verify_aggregate(raw: str, key: bytes) -> PartialAggregate:
+    parsed = json.loads(raw)
+    payload = parsed["payload"]
+    expected = hmac.new(key, payload.encode("utf-8"), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(parsed["signature"], expected):
+        raise ValueError("signature mismatch")
+    return PartialAggregate.from_json(json.loads(payload))
+
+
+__all__ = ["FIXED_POINT_BITS", "PartialAggregate", "aggregate", "sign_aggregate", "verify_aggregate"]
@@ -5,10 +5,12 @@ from __future__ import annotations
 import hashlib
 import hmac
 import json
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Iterable, List
+from typing import Any, Callable, List, Optional, Sequence, Union
 
 from ..feedback_service.theta import ThetaState
+from .privacy import NoiseGenerator, NoiseSpec, default_generator
 
 
 @dataclass
@@ -36,28 +38,26 @@ class ThetaDelta:
         state: ThetaState,
         *,
         noise_scale: float = 0.0,
+        noise: Optional[NoiseSpec] = None,
+        generator: Optional[NoiseGenerator] = None,
     ) -> "ThetaDelta":
+        """Snapshot ``state``; ``noise`` (or a raw Gaussian ``noise_scale``) perturbs θ/π/ρ."""
+
+        if noise is None and noise_scale > 0.0:
+            noise = NoiseSpec("gaussian", noise_scale)
+        vectors = [list(state.theta), list(state.pi), list(state.rho)]
+        if noise is not None and noise.scale > 0.0:
+            vectors = (generator or default_generator()).perturb(vectors, noise)
         return cls(
-            theta=_add_noise(state.theta, noise_scale),
-            pi=_add_noise(state.pi, noise_scale),
-            rho=_add_noise(state.rho, noise_scale),
+            theta=vectors[0],
+            pi=vectors[1],
+            rho=vectors[2],
             sigma=state.sigma,
             updates=state.updates,
             ema_reward=state.ema_reward,
         )
 
 
-def _add_noise(values: Iterable[float], scale: float) -> List[float]:
-    if scale <= 0.0:
-        return list(values)
-    noise = []
-    for index, value in enumerate(values):
-        seed = hashlib.sha256(f"dp:{index}:{value}".encode("utf-8")).digest()
-        fraction = int.from_bytes(seed[:8], "little") / float(1 << 53)
-        noise.append(value + (fraction - 0.5) * 2 * scale)
-    return noise
-
-
 def sign_delta(delta: ThetaDelta, key: bytes) -> str:
     payload = json.dumps(delta.to_json(), separators=(",", ":"), ensure_ascii=False)
     signature = hmac.new(key, payload.encode("utf-8"), hashlib.sha256).hexdigest()
@@ -80,3 +80,29 @@ def verify_and_load(raw: str, key: bytes) -> ThetaDelta:
         updates=int(data.get("updates", 0)),
         ema_reward=float(data.get("ema_reward", 0.0)),
     )
+
+
+def verify_many(
+    raws: Sequence[Any],
+    key: bytes,
+    *,
+    workers: Optional[int] = None,
+    loader: Callable[[Any, bytes], ThetaDelta] = verify_and_load,
+) -> List[Union[ThetaDelta, Exception]]:
+    """Verify signed deltas on a thread pool; failures are returned in place, not raised.
+
+    HMAC-SHA256 releases the GIL on large buffers, so signatures of big
+    deltas are checked concurrently. ``loader`` decodes one item (JSON
+    envelopes by default; see :func:`backend.federation.wire.decode_delta`).
+    """
+
+    def _verify(raw: Any) -> Union[ThetaDelta, Exception]:
+        try:
+            return loader(raw, key)
+        except Exception as error:  # noqa: BLE001 - returned to the caller per item
+            return error
+
+    if len(raws) <= 1:
+        return [_verify(raw) for raw in raws]
+    with ThreadPoolExecutor(max_workers=workers or min(8, len(raws))) as pool:
+        return list(pool.map(_verify, raws))
@@ -2,7 +2,9 @@
 
 from __future__ import annotations
 
-from typing import Iterable, List
+from typing import Iterable, List, Sequence
+
+import numpy as np
 
 from ..feedback_service.theta import ThetaState
 from .delta import ThetaDelta
@@ -53,3 +55,44 @@ def _normalize(values: List[float], weight: float) -> List[float]:
     if not values:
         return []
     return [value / weight for value in values]
+
+
+def merge_deltas_batch(state: ThetaState, deltas: Sequence[ThetaDelta]) -> ThetaState:
+    """Vectorized, order-independent counterpart of :func:`merge_deltas`.
+
+    Weighted contributions are stacked into one matrix per vector and each
+    column is sorted before summation, so the result depends only on the set
+    of deltas, not on the order in which they arrived.
+    """
+
+    if not deltas:
+        return state
+    weights = np.array([max(1.0, float(delta.updates)) for delta in deltas], dtype=np.float64)
+    total_weight = 1.0 + _ordered_sum(weights)
+    return ThetaState(
+        theta=_weighted_mean(state.theta, [delta.theta for delta in deltas], weights, total_weight),
+        pi=_weighted_mean(state.pi, [delta.pi for delta in deltas], weights, total_weight),
+        rho=_weighted_mean(state.rho, [delta.rho for delta in deltas], weights, total_weight),
+        updates=state.updates + 1,
+        ema_reward=(state.ema_reward + _ordered_sum(weights * [d.ema_reward for d in deltas])) / total_weight,
+        sigma=max(0.05, (state.sigma + _ordered_sum(weights * [d.sigma for d in deltas])) / total_weight),
+    )
+
+
+def _ordered_sum(values: np.ndarray) -> float:
+    return float(np.sort(values).sum())
+
+
+def _weighted_mean(
+    base: List[float], vectors: Sequence[List[float]], weights: np.ndarray, total_weight: float
+) -> List[float]:
+    width = max([len(base)] + [len(vector) for vector in vectors])
+    if width == 0:
+        return []
+    # Row 0 is the current state with weight 1, as in merge_deltas; short vectors are zero-padded.
+    matrix = np.zeros((len(vectors) + 1, width), dtype=np.float64)
+    matrix[0, : len(base)] = base
+    for row, vector in enumerate(vectors, start=1):
+        matrix[row, : len(vector)] = vector
+    matrix[1:] *= weights[:, None]
+    return (np.sort(matrix, axis=0).sum(axis=0) / total_weight).tolist()
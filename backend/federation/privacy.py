@@ -0,0 +1,230 @@
+"""Differential-privacy noise and budget accounting for exported Θ.
+
+Noise is drawn from NumPy's Philox generator, a counter-based PRF: a secret
+128-bit key plus a per-export counter fully determine the stream, so each
+export gets fresh, independent noise for the whole θ/π/ρ block in one
+vectorised call, and nothing about the values leaks into the noise. With a
+fixed key (``KOLIBRI_DP_SEED``) the counter is persisted and reserved before
+each draw, so a restarted process never replays noise it already released:
+two exports carrying the same noise would cancel it when subtracted.
+
+Calibration follows the standard mechanisms:
+
+* Laplace: ``b = Δ / ε`` (pure ε-DP);
+* Gaussian: ``σ = Δ · sqrt(2 ln(1.25 / δ)) / ε`` (ε, δ)-DP, ε < 1.
+
+:class:`PrivacyAccountant` sums ε and δ over exports (basic composition) and
+refuses exports past the budget; its totals survive restarts when a path is
+given.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Sequence
+
+import numpy as np
+
+MECHANISMS = ("gaussian", "laplace")
+
+
+class PrivacyBudgetExceeded(RuntimeError):
+    """Raised when an export would exceed the configured ε/δ budget."""
+
+
+@dataclass(frozen=True)
+class NoiseSpec:
+    mechanism: str
+    scale: float
+    epsilon: float = 0.0
+    delta: float = 0.0
+
+    @classmethod
+    def calibrate(
+        cls, epsilon: float, *, sensitivity: float = 1.0, delta: float = 1e-5, mechanism: str = "gaussian"
+    ) -> "NoiseSpec":
+        if epsilon <= 0.0:
+            raise ValueError("epsilon must be positive")
+        if mechanism == "laplace":
+            return cls("laplace", sensitivity / epsilon, epsilon, 0.0)
+        if mechanism == "gaussian":
+            if not 0.0 < delta < 1.0:
+                raise ValueError("delta must be in (0, 1) for the Gaussian mechanism")
+            scale = sensitivity * math.sqrt(2.0 * math.log(1.25 / delta)) / epsilon
+            return cls("gaussian", scale, epsilon, delta)
+        raise ValueError(f"unknown mechanism {mechanism!r}")
+
+
+class NoiseGenerator:
+    """Philox stream keyed by a secret; every call advances a 128-bit block counter.
+
+    With ``state_path`` the next counter is stored as JSON and written before
+    the draw that uses it, so the stream continues across restarts.
+    """
+
+    def __init__(
+        self, key: Optional[bytes] = None, *, counter: int = 0, state_path: Path | str | None = None
+    ) -> None:
+        secret = key if key is not None else os.urandom(32)
+        self._key = int.from_bytes(hashlib.blake2b(secret, digest_size=16).digest(), "little")
+        self._state_path = Path(state_path) if state_path else None
+        if self._state_path is not None and self._state_path.exists():
+            data = json.loads(self._state_path.read_text(encoding="utf-8"))
+            counter = max(counter, int(data.get("counter", 0)))
+        self._counter = counter
+        self._lock = threading.Lock()
+
+    @property
+    def counter(self) -> int:
+        return self._counter
+
+    def _next_counter(self) -> int:
+        with self._lock:
+            counter = self._counter
+            self._counter += 1
+            if self._state_path is not None:
+                # Reserve before drawing: a crash may skip a counter, never reuse one.
+                self._state_path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self._state_path.with_name(f".{self._state_path.name}.tmp")
+                with tmp_path.open("w", encoding="utf-8") as handle:
+                    json.dump({"counter": self._counter}, handle)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                os.replace(tmp_path, self._state_path)
+        # Exports are 2**64 blocks apart, so their streams never overlap.
+        return counter << 64
+
+    def sample(self, size: int, spec: NoiseSpec) -> np.ndarray:
+        generator = np.random.Generator(np.random.Philox(key=self._key, counter=self._next_counter()))
+        if spec.scale <= 0.0 or size == 0:
+            return np.zeros(size)
+        if spec.mechanism == "laplace":
+            return generator.laplace(0.0, spec.scale, size)
+        return generator.normal(0.0, spec.scale, size)
+
+    def perturb(self, vectors: Sequence[Sequence[float]], spec: NoiseSpec) -> list[list[float]]:
+        """Add noise to several vectors with one draw; returns new lists."""
+
+        sizes = [len(vector) for vector in vectors]
+        flat = np.fromiter((value for vector in vectors for value in vector), dtype=np.float64, count=sum(sizes))
+        flat += self.sample(flat.size, spec)
+        bounds = np.cumsum([0] + sizes)
+        return [flat[start:end].tolist() for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+class PrivacyAccountant:
+    """Cumulative ε/δ over exports, optionally persisted as JSON."""
+
+    def __init__(
+        self,
+        epsilon_budget: float = math.inf,
+        delta_budget: float = 1.0,
+        path: Path | str | None = None,
+    ) -> None:
+        self.epsilon_budget = epsilon_budget
+        self.delta_budget = delta_budget
+        self._path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self.epsilon_spent = 0.0
+        self.delta_spent = 0.0
+        self.exports = 0
+        if self._path is not None and self._path.exists():
+            data = json.loads(self._path.read_text(encoding="utf-8"))
+            self.epsilon_spent = float(data.get("epsilon_spent", 0.0))
+            self.delta_spent = float(data.get("delta_spent", 0.0))
+            self.exports = int(data.get("exports", 0))
+
+    def remaining(self) -> float:
+        return max(0.0, self.epsilon_budget - self.epsilon_spent)
+
+    def spend(self, spec: NoiseSpec) -> None:
+        """Charge one export; raises :class:`PrivacyBudgetExceeded` without charging if over budget."""
+
+        with self._lock:
+            epsilon = self.epsilon_spent + spec.epsilon
+            delta = self.delta_spent + spec.delta
+            if epsilon > self.epsilon_budget or delta > self.delta_budget:
+                raise PrivacyBudgetExceeded(
+                    f"privacy budget exhausted: ε {self.epsilon_spent:.4g}/{self.epsilon_budget:.4g}"
+                )
+            self.epsilon_spent, self.delta_spent = epsilon, delta
+            self.exports += 1
+            if self._path is not None:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = self._path.with_name(f".{self._path.name}.tmp")
+                tmp_path.write_text(json.dumps(self.snapshot()), encoding="utf-8")
+                os.replace(tmp_path, self._path)
+
+    def snapshot(self) -> dict[str, float]:
+        return {
+            "epsilon_spent": self.epsilon_spent,
+            "delta_spent": self.delta_spent,
+            "epsilon_budget": self.epsilon_budget,
+            "delta_budget": self.delta_budget,
+            "exports": self.exports,
+        }
+
+
+_default_generator: Optional[NoiseGenerator] = None
+
+
+def default_generator() -> NoiseGenerator:
+    """Process-wide generator keyed by ``KOLIBRI_DP_SEED`` (hex) or a random secret.
+
+    A seeded generator keeps its counter in ``KOLIBRI_DP_COUNTER_PATH``
+    (next to the accountant state by default); a random key is fresh per boot
+    and needs no state.
+    """
+
+    global _default_generator
+    if _default_generator is None:
+        seed = os.getenv("KOLIBRI_DP_SEED")
+        if seed:
+            _default_generator = NoiseGenerator(
+                bytes.fromhex(seed),
+                state_path=os.getenv("KOLIBRI_DP_COUNTER_PATH", "data/dp_noise_counter.json"),
+            )
+        else:
+            _default_generator = NoiseGenerator()
+    return _default_generator
+
+
+def spec_from_env() -> Optional[NoiseSpec]:
+    """``KOLIBRI_DP_EPSILON`` selects calibrated noise; legacy ``KOLIBRI_DP_NOISE`` is a raw Gaussian σ."""
+
+    epsilon = os.getenv("KOLIBRI_DP_EPSILON")
+    if epsilon:
+        return NoiseSpec.calibrate(
+            float(epsilon),
+            sensitivity=float(os.getenv("KOLIBRI_DP_SENSITIVITY", "1.0")),
+            delta=float(os.getenv("KOLIBRI_DP_DELTA", "1e-5")),
+            mechanism=os.getenv("KOLIBRI_DP_MECHANISM", "gaussian"),
+        )
+    scale = float(os.getenv("KOLIBRI_DP_NOISE", "0.0"))
+    return NoiseSpec("gaussian", scale) if scale > 0.0 else None
+
+
+def accountant_from_env() -> PrivacyAccountant:
+    return PrivacyAccountant(
+        float(os.getenv("KOLIBRI_DP_EPSILON_BUDGET", "inf")),
+        float(os.getenv("KOLIBRI_DP_DELTA_BUDGET", "1.0")),
+        os.getenv("KOLIBRI_DP_ACCOUNTANT_PATH", "data/dp_accountant.json") or None,
+    )
+
+
+__all__ = [
+    "MECHANISMS",
+    "NoiseGenerator",
+    "NoiseSpec",
+    "PrivacyAccountant",
+    "PrivacyBudgetExceeded",
+    "accountant_from_env",
+    "default_generator",
+    "spec_from_env",
+]
@@ -1,38 +1,201 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import os
+from typing import Any, Callable
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
 
 from ..feedback_service.theta import ThetaUpdater, get_theta_updater
-from .delta import ThetaDelta, sign_delta, verify_and_load
-from .merge import merge_deltas
+from .aggregate import PartialAggregate, aggregate, verify_aggregate
+from .delta import ThetaDelta, sign_delta, verify_and_load, verify_many
+from .merge import merge_deltas, merge_deltas_batch
+from .privacy import PrivacyAccountant, PrivacyBudgetExceeded, accountant_from_env, spec_from_env
+from .sparse import NeedFullState, PeerBaseStore, verify_payload
+from .wire import (
+    CONTENT_TYPE,
+    STREAM_CONTENT_TYPE,
+    decode_delta,
+    encode_delta,
+    is_binary,
+    negotiate_dtype,
+    split_stream,
+)
 
 router = APIRouter(prefix="/api/federation", tags=["federation"])
 
 FEDERATION_KEY = os.getenv("KOLIBRI_FEDERATION_KEY", "kolibri-federation").encode("utf-8")
 
+PEER_BASES = PeerBaseStore(int(os.getenv("KOLIBRI_FEDERATION_MAX_PEERS", "10000")))
 
-@router.post("/export")
+
+def get_peer_bases() -> PeerBaseStore:
+    return PEER_BASES
+
+
+_accountant: PrivacyAccountant | None = None
+
+
+def get_privacy_accountant() -> PrivacyAccountant:
+    global _accountant
+    if _accountant is None:
+        _accountant = accountant_from_env()
+    return _accountant
+
+
+@router.post("/export", response_model=None)
 async def export_delta(
+    request: Request,
     updater: ThetaUpdater = Depends(get_theta_updater),
-) -> dict[str, str]:
+    accountant: PrivacyAccountant = Depends(get_privacy_accountant),
+) -> dict[str, str] | Response:
+    """Export the signed state; ``Accept: application/x-kolibri-delta[; dtype=f16|q8]`` selects binary.
+
+    With ``KOLIBRI_DP_EPSILON`` set every export is charged to the privacy
+    accountant and refused with 429 once the budget is spent.
+    """
+
+    noise = spec_from_env()
+    if noise is not None and noise.epsilon > 0.0:
+        try:
+            accountant.spend(noise)
+        except PrivacyBudgetExceeded as error:
+            raise HTTPException(status_code=429, detail=str(error)) from error
     state = await updater.current_state()
-    delta = ThetaDelta.from_state(state, noise_scale=float(os.getenv("KOLIBRI_DP_NOISE", "0.0")))
+    delta = ThetaDelta.from_state(state, noise=noise)
+    dtype = negotiate_dtype(request.headers.get("accept"))
+    if dtype is not None:
+        return Response(encode_delta(delta, FEDERATION_KEY, dtype=dtype), media_type=CONTENT_TYPE)
     signed = sign_delta(delta, FEDERATION_KEY)
     return {"delta": signed}
 
 
+async def _read_single_delta(request: Request) -> ThetaDelta:
+    body = await request.body()
+    try:
+        if is_binary(request.headers.get("content-type")):
+            return decode_delta(body, FEDERATION_KEY)
+        payload = json.loads(body)
+        raw = payload.get("delta") if isinstance(payload, dict) else None
+        if not isinstance(raw, str):
+            raise HTTPException(status_code=400, detail="delta missing")
+        return verify_and_load(raw, FEDERATION_KEY)
+    except (ValueError, KeyError) as error:
+        raise HTTPException(status_code=400, detail=f"invalid delta: {error}") from error
+
+
 @router.post("/merge")
 async def merge_delta(
-    payload: dict,
+    request: Request,
     updater: ThetaUpdater = Depends(get_theta_updater),
 ) -> dict[str, str]:
-    raw = payload.get("delta")
-    if not isinstance(raw, str):
-        raise HTTPException(status_code=400, detail="delta missing")
-    delta = verify_and_load(raw, FEDERATION_KEY)
+    """Merge one signed delta, sent as a JSON envelope or in the binary wire format."""
+
+    delta = await _read_single_delta(request)
     state = await updater.current_state()
     merged = merge_deltas(state, [delta])
     await updater.persist_state(merged)
     return {"status": "ok"}
+
+
+_NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+
+async def _read_signed_deltas(request: Request) -> tuple[list, Callable[[Any, bytes], ThetaDelta]]:
+    body = await request.body()
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if is_binary(content_type, STREAM_CONTENT_TYPE):
+        try:
+            return list(split_stream(body)), decode_delta
+        except ValueError as error:
+            raise HTTPException(status_code=400, detail=str(error)) from error
+    if content_type in _NDJSON_TYPES:
+        # Each line is one signed envelope, exactly as returned by /export.
+        return [line.decode("utf-8") for line in body.splitlines() if line.strip()], verify_and_load
+    try:
+        payload = json.loads(body)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=f"invalid JSON: {error}") from error
+    raws = payload.get("deltas") if isinstance(payload, dict) else payload
+    if not isinstance(raws, list) or not all(isinstance(raw, str) for raw in raws):
+        raise HTTPException(status_code=400, detail="deltas must be a list of signed delta strings")
+    return raws, verify_and_load
+
+
+@router.post("/merge_batch")
+async def merge_delta_batch(
+    request: Request,
+    updater: ThetaUpdater = Depends(get_theta_updater),
+) -> dict[str, object]:
+    """Verify many signed deltas in parallel, merge them in one step and persist once.
+
+    The body is a JSON list, NDJSON of envelopes, or a binary stream of
+    length-prefixed wire-format deltas.
+    """
+
+    raws, loader = await _read_signed_deltas(request)
+    limit = int(os.getenv("KOLIBRI_FEDERATION_MAX_BATCH", "1000"))
+    if len(raws) > limit:
+        raise HTTPException(status_code=413, detail=f"at most {limit} deltas per request")
+    results = await asyncio.to_thread(verify_many, raws, FEDERATION_KEY, loader=loader)
+    deltas = [result for result in results if isinstance(result, ThetaDelta)]
+    rejected = [
+        {"index": index, "error": str(result) or type(result).__name__}
+        for index, result in enumerate(results)
+        if not isinstance(result, ThetaDelta)
+    ]
+    if deltas:
+        state = await updater.current_state()
+        merged = await asyncio.to_thread(merge_deltas_batch, state, deltas)
+        await updater.persist_state(merged)
+    return {"status": "ok", "merged": len(deltas), "rejected": rejected}
+
+
+@router.post("/merge_aggregates")
+async def merge_aggregates(
+    payload: dict,
+    updater: ThetaUpdater = Depends(get_theta_updater),
+) -> dict[str, object]:
+    """Root of a tree merge: apply signed partial aggregates from intermediate nodes."""
+
+    raws = payload.get("aggregates")
+    if not isinstance(raws, list) or not all(isinstance(raw, str) for raw in raws):
+        raise HTTPException(status_code=400, detail="aggregates must be a list of signed aggregate strings")
+    try:
+        parts = await asyncio.to_thread(lambda: [verify_aggregate(raw, FEDERATION_KEY) for raw in raws])
+    except (ValueError, KeyError) as error:
+        raise HTTPException(status_code=400, detail=f"invalid aggregate: {error}") from error
+    combined: PartialAggregate = aggregate(parts)
+    if combined.weight:
+        state = await updater.current_state()
+        await updater.persist_state(combined.apply_to(state))
+    return {"status": "ok", "nodes": combined.nodes, "weight": combined.weight}
+
+
+@router.post("/merge_sparse", response_model=None)
+async def merge_sparse_delta(
+    payload: dict,
+    updater: ThetaUpdater = Depends(get_theta_updater),
+    bases: PeerBaseStore = Depends(get_peer_bases),
+) -> dict[str, object] | JSONResponse:
+    """Merge a sparse delta against the sender's acknowledged base, or a full state.
+
+    Answers 409 ``{"need_full": true}`` when the base is unknown; the returned
+    ``version`` is the base the sender should use next time.
+    """
+
+    raw = payload.get("delta")
+    if not isinstance(raw, str):
+        raise HTTPException(status_code=400, detail="delta missing")
+    try:
+        body = verify_payload(raw, FEDERATION_KEY)
+        delta = bases.apply(body)
+    except NeedFullState as missing:
+        return JSONResponse(status_code=409, content={"need_full": True, "have": missing.have})
+    except (ValueError, KeyError, TypeError) as error:
+        raise HTTPException(status_code=400, detail=f"invalid delta: {error}") from error
+    state = await updater.current_state()
+    await updater.persist_state(merge_deltas(state, [delta]))
+    return {"status": "ok", "version": body["version"]}
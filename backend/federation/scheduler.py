@@ -0,0 +1,281 @@
+"""Background push of local Θ to federation peers.
+
+Every ``interval`` seconds the scheduler takes one snapshot of the local state
+and pushes it to all peers through a single pooled ``httpx.AsyncClient``, at
+most ``concurrency`` at a time. Feedback is applied to θ by the feedback
+service, usually in another process, so every ``watch`` seconds the scheduler
+asks its updater to reload θ from the shared snapshot and WAL and starts a
+round early when they changed; :meth:`FederationSyncScheduler.notify` does the
+same for an updater that applies feedback in this process. Early rounds are
+coalesced: one starts no sooner than ``coalesce`` seconds after the previous
+round, so a burst of updates is pushed once. Peers whose acknowledged version equals the local state are
+skipped; a peer that received a lossy sparse delta stays due until the
+residual has been sent. Failing peers are retried with per-peer exponential backoff and jitter.
+
+Deltas go to ``/api/federation/merge_sparse`` as sparse quantised diffs
+against the version the peer acknowledged; a 409 triggers a full state.
+With DP noise enabled each round draws one noisy export for all due peers and
+charges it to the privacy accountant; a peer counts as current once it has
+received the present local state.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+import os
+import random
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from ..feedback_service.theta import ThetaUpdater
+from .delta import ThetaDelta
+from .privacy import NoiseSpec, PrivacyAccountant, accountant_from_env, spec_from_env
+from .sparse import SparseDeltaEncoder, sign_payload, state_version
+
+logger = logging.getLogger(__name__)
+
+
+def _load_httpx() -> Any:
+    """Load httpx lazily so that the federation router works without it."""
+
+    return importlib.import_module("httpx")
+
+
+@dataclass
+class PeerStatus:
+    url: str
+    encoder: SparseDeltaEncoder
+    acked_version: Optional[str] = None
+    pushed_state: Optional[str] = None
+    failures: int = 0
+    next_attempt: float = 0.0
+    pushes: int = 0
+    full_pushes: int = 0
+    last_error: Optional[str] = None
+    last_latency: Optional[float] = field(default=None)
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "acked_version": self.acked_version,
+            "failures": self.failures,
+            "pushes": self.pushes,
+            "full_pushes": self.full_pushes,
+            "last_error": self.last_error,
+            "last_latency": self.last_latency,
+        }
+
+
+class FederationSyncScheduler:
+    def __init__(
+        self,
+        updater: ThetaUpdater,
+        peers: Sequence[str],
+        *,
+        key: bytes,
+        node_id: str,
+        interval: float = 30.0,
+        coalesce: float = 1.0,
+        watch: float = 1.0,
+        concurrency: int = 8,
+        timeout: float = 10.0,
+        backoff_base: float = 1.0,
+        backoff_max: float = 300.0,
+        density: float = 0.1,
+        noise: Optional[NoiseSpec] = None,
+        accountant: Optional[PrivacyAccountant] = None,
+        client: Any = None,
+    ) -> None:
+        self._updater = updater
+        self._key = key
+        self._node_id = node_id
+        self._interval = interval
+        self._coalesce = max(0.0, coalesce)
+        self._watch = max(0.0, watch)
+        self._concurrency = max(1, concurrency)
+        self._timeout = timeout
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._noise = noise if noise is not None and noise.scale > 0.0 else None
+        self._accountant = accountant
+        self._peers = {
+            url.rstrip("/"): PeerStatus(url.rstrip("/"), SparseDeltaEncoder(node_id, density=density, history=4))
+            for url in peers
+        }
+        self._client = client
+        self._owns_client = client is None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self.rounds = 0
+
+    def _ensure_client(self) -> Any:
+        if self._client is None:
+            httpx = _load_httpx()
+            self._client = httpx.AsyncClient(
+                timeout=self._timeout,
+                limits=httpx.Limits(
+                    max_connections=self._concurrency, max_keepalive_connections=self._concurrency
+                ),
+            )
+        return self._client
+
+    def notify(self) -> None:
+        """Ask for a sync soon; several calls before the next round collapse into one."""
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._owns_client and self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await self.sync_once()
+            except Exception as error:  # pragma: no cover - defensive
+                logger.exception("Federation sync round failed: %s", error)
+            finished = loop.time()
+            if await self._wait_for_change(finished + self._interval):
+                # Let further updates pile up; they all go out in the next round.
+                delay = finished + self._coalesce - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self._wakeup.clear()
+
+    async def _wait_for_change(self, deadline: float) -> bool:
+        """Wait for :meth:`notify` or a θ change on disk; ``False`` once ``deadline`` passes."""
+
+        assert self._wakeup is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            timeout = min(remaining, self._watch) if self._watch > 0 else remaining
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                return True
+            if self._watch > 0 and await self._reload():
+                return True
+
+    async def _reload(self) -> bool:
+        try:
+            return await self._updater.reload_if_changed()
+        except Exception as error:
+            logger.warning("Could not reload θ from disk: %s", error)
+            return False
+
+    async def sync_once(self) -> Dict[str, str]:
+        """Push the current state to every due peer; returns ``{url: outcome}``."""
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        await self._reload()
+        state = await self._updater.current_state()
+        clean = ThetaDelta.from_state(state)
+        local_version = state_version(clean)
+        now = time.monotonic()
+        due: List[PeerStatus] = []
+        outcomes: Dict[str, str] = {}
+        for peer in self._peers.values():
+            # With DP noise the peer's copy never equals ours; re-sending the same state only spends budget.
+            if peer.acked_version == local_version or (self._noise and peer.pushed_state == local_version):
+                outcomes[peer.url] = "current"
+            elif peer.next_attempt > now:
+                outcomes[peer.url] = "backoff"
+            else:
+                due.append(peer)
+        delta = clean
+        if due and self._noise is not None:
+            if self._accountant is not None and self._noise.epsilon > 0.0:
+                self._accountant.spend(self._noise)
+            delta = ThetaDelta.from_state(state, noise=self._noise)
+        results = await asyncio.gather(*(self._push(peer, delta, local_version) for peer in due))
+        outcomes.update(zip((peer.url for peer in due), results))
+        self.rounds += 1
+        return outcomes
+
+    async def _push(self, peer: PeerStatus, delta: ThetaDelta, local_version: str) -> str:
+        assert self._semaphore is not None
+        client = self._ensure_client()
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                payload = peer.encoder.encode(delta, peer.acked_version)
+                response = await self._post(client, peer, payload)
+                if response.status_code == 409:
+                    payload = peer.encoder.full(delta)
+                    response = await self._post(client, peer, payload)
+                response.raise_for_status()
+                peer.acked_version = response.json()["version"]
+            except Exception as error:
+                peer.failures += 1
+                delay = min(self._backoff_max, self._backoff_base * 2 ** (peer.failures - 1))
+                peer.next_attempt = time.monotonic() + delay * random.uniform(0.8, 1.2)
+                peer.last_error = f"{type(error).__name__}: {error}"
+                logger.warning("Federation push to %s failed (%d in a row): %s", peer.url, peer.failures, error)
+                return "failed"
+            peer.failures = 0
+            peer.pushed_state = local_version
+            peer.next_attempt = 0.0
+            peer.last_error = None
+            peer.last_latency = time.monotonic() - started
+            return "pushed"
+
+    async def _post(self, client: Any, peer: PeerStatus, payload: Dict[str, Any]) -> Any:
+        peer.pushes += 1
+        if payload["kind"] == "full":
+            peer.full_pushes += 1
+        signed = sign_payload(payload, self._key)
+        return await client.post(f"{peer.url}/api/federation/merge_sparse", json={"delta": signed})
+
+    def snapshot(self) -> Dict[str, object]:
+        return {"rounds": self.rounds, "peers": {url: peer.snapshot() for url, peer in self._peers.items()}}
+
+
+def scheduler_from_env(updater: ThetaUpdater, key: bytes) -> Optional[FederationSyncScheduler]:
+    """Build a scheduler from ``KOLIBRI_FEDERATION_PEERS`` (comma-separated base URLs), if set."""
+
+    peers = [url.strip() for url in os.getenv("KOLIBRI_FEDERATION_PEERS", "").split(",") if url.strip()]
+    if not peers:
+        return None
+    return FederationSyncScheduler(
+        updater,
+        peers,
+        key=key,
+        node_id=os.getenv("KOLIBRI_FEDERATION_NODE_ID", socket.gethostname()),
+        interval=float(os.getenv("KOLIBRI_FEDERATION_SYNC_INTERVAL", "30")),
+        coalesce=float(os.getenv("KOLIBRI_FEDERATION_SYNC_COALESCE", "1")),
+        watch=float(os.getenv("KOLIBRI_FEDERATION_WATCH_INTERVAL", "1")),
+        concurrency=int(os.getenv("KOLIBRI_FEDERATION_CONCURRENCY", "8")),
+        timeout=float(os.getenv("KOLIBRI_FEDERATION_TIMEOUT", "10")),
+        density=float(os.getenv("KOLIBRI_FEDERATION_DENSITY", "0.1")),
+        noise=spec_from_env(),
+        accountant=accountant_from_env(),
+    )
+
+
+__all__ = ["FederationSyncScheduler", "PeerStatus", "scheduler_from_env"]
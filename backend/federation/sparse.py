@@ -0,0 +1,216 @@
+"""Sparse, quantised Θ deltas against a base version acknowledged by the receiver.
+
+The sender keeps the *reference*: the receiver's reconstruction of the sender's
+state at each version it produced. A delta is ``current − reference[base]``,
+cut to the ``top-k`` coordinates by magnitude and quantised to int8 with one
+scale per vector. The new reference is the old one plus exactly what was sent,
+so everything dropped by top-k or lost to quantisation stays in the next
+difference (error feedback) instead of being forgotten. Once the remaining
+difference fits into the top-k budget it is sent as exact values, and the
+receiver's copy becomes identical to the sender's state.
+
+Versions are hashes of the reconstructed vectors, so sender and receiver agree
+on them bit for bit. A receiver that does not hold the base (restart, lost
+message) answers "need full", and the sender falls back to a full state.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import math
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from .delta import ThetaDelta
+
+_VECTORS = ("theta", "pi", "rho")
+
+
+class NeedFullState(LookupError):
+    """The receiver does not hold the base version a sparse delta refers to."""
+
+    def __init__(self, node_id: str, have: Optional[str]) -> None:
+        super().__init__(f"no base for {node_id}")
+        self.node_id = node_id
+        self.have = have
+
+
+@dataclass(frozen=True)
+class _Reference:
+    theta: Tuple[float, ...]
+    pi: Tuple[float, ...]
+    rho: Tuple[float, ...]
+
+    @classmethod
+    def of(cls, delta: ThetaDelta) -> "_Reference":
+        return cls(tuple(delta.theta), tuple(delta.pi), tuple(delta.rho))
+
+    def vector(self, name: str) -> Tuple[float, ...]:
+        return getattr(self, name)
+
+    def lengths(self) -> List[int]:
+        return [len(self.theta), len(self.pi), len(self.rho)]
+
+
+def state_version(reference: _Reference | ThetaDelta) -> str:
+    digest = hashlib.sha256()
+    for name in _VECTORS:
+        values = getattr(reference, name)
+        digest.update(len(values).to_bytes(4, "little"))
+        digest.update(array("d", values).tobytes())
+    return digest.hexdigest()[:32]
+
+
+def _sparsify(old: Tuple[float, ...], new: Tuple[float, ...], k: int) -> Dict[str, Any]:
+    diff = [after - before for before, after in zip(old, new)]
+    changed = [index for index, value in enumerate(diff) if value != 0.0]
+    if len(changed) <= k:
+        # Everything left fits into the budget: send exact values so both sides converge bit for bit.
+        return {"indices": changed, "set": [new[index] for index in changed]}
+    order = sorted(changed, key=lambda index: abs(diff[index]), reverse=True)
+    indices = sorted(order[:k])
+    peak = max(abs(diff[index]) for index in indices)
+    scale = peak / 127.0
+    values = [int(math.floor(diff[index] / scale + 0.5)) for index in indices]
+    return {"indices": indices, "scale": scale, "values": values}
+
+
+def _apply_sparse(base: Tuple[float, ...], part: Dict[str, Any]) -> Tuple[float, ...]:
+    result = list(base)
+    if "set" in part:
+        for index, value in zip(part["indices"], part["set"]):
+            result[int(index)] = float(value)
+        return tuple(result)
+    scale = float(part["scale"])
+    for index, value in zip(part["indices"], part["values"]):
+        result[int(index)] += int(value) * scale
+    return tuple(result)
+
+
+def _scalars(delta: ThetaDelta) -> Dict[str, Any]:
+    return {"sigma": delta.sigma, "updates": delta.updates, "ema_reward": delta.ema_reward}
+
+
+class SparseDeltaEncoder:
+    """Sender side: remembers the last few references it produced, keyed by version."""
+
+    def __init__(self, node_id: str, *, density: float = 0.1, history: int = 8) -> None:
+        self.node_id = node_id
+        self._density = density
+        self._history: "OrderedDict[str, _Reference]" = OrderedDict()
+        self._limit = max(1, history)
+
+    def _remember(self, version: str, reference: _Reference) -> None:
+        self._history[version] = reference
+        self._history.move_to_end(version)
+        while len(self._history) > self._limit:
+            self._history.popitem(last=False)
+
+    def full(self, current: ThetaDelta) -> Dict[str, Any]:
+        reference = _Reference.of(current)
+        version = state_version(reference)
+        self._remember(version, reference)
+        payload = {"kind": "full", "node_id": self.node_id, "version": version, **_scalars(current)}
+        payload.update({name: list(reference.vector(name)) for name in _VECTORS})
+        return payload
+
+    def encode(self, current: ThetaDelta, base_version: Optional[str]) -> Dict[str, Any]:
+        """Sparse delta against ``base_version`` if it is known and compatible, else the full state."""
+
+        base = self._history.get(base_version) if base_version else None
+        target = _Reference.of(current)
+        if base is None or base.lengths() != target.lengths():
+            return self.full(current)
+        parts: Dict[str, Any] = {}
+        reconstructed = {}
+        for name in _VECTORS:
+            old, new = base.vector(name), target.vector(name)
+            k = max(1, math.ceil(self._density * len(new))) if new else 0
+            parts[name] = _sparsify(old, new, k)
+            reconstructed[name] = _apply_sparse(old, parts[name])
+        reference = _Reference(**reconstructed)
+        version = state_version(reference)
+        self._remember(version, reference)
+        return {
+            "kind": "sparse",
+            "node_id": self.node_id,
+            "base_version": base_version,
+            "version": version,
+            "vectors": parts,
+            **_scalars(current),
+        }
+
+
+class PeerBaseStore:
+    """Receiver side: the last reconstructed state of each peer."""
+
+    def __init__(self, max_peers: int = 10_000) -> None:
+        self._bases: "OrderedDict[str, Tuple[str, _Reference]]" = OrderedDict()
+        self._max_peers = max(1, max_peers)
+
+    def version_of(self, node_id: str) -> Optional[str]:
+        entry = self._bases.get(node_id)
+        return entry[0] if entry else None
+
+    def apply(self, payload: Dict[str, Any]) -> ThetaDelta:
+        """Reconstruct the sender's full delta from ``payload`` and remember it as the new base."""
+
+        node_id = str(payload["node_id"])
+        if payload.get("kind") == "full":
+            reference = _Reference(*(tuple(float(value) for value in payload[name]) for name in _VECTORS))
+        elif payload.get("kind") == "sparse":
+            entry = self._bases.get(node_id)
+            if entry is None or entry[0] != payload.get("base_version"):
+                raise NeedFullState(node_id, entry[0] if entry else None)
+            base = entry[1]
+            reference = _Reference(
+                *(_apply_sparse(base.vector(name), payload["vectors"][name]) for name in _VECTORS)
+            )
+        else:
+            raise ValueError(f"unknown delta kind {payload.get('kind')!r}")
+        version = state_version(reference)
+        if version != payload.get("version"):
+            # A mismatch means the two sides diverged; ask for the full state instead of guessing.
+            self._bases.pop(node_id, None)
+            raise NeedFullState(node_id, None)
+        self._bases[node_id] = (version, reference)
+        self._bases.move_to_end(node_id)
+        while len(self._bases) > self._max_peers:
+            self._bases.popitem(last=False)
+        return ThetaDelta(
+            theta=list(reference.theta),
+            pi=list(reference.pi),
+            rho=list(reference.rho),
+            sigma=float(payload["sigma"]),
+            updates=int(payload["updates"]),
+            ema_reward=float(payload["ema_reward"]),
+        )
+
+
+def sign_payload(payload: Dict[str, Any], key: bytes) -> str:
+    body = json.dumps(payload, separators=(",", ":"))
+    signature = hmac.new(key, body.encode("utf-8"), hashlib.sha256).hexdigest()
+    return json.dumps({"payload": body, "signature": signature})
+
+
+def verify_payload(raw: str, key: bytes) -> Dict[str, Any]:
+    parsed = json.loads(raw)
+    body = parsed["payload"]
+    expected = hmac.new(key, body.encode("utf-8"), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(parsed["signature"], expected):
+        raise ValueError("signature mismatch")
+    return json.loads(body)
+
+
+__all__ = [
+    "NeedFullState",
+    "PeerBaseStore",
+    "SparseDeltaEncoder",
+    "sign_payload",
+    "state_version",
+    "verify_payload",
+]
@@ -0,0 +1,332 @@
+"""Групповая запись отзывов в хранилище.
+
+:class:`BufferedRecordWriter` копит записи от параллельных запросов и сбрасывает
+их одной пачкой каждые ``max_batch`` записей или ``flush_interval`` секунд.
+Каждый вызывающий ждёт, пока его запись станет долговечной: попала в базу или,
+если база недоступна, в локальный файл-спилл (JSONL с fsync). Содержимое спилла
+досылается в базу после первого успешного сброса. Число ожидающих записей
+ограничено ``max_pending`` — при переполнении :meth:`submit` ждёт свободного места.
+
+Ошибки сброса делятся функцией ``is_transient`` на временные (сеть, таймаут,
+перезапуск базы) и постоянные (нарушение ограничения, некорректная строка).
+Временный сбой повторяется до ``retries`` раз с экспоненциальной паузой, прежде
+чем пачка уйдёт в спилл. При постоянной ошибке пачка делится пополам, пока
+отвергнутые записи не будут найдены поодиночке: остальные записываются, а
+отвергнутые уходят в dead-letter файл, и их отправители получают ошибку. Так
+же досылается спилл: одна «ядовитая» запись его больше не блокирует.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from .metrics import Histogram
+from .schemas import FeedbackRecord
+
+logger = logging.getLogger(__name__)
+
+_BATCH_SIZE_BOUNDS = (1, 8, 32, 128, 512, 2048, 8192)
+_LATENCY_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+FlushCallback = Callable[[List[FeedbackRecord]], Awaitable[None]]
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Сетевые сбои и таймауты временны; остальные ошибки считаются свойством записей."""
+
+    return isinstance(error, (OSError, asyncio.TimeoutError))
+
+
+class BufferedRecordWriter:
+    """Накопитель записей с групповым сбросом, ограничением очереди и спиллом."""
+
+    def __init__(
+        self,
+        flush: FlushCallback,
+        *,
+        max_batch: int = 500,
+        flush_interval: float = 0.01,
+        max_pending: int = 10_000,
+        spill_path: Path | str | None = None,
+        replay_interval: float = 5.0,
+        retries: int = 0,
+        retry_backoff: float = 0.05,
+        is_transient: Callable[[BaseException], bool] = is_transient_error,
+        dead_letter_path: Path | str | None = None,
+    ) -> None:
+        self._flush_batch = flush
+        self._max_batch = max(1, max_batch)
+        self._flush_interval = max(0.0, flush_interval)
+        self._max_pending = max(self._max_batch, max_pending)
+        self._spill_path = Path(spill_path) if spill_path else None
+        self._replay_interval = replay_interval
+        self._retries = max(0, retries)
+        self._retry_backoff = max(0.0, retry_backoff)
+        self._is_transient = is_transient
+        self._dead_letter_path = Path(dead_letter_path) if dead_letter_path else None
+        self._pending: List[Tuple[FeedbackRecord, asyncio.Future[None]]] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._idle: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task[None]] = None
+        self._force = False
+        self._closing = False
+        self._last_replay = 0.0
+        self.batches = 0
+        self.records = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.retried = 0
+        self.rejected = 0
+        self.batch_size = Histogram(_BATCH_SIZE_BOUNDS)
+        self.flush_latency = Histogram(_LATENCY_BOUNDS)
+
+    @property
+    def spill_path(self) -> Optional[Path]:
+        return self._spill_path
+
+    @property
+    def dead_letter_path(self) -> Optional[Path]:
+        return self._dead_letter_path
+
+    async def submit(self, record: FeedbackRecord) -> None:
+        """Ставит запись в очередь и ждёт, пока она будет записана или сохранена в спилл."""
+
+        self._ensure_worker()
+        assert self._slots is not None and self._wakeup is not None and self._idle is not None
+        await self._slots.acquire()
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self._pending.append((record, future))
+        self._idle.clear()
+        if len(self._pending) == 1 or len(self._pending) >= self._max_batch:
+            self._wakeup.set()
+        # Отмена запроса не должна отменять запись, уже поставленную в пачку.
+        await asyncio.shield(future)
+
+    async def flush(self) -> None:
+        """Сбрасывает накопленное немедленно и ждёт завершения записи."""
+
+        if self._worker is None or self._idle is None or self._wakeup is None:
+            return
+        if not self._pending and self._idle.is_set():
+            return
+        self._force = True
+        self._wakeup.set()
+        await self._idle.wait()
+
+    async def close(self) -> None:
+        """Дописывает очередь и пытается дослать спилл перед остановкой."""
+
+        if self._worker is not None and self._wakeup is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._worker
+            self._worker = None
+            self._closing = False
+        await self.replay_spill()
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "pending": len(self._pending),
+            "batches": self.batches,
+            "records": self.records,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "batch_size": self.batch_size.snapshot(),
+            "flush_latency_seconds": self.flush_latency.snapshot(),
+        }
+
+    async def replay_spill(self) -> int:
+        """Досылает записи из спилла; возвращает число дошедших до хранилища записей.
+
+        Отвергнутые хранилищем записи уходят в dead-letter файл, а при временном
+        сбое в спилле остаётся только недосланный хвост.
+        """
+
+        if self._spill_path is None or not self._spill_path.exists():
+            return 0
+        self._last_replay = time.monotonic()
+        records = await asyncio.to_thread(self._read_spill)
+        unwritten, error, rejected = await self._store(records)
+        if error is not None:
+            logger.warning("Спилл отзывов пока не удаётся дослать: %s", error)
+        await asyncio.to_thread(self._rewrite_spill, unwritten)
+        written = len(records) - len(unwritten) - len(rejected)
+        self.replayed += written
+        return written
+
+    def _ensure_worker(self) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._max_pending)
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None and self._idle is not None
+        while True:
+            if not self._pending:
+                self._force = False
+                self._idle.set()
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            if len(self._pending) < self._max_batch and not (self._force or self._closing):
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._pending[: self._max_batch]
+            del self._pending[: self._max_batch]
+            await self._write(batch)
+
+    async def _write(self, batch: List[Tuple[FeedbackRecord, asyncio.Future[None]]]) -> None:
+        records = [record for record, _ in batch]
+        unwritten, error, rejected = await self._store(records)
+        stored = len(records) - len(unwritten) - len(rejected)
+        if stored:
+            self.batches += 1
+            self.records += stored
+        if unwritten and error is not None and self._spill_path is not None:
+            try:
+                await asyncio.to_thread(self._append_spill, unwritten)
+                logger.warning("Хранилище недоступно (%s); %d отзывов сохранены в спилл", error, len(unwritten))
+                self.spilled += len(unwritten)
+                error = None
+            except Exception as spill_error:  # pragma: no cover - диск недоступен
+                logger.error("Не удалось сохранить отзывы в спилл: %s", spill_error)
+        failed = {record.id for record in unwritten} if error is not None else set()
+        for record, future in batch:
+            if not future.done():
+                if record.id in rejected:
+                    future.set_exception(rejected[record.id])
+                elif record.id in failed:
+                    assert error is not None
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+            if self._slots is not None:
+                self._slots.release()
+        if stored and time.monotonic() - self._last_replay >= self._replay_interval:
+            await self.replay_spill()
+
+    async def _store(
+        self, records: List[FeedbackRecord]
+    ) -> Tuple[List[FeedbackRecord], Optional[BaseException], Dict[UUID, BaseException]]:
+        """Пишет записи пачками по ``max_batch``, изолируя отвергнутые делением пополам.
+
+        Возвращает незаписанный из-за временного сбоя остаток (в исходном
+        порядке), саму временную ошибку и отвергнутые записи с их ошибками.
+        """
+
+        rejected: Dict[UUID, BaseException] = {}
+        chunks = [records[start : start + self._max_batch] for start in range(0, len(records), self._max_batch)]
+        chunks.reverse()
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                await self._flush_with_retries(chunk)
+            except Exception as error:
+                if self._is_transient(error):
+                    return chunk + [record for pending in reversed(chunks) for record in pending], error, rejected
+                if len(chunk) > 1:
+                    middle = len(chunk) // 2
+                    chunks.extend((chunk[middle:], chunk[:middle]))
+                    continue
+                rejected[chunk[0].id] = error
+                self.rejected += 1
+                await self._reject(chunk[0], error)
+        return [], None, rejected
+
+    async def _reject(self, record: FeedbackRecord, error: BaseException) -> None:
+        logger.error("Хранилище отвергло отзыв %s: %s", record.id, error)
+        if self._dead_letter_path is None:
+            return
+        try:
+            await asyncio.to_thread(self._append_dead_letter, record, repr(error))
+        except Exception as dead_letter_error:  # pragma: no cover - диск недоступен
+            logger.error("Не удалось записать отзыв %s в dead-letter файл: %s", record.id, dead_letter_error)
+
+    async def _flush_with_retries(self, records: List[FeedbackRecord]) -> None:
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                await self._flush_batch(records)
+            except Exception as error:
+                if attempt >= self._retries or not self._is_transient(error):
+                    raise
+                delay = self._retry_backoff * (2**attempt)
+                attempt += 1
+                self.retried += 1
+                logger.debug("Повтор сброса пачки из %d записей через %.3fs: %s", len(records), delay, error)
+                await asyncio.sleep(delay)
+                continue
+            self.flush_latency.observe(time.perf_counter() - started)
+            self.batch_size.observe(len(records))
+            return
+
+    def _append_spill(self, records: List[FeedbackRecord]) -> None:
+        assert self._spill_path is not None
+        self._spill_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = "".join(json.dumps(record.to_json(), ensure_ascii=False) + "\n" for record in records)
+        with self._spill_path.open("a", encoding="utf-8") as handle:
+            handle.write(payload)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _append_dead_letter(self, record: FeedbackRecord, error: str) -> None:
+        assert self._dead_letter_path is not None
+        self._dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+        line = json.dumps({"error": error, "record": record.to_json()}, ensure_ascii=False) + "\n"
+        with self._dead_letter_path.open("a", encoding="utf-8") as handle:
+            handle.write(line)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _read_spill(self) -> List[FeedbackRecord]:
+        assert self._spill_path is not None
+        records: List[FeedbackRecord] = []
+        try:
+            with self._spill_path.open("r", encoding="utf-8") as handle:
+                for line in handle:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        records.append(FeedbackRecord.from_json(json.loads(line)))
+                    except (ValueError, KeyError) as error:
+                        logger.warning("Пропускаем повреждённую строку спилла: %s", error)
+        except FileNotFoundError:
+            return []
+        return records
+
+    def _rewrite_spill(self, records: List[FeedbackRecord]) -> None:
+        assert self._spill_path is not None
+        if not records:
+            self._spill_path.unlink(missing_ok=True)
+            return
+        tmp_path = self._spill_path.with_name(f".{self._spill_path.name}.tmp")
+        with tmp_path.open("w", encoding="utf-8") as handle:
+            for record in records:
+                handle.write(json.dumps(record.to_json(), ensure_ascii=False) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(tmp_path, self._spill_path)
+
+
+__all__ = ["BufferedRecordWriter", "is_transient_error"]
@@ -2,11 +2,15 @@ from __future__ import annotations
 
 import asyncio
 import importlib
+import inspect
 import os
+import sys
+from pathlib import Path
 from typing import Any, AsyncIterator, Optional, Protocol
 from urllib.parse import urlparse
 from uuid import uuid4
 
+from .buffered_writer import BufferedRecordWriter, is_transient_error
 from .schemas import FeedbackPayload, FeedbackRecord
 
 
@@ -22,6 +26,11 @@ class FeedbackStorage(Protocol):
 
         ...
 
+    async def save_records(self, records: list[FeedbackRecord]) -> None:
+        """Persist records that already carry an identifier (used by the feedback pipeline)."""
+
+        ...
+
     async def close(self) -> None:
         """Release all resources allocated by the storage implementation."""
 
@@ -40,13 +49,117 @@ def _load_clickhouse_connect() -> Any:
     return importlib.import_module("clickhouse_connect")
 
 
-class PostgresFeedbackStorage:
-    """Persist feedback in a PostgreSQL database using asyncpg."""
+_FEEDBACK_COLUMNS = (
+    "id",
+    "conversation_id",
+    "message_id",
+    "rating",
+    "assistant_message",
+    "user_message",
+    "comment",
+    "mode",
+    "created_at",
+)
+
+
+_COLUMN_LIST = ", ".join(_FEEDBACK_COLUMNS)
+
+# Records are redelivered at least once (spill replay, pipeline retries), so every
+# PostgreSQL write skips rows whose id is already stored.
+_PG_STAGING_TABLE = "feedback_staging"
+_PG_CREATE_STAGING = (
+    f"CREATE TEMP TABLE IF NOT EXISTS {_PG_STAGING_TABLE} (LIKE feedback INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+)
+_PG_MERGE_STAGING = (
+    f"INSERT INTO feedback ({_COLUMN_LIST}) SELECT {_COLUMN_LIST} FROM {_PG_STAGING_TABLE} "
+    "ON CONFLICT (id) DO NOTHING"
+)
+_PG_INSERT = (
+    f"INSERT INTO feedback ({_COLUMN_LIST}) VALUES ({', '.join(f'${idx}' for idx in range(1, 10))}) "
+    "ON CONFLICT (id) DO NOTHING"
+)
+
+# SQLSTATE classes worth retrying: connection exceptions, transaction rollback
+# (deadlocks, serialization failures), insufficient resources, operator
+# intervention (admin shutdown) and system errors.
+_PG_TRANSIENT_SQLSTATE_CLASSES = frozenset({"08", "40", "53", "57", "58"})
+
+
+def _is_transient_postgres(error: BaseException) -> bool:
+    sqlstate = getattr(error, "sqlstate", None)
+    if isinstance(sqlstate, str) and sqlstate:
+        return sqlstate[:2] in _PG_TRANSIENT_SQLSTATE_CLASSES
+    return isinstance(error, FeedbackStorageError) or is_transient_error(error)
+
+
+def _is_transient_clickhouse(error: BaseException) -> bool:
+    if isinstance(error, FeedbackStorageError) or is_transient_error(error):
+        return True
+    exceptions = sys.modules.get("clickhouse_connect.driver.exceptions")
+    operational = getattr(exceptions, "OperationalError", None)
+    return operational is not None and isinstance(error, operational)
+
+
+def _record_row(record: FeedbackRecord) -> tuple[Any, ...]:
+    return (
+        record.id,
+        record.conversation_id,
+        record.message_id,
+        record.rating.value,
+        record.assistant_message,
+        record.user_message,
+        record.comment,
+        record.mode,
+        record.created_at,
+    )
+
 
-    def __init__(self, dsn: str) -> None:
+class PostgresFeedbackStorage:
+    """Persist feedback in a PostgreSQL database using asyncpg.
+
+    Records from concurrent requests are group-committed by a
+    :class:`BufferedRecordWriter`: one ``COPY`` (or ``executemany`` when
+    ``use_copy`` is disabled, e.g. behind a statement-level pooler) per batch.
+    ``save_feedback`` still returns only after its record is durable — stored in
+    PostgreSQL or, while the database is unavailable, in the local spill file.
+
+    Writes are idempotent: ``COPY`` goes into a per-connection temporary staging
+    table that is merged with ``INSERT … ON CONFLICT (id) DO NOTHING``, so a
+    replayed or redelivered record never fails the batch on its primary key.
+    Rows the database rejects for good (constraint or data errors) are isolated
+    by the writer and moved to ``dead_letter_path``.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        *,
+        batch_size: int = 500,
+        flush_interval: float = 0.01,
+        max_pending: int = 10_000,
+        spill_path: Path | str | None = None,
+        dead_letter_path: Path | str | None = None,
+        use_copy: bool = True,
+        retries: int = 0,
+    ) -> None:
         self._dsn = dsn
         self._pool: Any = None
         self._lock = asyncio.Lock()
+        self._use_copy = use_copy
+        self._writer = BufferedRecordWriter(
+            self._insert_batch,
+            max_batch=batch_size,
+            flush_interval=flush_interval,
+            max_pending=max_pending,
+            spill_path=spill_path,
+            retries=retries,
+            is_transient=_is_transient_postgres,
+            dead_letter_path=dead_letter_path,
+        )
+
+    @property
+    def writer(self) -> BufferedRecordWriter:
+        return self._writer
 
     async def _ensure_pool(self) -> Any:
         if self._pool is None:
@@ -59,56 +172,87 @@ class PostgresFeedbackStorage:
                         raise FeedbackStorageError("Не удалось подключиться к PostgreSQL.") from exc
         return self._pool
 
-    async def save_feedback(self, payload: FeedbackPayload) -> FeedbackRecord:
+    async def _insert_batch(self, records: list[FeedbackRecord]) -> None:
         pool = await self._ensure_pool()
+        rows = [_record_row(record) for record in records]
+        async with pool.acquire() as connection:
+            async with connection.transaction():
+                if self._use_copy:
+                    await connection.execute(_PG_CREATE_STAGING)
+                    await connection.copy_records_to_table(_PG_STAGING_TABLE, records=rows, columns=_FEEDBACK_COLUMNS)
+                    await connection.execute(_PG_MERGE_STAGING)
+                else:
+                    await connection.executemany(_PG_INSERT, rows)
+
+    async def save_feedback(self, payload: FeedbackPayload) -> FeedbackRecord:
         record_id = uuid4()
         record = FeedbackRecord.create(record_id=record_id, payload=payload)
 
         try:
-            async with pool.acquire() as connection:
-                await connection.execute(
-                    """
-                    INSERT INTO feedback (
-                        id,
-                        conversation_id,
-                        message_id,
-                        rating,
-                        assistant_message,
-                        user_message,
-                        comment,
-                        mode,
-                        created_at
-                    )
-                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
-                    """,
-                    record.id,
-                    record.conversation_id,
-                    record.message_id,
-                    record.rating.value,
-                    record.assistant_message,
-                    record.user_message,
-                    record.comment,
-                    record.mode,
-                    record.created_at,
-                )
+            await self._writer.submit(record)
+        except FeedbackStorageError:
+            raise
         except Exception as exc:  # pragma: no cover - network errors
             raise FeedbackStorageError("Не удалось сохранить отзыв в PostgreSQL.") from exc
 
         return record
 
+    async def save_records(self, records: list[FeedbackRecord]) -> None:
+        try:
+            await asyncio.gather(*(self._writer.submit(record) for record in records))
+        except FeedbackStorageError:
+            raise
+        except Exception as exc:  # pragma: no cover - network errors
+            raise FeedbackStorageError("Не удалось сохранить отзывы в PostgreSQL.") from exc
+
     async def close(self) -> None:
+        await self._writer.close()
         if self._pool is not None:
             await self._pool.close()
             self._pool = None
 
 
 class ClickHouseFeedbackStorage:
-    """Persist feedback in ClickHouse using clickhouse-connect."""
-
-    def __init__(self, dsn: str) -> None:
+    """Persist feedback in ClickHouse using clickhouse-connect.
+
+    ClickHouse favours few large inserts, so records are accumulated by a
+    :class:`BufferedRecordWriter` and each batch is sent column-oriented
+    (``column_oriented=True``, Native format) in a single insert. The async
+    client of clickhouse-connect is used when available; older releases fall
+    back to the synchronous client in a worker thread.
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        *,
+        batch_size: int = 5_000,
+        flush_interval: float = 0.1,
+        max_pending: int = 50_000,
+        spill_path: Path | str | None = None,
+        dead_letter_path: Path | str | None = None,
+        retries: int = 3,
+        retry_backoff: float = 0.1,
+    ) -> None:
         self._dsn = dsn
         self._client: Any = None
+        self._client_is_async = False
         self._lock = asyncio.Lock()
+        self._writer = BufferedRecordWriter(
+            self._insert_batch,
+            max_batch=batch_size,
+            flush_interval=flush_interval,
+            max_pending=max_pending,
+            spill_path=spill_path,
+            retries=retries,
+            retry_backoff=retry_backoff,
+            is_transient=_is_transient_clickhouse,
+            dead_letter_path=dead_letter_path,
+        )
+
+    @property
+    def writer(self) -> BufferedRecordWriter:
+        return self._writer
 
     def _client_kwargs(self) -> dict[str, object]:
         parsed = urlparse(self._dsn)
@@ -131,54 +275,68 @@ class ClickHouseFeedbackStorage:
             async with self._lock:
                 if self._client is None:
                     clickhouse_connect = _load_clickhouse_connect()
+                    get_async_client = getattr(clickhouse_connect, "get_async_client", None)
                     try:
-                        self._client = await asyncio.to_thread(
-                            clickhouse_connect.get_client, **self._client_kwargs()
-                        )
+                        if get_async_client is not None:
+                            self._client = await get_async_client(**self._client_kwargs())
+                            self._client_is_async = True
+                        else:
+                            self._client = await asyncio.to_thread(
+                                clickhouse_connect.get_client, **self._client_kwargs()
+                            )
                     except Exception as exc:  # pragma: no cover - network errors
                         raise FeedbackStorageError("Не удалось подключиться к ClickHouse.") from exc
         return self._client
 
-    async def save_feedback(self, payload: FeedbackPayload) -> FeedbackRecord:
+    @staticmethod
+    def _columns(records: list[FeedbackRecord]) -> list[list[Any]]:
+        columns: list[list[Any]] = [[] for _ in _FEEDBACK_COLUMNS]
+        for record in records:
+            for column, value in zip(columns, _record_row(record)):
+                column.append(value)
+        columns[0] = [str(value) for value in columns[0]]
+        return columns
+
+    async def _insert_batch(self, records: list[FeedbackRecord]) -> None:
         client = await self._ensure_client()
+        data = self._columns(records)
+        if self._client_is_async:
+            await client.insert("feedback", data, column_names=list(_FEEDBACK_COLUMNS), column_oriented=True)
+        else:
+            await asyncio.to_thread(
+                client.insert, "feedback", data, column_names=list(_FEEDBACK_COLUMNS), column_oriented=True
+            )
+
+    async def save_feedback(self, payload: FeedbackPayload) -> FeedbackRecord:
         record_id = uuid4()
         record = FeedbackRecord.create(record_id=record_id, payload=payload)
 
-        data = [
-            [
-                str(record.id),
-                record.conversation_id,
-                record.message_id,
-                record.rating.value,
-                record.assistant_message,
-                record.user_message,
-                record.comment,
-                record.mode,
-                record.created_at,
-            ]
-        ]
-        columns = [
-            "id",
-            "conversation_id",
-            "message_id",
-            "rating",
-            "assistant_message",
-            "user_message",
-            "comment",
-            "mode",
-            "created_at",
-        ]
-
         try:
-            await asyncio.to_thread(client.insert, "feedback", data, column_names=columns)
+            await self._writer.submit(record)
+        except FeedbackStorageError:
+            raise
         except Exception as exc:  # pragma: no cover - network errors
             raise FeedbackStorageError("Не удалось сохранить отзыв в ClickHouse.") from exc
 
         return record
 
+    async def save_records(self, records: list[FeedbackRecord]) -> None:
+        try:
+            await asyncio.gather(*(self._writer.submit(record) for record in records))
+        except FeedbackStorageError:
+            raise
+        except Exception as exc:  # pragma: no cover - network errors
+            raise FeedbackStorageError("Не удалось сохранить отзывы в ClickHouse.") from exc
+
     async def close(self) -> None:
+        await self._writer.close()
         if self._client is not None:
-            await asyncio.to_thread(self._client.close)
+            if self._client_is_async:
+                result = self._client.close()
+                if inspect.isawaitable(result):
+                    await result
+            else:
+                await asyncio.to_thread(self._client.close)
             self._client = None
 
 
@@ -196,10 +354,27 @@ def _create_storage_from_env() -> FeedbackStorage:
     scheme = urlparse(dsn).scheme.lower()
 
     if scheme.startswith("postgres"):
-        return PostgresFeedbackStorage(dsn)
+        return PostgresFeedbackStorage(
+            dsn,
+            batch_size=int(os.getenv("FEEDBACK_BATCH_SIZE", "500")),
+            flush_interval=float(os.getenv("FEEDBACK_FLUSH_INTERVAL_MS", "10")) / 1000.0,
+            max_pending=int(os.getenv("FEEDBACK_MAX_PENDING", "10000")),
+            spill_path=os.getenv("FEEDBACK_SPILL_PATH", "data/feedback_spill.jsonl") or None,
+            dead_letter_path=os.getenv("FEEDBACK_DEAD_LETTER_PATH", "data/feedback_dead.jsonl") or None,
+            use_copy=os.getenv("FEEDBACK_PG_COPY", "1") != "0",
+            retries=int(os.getenv("FEEDBACK_FLUSH_RETRIES", "0")),
+        )
 
     if scheme.startswith("clickhouse"):
-        return ClickHouseFeedbackStorage(dsn)
+        return ClickHouseFeedbackStorage(
+            dsn,
+            batch_size=int(os.getenv("FEEDBACK_BATCH_SIZE", "5000")),
+            flush_interval=float(os.getenv("FEEDBACK_FLUSH_INTERVAL_MS", "100")) / 1000.0,
+            max_pending=int(os.getenv("FEEDBACK_MAX_PENDING", "50000")),
+            spill_path=os.getenv("FEEDBACK_SPILL_PATH", "data/feedback_spill.jsonl") or None,
+            dead_letter_path=os.getenv("FEEDBACK_DEAD_LETTER_PATH", "data/feedback_dead.jsonl") or None,
+            retries=int(os.getenv("FEEDBACK_FLUSH_RETRIES", "3")),
+        )
 
     raise FeedbackStorageError(
         "Поддерживаются только подключения PostgreSQL (postgres://) и ClickHouse (clickhouse://)."
@@ -220,6 +395,13 @@ async def get_feedback_storage() -> AsyncIterator[FeedbackStorage]:
     yield _storage_instance
 
 
+def feedback_storage_metrics() -> Optional[dict[str, object]]:
+    """Return batching metrics of the active storage, if it has been created."""
+
+    writer = getattr(_storage_instance, "writer", None)
+    return writer.stats() if writer is not None else None
+
+
 async def shutdown_feedback_storage() -> None:
     """Dispose the cached storage instance during application shutdown."""
 
@@ -234,6 +416,7 @@ __all__ = [
     "FeedbackStorage",
     "FeedbackStorageError",
     "PostgresFeedbackStorage",
+    "feedback_storage_metrics",
     "get_feedback_storage",
     "shutdown_feedback_storage",
 ]
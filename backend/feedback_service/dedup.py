@@ -0,0 +1,312 @@
+"""Индекс идемпотентности отзывов по ``(conversation_id, message_id)``.
+
+Ключи подтверждённых отзывов дописываются в журнал (16-байтовые отпечатки
+подряд), и фильтр Блума над журналом — главный источник ответа: если ключа в
+фильтре нет, отзыв точно новый, и проверка обходится без ввода-вывода.
+Положительный ответ фильтра сначала сверяется с точным LRU последних ключей, а
+если ключ уже вытеснен из LRU, — с самим журналом (в потоке, без блокировки
+индекса). Так повтор старше окна LRU всё равно отсекается, а ложное
+срабатывание фильтра (доля ``error_rate`` новых ключей) стоит одного чтения
+журнала и не теряет отзыв.
+
+Журнал хранит последние ``capacity`` ключей: когда он вырастает вдвое,
+:meth:`DedupIndex.compact` в фоновом потоке переписывает хвост и заново
+строит фильтр, а под блокировкой выполняется только подмена файла и фильтра.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 16
+_MASK64 = (1 << 64) - 1
+
+
+def feedback_key(conversation_id: str, message_id: str) -> bytes:
+    """Отпечаток пары идентификаторов, одинаковый между процессами."""
+
+    digest = hashlib.blake2b(digest_size=KEY_SIZE)
+    digest.update(conversation_id.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(message_id.encode("utf-8"))
+    return digest.digest()
+
+
+class BloomFilter:
+    """Фильтр Блума с двойным хэшированием поверх уже случайного ключа."""
+
+    def __init__(self, capacity: int, error_rate: float = 1e-3) -> None:
+        capacity = max(1, capacity)
+        bits = max(64, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self._bits = bits
+        self._hashes = max(1, round(bits / capacity * math.log(2)))
+        self._array = bytearray((bits + 7) // 8)
+
+    def _positions(self, key: bytes) -> Iterable[int]:
+        # Арифметика по модулю 2**64 — как в векторном add_many.
+        first = int.from_bytes(key[:8], "little")
+        second = int.from_bytes(key[8:16], "little") | 1
+        for index in range(self._hashes):
+            yield ((first + index * second) & _MASK64) % self._bits
+
+    def add(self, key: bytes) -> None:
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+
+    def add_many(self, keys: bytes) -> None:
+        """Добавляет подряд записанные 16-байтовые ключи одним векторным проходом."""
+
+        words = np.frombuffer(keys, dtype="<u8", count=len(keys) // KEY_SIZE * 2)
+        first, second = words[0::2], words[1::2] | np.uint64(1)
+        array = np.frombuffer(self._array, dtype=np.uint8)
+        bits = np.uint64(self._bits)
+        for index in range(self._hashes):
+            positions = (first + np.uint64(index) * second) % bits
+            masks = np.left_shift(1, (positions & np.uint64(7)).astype(np.uint8)).astype(np.uint8)
+            np.bitwise_or.at(array, (positions >> np.uint64(3)).astype(np.intp), masks)
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(self._array[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def _log_contains(data: bytes, key: bytes) -> bool:
+    start = data.find(key)
+    while start >= 0:
+        if start % KEY_SIZE == 0:
+            return True
+        start = data.find(key, start + 1)
+    return False
+
+
+class DedupIndex:
+    """Фильтр Блума над журналом ключей с точным LRU последних ключей."""
+
+    def __init__(
+        self,
+        path: Path | str | None = None,
+        *,
+        capacity: int = 1_000_000,
+        lru_size: int = 100_000,
+        error_rate: float = 1e-3,
+    ) -> None:
+        self._path = Path(path) if path else None
+        self._capacity = max(1, capacity)
+        self._error_rate = error_rate
+        self._lru_size = max(1, lru_size)
+        self._bloom = BloomFilter(self._capacity, error_rate)
+        self._recent: "OrderedDict[bytes, bool]" = OrderedDict()
+        self._logged = 0
+        self._handle: Optional[BinaryIO] = None
+        self._lock = threading.Lock()
+        self._compacting = False
+        self._compaction: Optional[asyncio.Future[None]] = None
+        self.hits = 0
+        self.misses = 0
+        self.log_checks = 0
+        self._load()
+
+    def _load(self) -> None:
+        if self._path is None:
+            return
+        try:
+            data = self._path.read_bytes()
+        except FileNotFoundError:
+            return
+        usable = len(data) - len(data) % KEY_SIZE
+        self._bloom.add_many(data[:usable])
+        for offset in range(max(0, usable - self._lru_size * KEY_SIZE), usable, KEY_SIZE):
+            self._remember(data[offset : offset + KEY_SIZE], committed=True)
+        self._logged = usable // KEY_SIZE
+        if usable != len(data):
+            logger.warning("Журнал дедупликации %s оборван; хвост отброшен", self._path)
+            os.truncate(self._path, usable)
+
+    def _remember(self, key: bytes, *, committed: bool) -> None:
+        self._recent[key] = committed
+        self._recent.move_to_end(key)
+        while len(self._recent) > self._lru_size:
+            self._recent.popitem(last=False)
+
+    def _reserve_locked(self, key: bytes) -> Tuple[Optional[bool], int]:
+        """Быстрый ответ без ввода-вывода или ``None`` и длина журнала, которую нужно проверить."""
+
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            self.hits += 1
+            return False, 0
+        # Ключ занимается до проверки журнала: параллельный повтор попадёт в LRU.
+        self._remember(key, committed=False)
+        if self._path is None or key not in self._bloom:
+            self.misses += 1
+            return True, 0
+        self.log_checks += 1
+        return None, self._logged * KEY_SIZE
+
+    def _resolve(self, key: bytes, found: bool) -> bool:
+        with self._lock:
+            if found:
+                self.hits += 1
+                if key in self._recent:
+                    self._recent[key] = True
+                return False
+            self.misses += 1
+            return True
+
+    def _check_log(self, size: int, key: bytes) -> bool:
+        assert self._path is not None
+        try:
+            with self._path.open("rb") as handle:
+                return _log_contains(handle.read(size), key)
+        except FileNotFoundError:
+            return False
+
+    def reserve(self, key: bytes) -> bool:
+        """Занимает ключ; ``False`` — это повтор уже принятого или обрабатываемого отзыва.
+
+        При срабатывании фильтра Блума журнал читается в вызывающем потоке;
+        из цикла событий вызывайте :meth:`areserve`.
+        """
+
+        with self._lock:
+            verdict, size = self._reserve_locked(key)
+        if verdict is not None:
+            return verdict
+        return self._resolve(key, self._check_log(size, key))
+
+    async def areserve(self, key: bytes) -> bool:
+        """Как :meth:`reserve`, но сверка с журналом выполняется в потоке."""
+
+        with self._lock:
+            verdict, size = self._reserve_locked(key)
+        if verdict is not None:
+            return verdict
+        return self._resolve(key, await asyncio.to_thread(self._check_log, size, key))
+
+    def commit(self, key: bytes) -> None:
+        """Подтверждает ключ после успешной обработки и дописывает его в журнал."""
+
+        with self._lock:
+            if key in self._recent:
+                self._recent[key] = True
+            if self._path is None:
+                return
+            self._bloom.add(key)
+            if self._handle is None:
+                self._path.parent.mkdir(parents=True, exist_ok=True)
+                self._handle = self._path.open("ab")
+            self._handle.write(key)
+            self._handle.flush()
+            self._logged += 1
+            if self._logged <= 2 * self._capacity or self._compacting:
+                return
+            self._compacting = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.compact()
+        else:
+            self._compaction = loop.create_task(asyncio.to_thread(self.compact))
+
+    def release(self, key: bytes) -> None:
+        """Снимает резерв после ошибки, чтобы повтор запроса был обработан."""
+
+        with self._lock:
+            if self._recent.get(key) is False:
+                del self._recent[key]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "recent": len(self._recent),
+            "logged": self._logged,
+            "hits": self.hits,
+            "misses": self.misses,
+            "log_checks": self.log_checks,
+        }
+
+    def compact(self) -> None:
+        """Оставляет в журнале последние ``capacity`` ключей и перестраивает фильтр.
+
+        Чтение журнала и построение фильтра идут без блокировки индекса; под
+        ней дописывается хвост, пришедший за это время, и подменяются файл и
+        фильтр.
+        """
+
+        assert self._path is not None
+        try:
+            with self._lock:
+                size = self._logged * KEY_SIZE
+            with self._path.open("rb") as handle:
+                kept = handle.read(size)[-self._capacity * KEY_SIZE :]
+            bloom = BloomFilter(self._capacity, self._error_rate)
+            bloom.add_many(kept)
+            tmp_path = self._path.with_name(f".{self._path.name}.tmp")
+            with self._lock:
+                with self._path.open("rb") as handle:
+                    handle.seek(size)
+                    tail = handle.read(self._logged * KEY_SIZE - size)
+                tmp_path.write_bytes(kept + tail)
+                if self._handle is not None:
+                    self._handle.close()
+                    self._handle = None
+                os.replace(tmp_path, self._path)
+                bloom.add_many(tail)
+                for key in self._recent:
+                    bloom.add(key)
+                self._bloom = bloom
+                self._logged = (len(kept) + len(tail)) // KEY_SIZE
+        except OSError as error:
+            logger.warning("Не удалось сжать журнал дедупликации %s: %s", self._path, error)
+        finally:
+            with self._lock:
+                self._compacting = False
+
+
+_dedup_index: Optional[DedupIndex] = None
+_dedup_lock = threading.Lock()
+
+
+def _create_index_from_env() -> DedupIndex:
+    return DedupIndex(
+        os.getenv("FEEDBACK_DEDUP_PATH", "data/feedback_dedup.keys") or None,
+        capacity=int(os.getenv("FEEDBACK_DEDUP_CAPACITY", "1000000")),
+        lru_size=int(os.getenv("FEEDBACK_DEDUP_LRU", "100000")),
+    )
+
+
+def get_dedup_index() -> DedupIndex:
+    """Возвращает общий индекс; журнал читается один раз при первом обращении."""
+
+    global _dedup_index
+    if _dedup_index is None:
+        with _dedup_lock:
+            if _dedup_index is None:
+                _dedup_index = _create_index_from_env()
+    return _dedup_index
+
+
+def shutdown_dedup_index() -> None:
+    global _dedup_index
+    if _dedup_index is not None:
+        _dedup_index.close()
+        _dedup_index = None
+
+
+__all__ = ["BloomFilter", "DedupIndex", "feedback_key", "get_dedup_index", "shutdown_dedup_index"]
@@ -0,0 +1,121 @@
+"""Фоновая диагностика согласованности градиентных оценок θ.
+
+Проверка сравнивает оценки градиента по 4, 8 и 16 случайным направлениям и
+публикует корреляции между ними в гистограммы. Она выполняется только для
+выборки обновлений (каждое N-е) в отдельной задаче и не задерживает запрос.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+_SAMPLES: Tuple[int, ...] = (4, 8, 16)
+_CORRELATION_BOUNDS = (-0.5, 0.0, 0.25, 0.5, 0.75, 0.9, 0.95, 0.99)
+
+
+class GradientDiagnostics:
+    """Принимает выборку обновлений и считает корреляции оценок в фоне."""
+
+    def __init__(self, *, every: int = 0, max_pending: int = 64) -> None:
+        self._every = max(0, every)
+        self._max_pending = max_pending
+        self._seen = 0
+        self._dropped = 0
+        self._queue: Optional[asyncio.Queue[Tuple[List[float], float, float]]] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self.corr_4_8 = Histogram(_CORRELATION_BOUNDS)
+        self.corr_8_16 = Histogram(_CORRELATION_BOUNDS)
+
+    @property
+    def enabled(self) -> bool:
+        return self._every > 0
+
+    def sample(self, basis: List[float], error: float, sigma: float) -> None:
+        """Отбирает каждое N-е обновление; никогда не блокирует вызывающего."""
+
+        if not self._every or not basis or sigma <= 0.0:
+            return
+        self._seen += 1
+        if self._seen % self._every:
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_pending)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        try:
+            self._queue.put_nowait((list(basis), error, sigma))
+        except asyncio.QueueFull:
+            self._dropped += 1
+
+    def compute(self, basis: Sequence[float], error: float, sigma: float) -> Tuple[float, float]:
+        """Возвращает ``(corr(4,8), corr(8,16))`` для одного обновления."""
+
+        features = np.asarray(basis, dtype=np.float64) * (error / sigma)
+        rng = np.random.default_rng()
+        estimates = [
+            features * rng.choice((-1.0, 1.0), size=(count, features.size)).mean(axis=0) for count in _SAMPLES
+        ]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (
+                float(np.nan_to_num(np.corrcoef(estimates[0], estimates[1])[0, 1], nan=1.0)),
+                float(np.nan_to_num(np.corrcoef(estimates[1], estimates[2])[0, 1], nan=1.0)),
+            )
+
+    def snapshot(self) -> dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "every": self._every,
+            "sampled": self.corr_4_8.count,
+            "dropped": self._dropped,
+            "corr_4_8": self.corr_4_8.snapshot(),
+            "corr_8_16": self.corr_8_16.snapshot(),
+        }
+
+    async def drain(self) -> None:
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def aclose(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._queue = None
+
+    async def _run(self) -> None:
+        queue = self._queue
+        assert queue is not None
+        while True:
+            basis, error, sigma = await queue.get()
+            try:
+                corr_4_8, corr_8_16 = self.compute(basis, error, sigma)
+                self.corr_4_8.observe(corr_4_8)
+                self.corr_8_16.observe(corr_8_16)
+                if corr_4_8 < 0.9 or corr_8_16 < 0.9:
+                    logger.debug(
+                        "Низкая корреляция градиентных оценок: corr(4,8)=%.3f corr(8,16)=%.3f",
+                        corr_4_8,
+                        corr_8_16,
+                    )
+            except Exception as error:  # pragma: no cover - диагностика не должна падать
+                logger.warning("Ошибка диагностики градиента: %s", error)
+            finally:
+                queue.task_done()
+
+
+__all__ = ["GradientDiagnostics"]
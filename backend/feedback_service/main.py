@@ -2,25 +2,44 @@
 
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
+import os
 from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Tuple
 
-from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, HTTPException, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
 
-from .database import FeedbackStorageError, shutdown_feedback_storage
+from .database import FeedbackStorageError, feedback_storage_metrics, shutdown_feedback_storage
+from .dedup import get_dedup_index, shutdown_dedup_index
+from .pipeline import feedback_pipeline_metrics, shutdown_feedback_pipeline
 from .repository import FeedbackRepository, get_repository
-from .schemas import FeedbackPayload, FeedbackResponse
+from .rlhf_dataset import shutdown_dataset_writer
+from .schemas import FeedbackBatchItem, FeedbackBatchResponse, FeedbackPayload, FeedbackResponse
+from .theta import ThetaUpdater, get_theta_updater, shutdown_theta_updater, warm_long_term_memory
 
 logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Clean up shared resources on shutdown."""
+    """Warm up long-term memory in the background and clean up shared resources on shutdown."""
 
+    await asyncio.to_thread(get_dedup_index)
+    warmup = None
+    if os.getenv("KNP_LTM_WARMUP", "1") != "0":
+        warmup = asyncio.create_task(warm_long_term_memory())
     yield
+    if warmup is not None:
+        await warmup
+    await shutdown_feedback_pipeline()
+    await shutdown_theta_updater()
+    await shutdown_dataset_writer()
     await shutdown_feedback_storage()
+    shutdown_dedup_index()
 
 
 app = FastAPI(title="Kolibri Feedback API", version="1.0.0", lifespan=lifespan)
@@ -29,7 +48,7 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
-    allow_methods=["POST", "OPTIONS"],
+    allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"]
 )
 
@@ -37,12 +56,13 @@ app.add_middleware(
 @app.post("/api/feedback", response_model=FeedbackResponse, status_code=status.HTTP_201_CREATED)
 async def submit_feedback(
     payload: FeedbackPayload,
+    response: Response,
     repository: FeedbackRepository = Depends(get_repository),
 ):
-    """Persist feedback and append it to the RLHF dataset."""
+    """Persist feedback and append it to the RLHF dataset; retries are acknowledged with 200."""
 
     try:
-        await repository.create_feedback(payload)
+        record = await repository.create_feedback(payload)
     except FeedbackStorageError as error:
         logger.exception("Feedback persistence failed: %s", error)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(error)) from error
@@ -53,7 +73,130 @@ async def submit_feedback(
             detail="Не удалось сохранить отзыв.",
         ) from error
 
+    if record is None:
+        response.status_code = status.HTTP_200_OK
+        return FeedbackResponse(duplicate=True)
     return FeedbackResponse()
 
 
+_NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+
+
+def _batch_limit() -> int:
+    return int(os.getenv("FEEDBACK_BATCH_MAX_ITEMS", "10000"))
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in item['loc']) or 'body'}: {item['msg']}" for item in error.errors()
+    )
+
+
+async def _ndjson_lines(request: Request) -> AsyncIterator[bytes]:
+    """Split the request stream into lines without buffering the whole body."""
+
+    tail = b""
+    async for chunk in request.stream():
+        tail += chunk
+        *lines, tail = tail.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if tail.strip():
+        yield tail
+
+
+async def _parse_batch(request: Request) -> Tuple[List[Tuple[int, FeedbackPayload]], List[FeedbackBatchItem]]:
+    limit = _batch_limit()
+    valid: List[Tuple[int, FeedbackPayload]] = []
+    invalid: List[FeedbackBatchItem] = []
+
+    def _too_large() -> HTTPException:
+        return HTTPException(
+            status_code=413,
+            detail=f"Не более {limit} отзывов в одном запросе.",
+        )
+
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in _NDJSON_TYPES:
+        index = 0
+        async for line in _ndjson_lines(request):
+            if index >= limit:
+                raise _too_large()
+            try:
+                valid.append((index, FeedbackPayload.model_validate_json(line)))
+            except ValidationError as error:
+                invalid.append(FeedbackBatchItem(index=index, status="invalid", error=_validation_message(error)))
+            index += 1
+        return valid, invalid
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError as error:
+        raise HTTPException(status_code=422, detail=f"Некорректный JSON: {error}") from error
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=422,
+            detail="Ожидается JSON-массив отзывов или NDJSON.",
+        )
+    if len(items) > limit:
+        raise _too_large()
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, FeedbackPayload.model_validate(item)))
+        except ValidationError as error:
+            invalid.append(FeedbackBatchItem(index=index, status="invalid", error=_validation_message(error)))
+    return valid, invalid
+
+
+@app.post("/api/feedback/batch", response_model=FeedbackBatchResponse)
+async def submit_feedback_batch(
+    request: Request,
+    repository: FeedbackRepository = Depends(get_repository),
+):
+    """Accept a JSON array or NDJSON stream of feedback; every element gets its own status.
+
+    Invalid elements are reported and skipped; the valid ones are stored in a
+    single batch. If that batch fails, all of its elements are reported as
+    ``error`` and may be resent as a whole.
+    """
+
+    valid, items = await _parse_batch(request)
+    payloads = [payload for _, payload in valid]
+    try:
+        records = await repository.create_feedback_batch(payloads) if payloads else []
+    except Exception as error:
+        logger.exception("Bulk feedback persistence failed: %s", error)
+        detail = str(error) if isinstance(error, FeedbackStorageError) else "Не удалось сохранить отзыв."
+        items.extend(FeedbackBatchItem(index=index, status="error", error=detail) for index, _ in valid)
+    else:
+        for (index, _), record in zip(valid, records):
+            if record is None:
+                items.append(FeedbackBatchItem(index=index, status="duplicate"))
+            else:
+                items.append(FeedbackBatchItem(index=index, status="accepted", id=record.id))
+    items.sort(key=lambda item: item.index)
+
+    response = FeedbackBatchResponse(items=items)
+    for item in items:
+        if item.status == "accepted":
+            response.accepted += 1
+        elif item.status == "duplicate":
+            response.duplicates += 1
+        else:
+            response.rejected += 1
+    return response
+
+
+@app.get("/api/feedback/metrics")
+async def feedback_metrics(theta_updater: ThetaUpdater = Depends(get_theta_updater)):
+    """Expose in-process pipeline metrics (θ gradient diagnostics, storage batching)."""
+
+    return {
+        "theta_diagnostics": theta_updater.diagnostics(),
+        "storage": feedback_storage_metrics(),
+        "pipeline": feedback_pipeline_metrics(),
+    }
+
+
 __all__ = ["app"]
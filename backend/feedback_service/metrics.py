@@ -0,0 +1,47 @@
+"""Лёгкие внутрипроцессные метрики feedback-сервиса."""
+
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import Dict, Sequence
+
+
+class Histogram:
+    """Гистограмма с фиксированными верхними границами корзин (как в Prometheus)."""
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self._bounds = sorted(float(bound) for bound in bounds)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            buckets: Dict[str, int] = {}
+            cumulative = 0
+            for bound, count in zip(self._bounds, self._counts):
+                cumulative += count
+                buckets[f"{bound:g}"] = cumulative
+            buckets["+Inf"] = cumulative + self._counts[-1]
+            return {
+                "count": self._count,
+                "sum": self._sum,
+                "mean": self._sum / self._count if self._count else 0.0,
+                "buckets": buckets,
+            }
+
+
+__all__ = ["Histogram"]
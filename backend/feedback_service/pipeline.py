@@ -0,0 +1,463 @@
+"""Поэтапный конвейер приёма отзывов.
+
+HTTP-запрос ждёт только записи отзыва в локальный журнал (групповой коммит:
+записи параллельных запросов пишутся одним вызовом и одним ``fsync``). По
+умолчанию «принято» означает «сохранено на диск»; с ``fsync=False``
+(``FEEDBACK_PIPELINE_FSYNC=0``) подтверждённая запись может пропасть при
+падении ОС. Дальше запись расходится по очередям потребителей — хранилище,
+RLHF-датасет, θ, — каждый из которых обрабатывает её независимо, пачками, со
+своей политикой повторов. Позиция каждого потребителя в журнале сохраняется в
+``checkpoints.json``; после перезапуска необработанный хвост журнала
+проигрывается заново, так что доставка — «хотя бы один раз». Потребитель с
+``replay=False`` (θ: его шаг не идемпотентен, а применённые батчи он сам
+восстанавливает из своего WAL) хвост не получает — для него доставка «не
+более одного раза». Запись, которую не удалось обработать за все попытки,
+уходит в ``<consumer>.dead.jsonl``.
+
+Очередь каждого потребителя ограничена ``max_pending`` записями, как и число
+записей, ожидающих группового коммита. Если хранилище лежит и его очередь
+заполнена, групповой коммит ждёт места, а :meth:`FeedbackPipeline.accept` —
+свободного слота: память не растёт, а приём замедляется до скорости самого
+медленного потребителя.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import Histogram
+from .schemas import FeedbackRecord
+
+if TYPE_CHECKING:  # pragma: no cover - только для аннотаций
+    from .database import FeedbackStorage
+    from .rlhf_dataset import RLHFDatasetWriter
+    from .theta import ThetaUpdater
+
+logger = logging.getLogger(__name__)
+
+BatchHandler = Callable[[List[FeedbackRecord]], Awaitable[None]]
+
+_LAG_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Экспоненциальные повторы с джиттером; ``max_attempts`` включает первую попытку."""
+
+    max_attempts: int = 5
+    base_delay: float = 0.05
+    max_delay: float = 5.0
+    jitter: float = 0.2
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** max(0, attempt - 1)))
+        return delay * (1.0 + random.uniform(-self.jitter, self.jitter))
+
+
+class _Consumer:
+    def __init__(
+        self, name: str, handler: BatchHandler, retry: RetryPolicy, max_batch: int, replay: bool, max_pending: int
+    ) -> None:
+        self.name = name
+        self.handler = handler
+        self.retry = retry
+        self.max_batch = max(1, max_batch)
+        self.replay = replay
+        self.queue: asyncio.Queue[Tuple[int, FeedbackRecord, float]] = asyncio.Queue(maxsize=max_pending)
+        self.task: Optional[asyncio.Task[None]] = None
+        self.checkpoint = 0
+        self.processed = 0
+        self.retries = 0
+        self.dead_lettered = 0
+        self.latency = Histogram(_LAG_BOUNDS)
+
+    def snapshot(self, last_seq: int) -> Dict[str, object]:
+        return {
+            "checkpoint": self.checkpoint,
+            "lag_records": max(0, last_seq - self.checkpoint),
+            "queued": self.queue.qsize(),
+            "processed": self.processed,
+            "retries": self.retries,
+            "dead_lettered": self.dead_lettered,
+            "latency_seconds": self.latency.snapshot(),
+        }
+
+
+class FeedbackPipeline:
+    """Журнал приёма и независимые очереди потребителей."""
+
+    def __init__(
+        self,
+        directory: Path | str,
+        *,
+        fsync: bool = True,
+        checkpoint_interval: float = 0.5,
+        max_wal_bytes: int = 64 * 1024 * 1024,
+        max_pending: int = 10_000,
+    ) -> None:
+        self._directory = Path(directory)
+        self._wal_path = self._directory / "wal.jsonl"
+        self._checkpoint_path = self._directory / "checkpoints.json"
+        self._fsync = fsync
+        self._checkpoint_interval = checkpoint_interval
+        self._max_wal_bytes = max_wal_bytes
+        self._max_pending = max(1, max_pending)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._consumers: Dict[str, _Consumer] = {}
+        self._seq = 0
+        self._pending: List[Tuple[FeedbackRecord, asyncio.Future[int]]] = []
+        self._committer: Optional[asyncio.Task[None]] = None
+        self._checkpointer: Optional[asyncio.Task[None]] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._handle = None
+        # Запись журнала и его обнуление идут в потоках: общий замок и флаг
+        # незавершённого группового коммита не дают обнулить журнал, пока
+        # записанная пачка ещё не учтена в _seq.
+        self._io_lock = threading.Lock()
+        self._commit_in_flight = False
+        self._started = False
+        self._start_lock: Optional[asyncio.Lock] = None
+        self.accepted = 0
+
+    def add_consumer(
+        self,
+        name: str,
+        handler: BatchHandler,
+        *,
+        retry: RetryPolicy = RetryPolicy(),
+        max_batch: int = 256,
+        replay: bool = True,
+    ) -> None:
+        """Регистрирует потребителя; ``replay=False`` — не проигрывать ему хвост журнала после перезапуска."""
+
+        if self._started:
+            raise RuntimeError("Потребителей нужно регистрировать до запуска конвейера")
+        self._consumers[name] = _Consumer(name, handler, retry, max_batch, replay, self._max_pending)
+
+    async def start(self) -> None:
+        """Восстанавливает позиции потребителей и проигрывает необработанный хвост журнала."""
+
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._started:
+                return
+            checkpoints, entries = await asyncio.to_thread(self._recover)
+            for consumer in self._consumers.values():
+                consumer.checkpoint = int(checkpoints.get(consumer.name, 0))
+            now = time.monotonic()
+            replayed = 0
+            for seq, record in entries:
+                self._seq = max(self._seq, seq)
+            skipped = {}
+            for consumer in self._consumers.values():
+                if not consumer.replay and consumer.checkpoint < self._seq:
+                    skipped[consumer.name] = self._seq - consumer.checkpoint
+                    consumer.checkpoint = self._seq
+            for consumer in self._consumers.values():
+                consumer.task = asyncio.create_task(self._consume(consumer))
+            # Хвост длиннее очереди ставится по мере её освобождения, до первого нового коммита.
+            for seq, record in entries:
+                for consumer in self._consumers.values():
+                    if seq > consumer.checkpoint:
+                        await consumer.queue.put((seq, record, now))
+                        replayed += 1
+            self._slots = asyncio.Semaphore(self._max_pending)
+            self._wakeup = asyncio.Event()
+            self._committer = asyncio.create_task(self._commit_loop())
+            if self._checkpoint_interval > 0:
+                self._checkpointer = asyncio.create_task(self._checkpoint_loop())
+            self._started = True
+            if replayed:
+                logger.info("Конвейер отзывов: повторно поставлено %d задач из журнала", replayed)
+            for name, count in skipped.items():
+                logger.warning("Конвейер отзывов: потребитель %s пропускает %d записей журнала", name, count)
+
+    async def accept(self, record: FeedbackRecord) -> int:
+        """Записывает отзыв в журнал и ставит его потребителям; возвращает номер записи.
+
+        Ждёт свободного слота, если ``max_pending`` записей ещё не дошли до
+        очередей потребителей.
+        """
+
+        if not self._started:
+            await self.start()
+        assert self._wakeup is not None and self._slots is not None
+        await self._slots.acquire()
+        future: asyncio.Future[int] = asyncio.get_running_loop().create_future()
+        self._pending.append((record, future))
+        self._wakeup.set()
+        return await asyncio.shield(future)
+
+    async def accept_many(self, records: List[FeedbackRecord]) -> List[int]:
+        """Принимает пачку отзывов одним групповым коммитом."""
+
+        return list(await asyncio.gather(*(self.accept(record) for record in records)))
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт, пока все потребители догонят журнал; ``False`` по таймауту."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while any(consumer.checkpoint < self._seq for consumer in self._consumers.values()) or self._pending:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(0.005)
+        return True
+
+    async def close(self, timeout: float = 10.0) -> None:
+        if not self._started:
+            return
+        await self.drain(timeout)
+        for task in [self._committer, self._checkpointer] + [c.task for c in self._consumers.values()]:
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        await asyncio.to_thread(self._close_sync)
+        self._started = False
+
+    def metrics(self) -> Dict[str, object]:
+        return {
+            "accepted": self.accepted,
+            "last_seq": self._seq,
+            "consumers": {name: consumer.snapshot(self._seq) for name, consumer in self._consumers.items()},
+        }
+
+    async def _commit_loop(self) -> None:
+        assert self._wakeup is not None and self._slots is not None
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+            first_seq = self._seq + 1
+            lines = []
+            for offset, (record, _) in enumerate(batch):
+                payload = {"seq": first_seq + offset, "record": record.to_json()}
+                lines.append(json.dumps(payload, ensure_ascii=False) + "\n")
+            self._commit_in_flight = True
+            try:
+                await asyncio.to_thread(self._append_sync, "".join(lines))
+            except Exception as error:
+                self._commit_in_flight = False
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                    self._slots.release()
+                continue
+            self._seq += len(batch)
+            self._commit_in_flight = False
+            self.accepted += len(batch)
+            for offset, (_, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(first_seq + offset)
+            # Запись уже в журнале; заполненная очередь задерживает следующие коммиты.
+            now = time.monotonic()
+            for offset, (record, _) in enumerate(batch):
+                for consumer in self._consumers.values():
+                    await consumer.queue.put((first_seq + offset, record, now))
+                self._slots.release()
+
+    async def _consume(self, consumer: _Consumer) -> None:
+        while True:
+            batch = [await consumer.queue.get()]
+            while len(batch) < consumer.max_batch and not consumer.queue.empty():
+                batch.append(consumer.queue.get_nowait())
+            records = [record for _, record, _ in batch]
+            attempt = 1
+            while True:
+                try:
+                    await consumer.handler(records)
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as error:
+                    if attempt >= consumer.retry.max_attempts:
+                        logger.error(
+                            "Потребитель %s не обработал %d отзывов за %d попыток: %s",
+                            consumer.name,
+                            len(records),
+                            attempt,
+                            error,
+                        )
+                        await asyncio.to_thread(self._dead_letter, consumer.name, batch, repr(error))
+                        consumer.dead_lettered += len(records)
+                        break
+                    consumer.retries += 1
+                    await asyncio.sleep(consumer.retry.delay(attempt))
+                    attempt += 1
+            now = time.monotonic()
+            for seq, _, accepted_at in batch:
+                consumer.latency.observe(now - accepted_at)
+                consumer.checkpoint = max(consumer.checkpoint, seq)
+            consumer.processed += len(records)
+            for _ in batch:
+                consumer.queue.task_done()
+
+    async def _checkpoint_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._checkpoint_interval)
+            await asyncio.to_thread(self._write_checkpoints)
+
+    def _append_sync(self, payload: str) -> None:
+        with self._io_lock:
+            if self._handle is None:
+                self._directory.mkdir(parents=True, exist_ok=True)
+                self._handle = self._wal_path.open("a", encoding="utf-8")
+            self._handle.write(payload)
+            self._handle.flush()
+            if self._fsync:
+                os.fsync(self._handle.fileno())
+
+    def _dead_letter(self, name: str, batch: List[Tuple[int, FeedbackRecord, float]], error: str) -> None:
+        path = self._directory / f"{name}.dead.jsonl"
+        with path.open("a", encoding="utf-8") as handle:
+            for seq, record, _ in batch:
+                handle.write(json.dumps({"seq": seq, "error": error, "record": record.to_json()}, ensure_ascii=False))
+                handle.write("\n")
+
+    def _write_checkpoints(self) -> None:
+        with self._io_lock:
+            checkpoints = {name: consumer.checkpoint for name, consumer in self._consumers.items()}
+            self._directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._checkpoint_path.with_name(f".{self._checkpoint_path.name}.tmp")
+            tmp_path.write_text(json.dumps({"last_seq": self._seq, "consumers": checkpoints}), encoding="utf-8")
+            os.replace(tmp_path, self._checkpoint_path)
+            self._maybe_truncate(checkpoints)
+
+    def _maybe_truncate(self, checkpoints: Dict[str, int]) -> None:
+        # Журнал обнуляется, только когда все потребители его догнали и ни один
+        # групповой коммит не записан наполовину (вызывается под _io_lock); номера
+        # записей при этом продолжают расти (их хранит last_seq в checkpoints.json).
+        if self._handle is None or self._handle.tell() < self._max_wal_bytes:
+            return
+        if self._commit_in_flight or self._pending:
+            return
+        if any(checkpoint < self._seq for checkpoint in checkpoints.values()):
+            return
+        self._handle.truncate(0)
+        self._handle.seek(0)
+
+    def _recover(self) -> Tuple[Dict[str, int], List[Tuple[int, FeedbackRecord]]]:
+        try:
+            state = json.loads(self._checkpoint_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            state = {}
+        self._seq = int(state.get("last_seq", 0))
+        entries: List[Tuple[int, FeedbackRecord]] = []
+        try:
+            with self._wal_path.open("r", encoding="utf-8") as handle:
+                for line in handle:
+                    if not line.endswith("\n"):
+                        break
+                    try:
+                        payload = json.loads(line)
+                        entries.append((int(payload["seq"]), FeedbackRecord.from_json(payload["record"])))
+                    except (ValueError, KeyError) as error:
+                        logger.warning("Пропускаем повреждённую запись журнала отзывов: %s", error)
+        except FileNotFoundError:
+            pass
+        return dict(state.get("consumers", {})), entries
+
+    def _close_sync(self) -> None:
+        self._write_checkpoints()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+def build_feedback_pipeline(
+    directory: Path | str,
+    storage: "FeedbackStorage",
+    dataset_writer: "RLHFDatasetWriter",
+    theta_updater: "ThetaUpdater",
+    *,
+    fsync: bool = True,
+    max_pending: int = 10_000,
+) -> FeedbackPipeline:
+    """Конвейер со стандартными потребителями: хранилище, RLHF-датасет и θ."""
+
+    pipeline = FeedbackPipeline(directory, fsync=fsync, max_pending=max_pending)
+
+    async def _store(records: List[FeedbackRecord]) -> None:
+        await storage.save_records(records)
+
+    async def _export(records: List[FeedbackRecord]) -> None:
+        for record in records:
+            await dataset_writer.append(record)
+        await dataset_writer.flush()
+
+    async def _adapt(records: List[FeedbackRecord]) -> None:
+        await theta_updater.update_many(records)
+
+    pipeline.add_consumer("storage", _store, retry=RetryPolicy(max_attempts=8, max_delay=30.0))
+    pipeline.add_consumer("dataset", _export, retry=RetryPolicy(max_attempts=5))
+    # Шаг θ не идемпотентен: повтор пачки после частичного успеха исказил бы состояние,
+    # а проигрывание хвоста после падения — повторно применило бы уже записанные в
+    # WAL θ батчи. Поэтому ни повторов, ни проигрывания: «не более одного раза».
+    pipeline.add_consumer("theta", _adapt, retry=RetryPolicy(max_attempts=1), max_batch=64, replay=False)
+    return pipeline
+
+
+_pipeline: Optional[FeedbackPipeline] = None
+
+
+def pipeline_enabled() -> bool:
+    return os.getenv("FEEDBACK_PIPELINE", "1") != "0"
+
+
+def get_feedback_pipeline(
+    storage: "FeedbackStorage",
+    dataset_writer: "RLHFDatasetWriter",
+    theta_updater: "ThetaUpdater",
+) -> FeedbackPipeline:
+    """Возвращает общий конвейер; потребители привязываются при первом обращении."""
+
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = build_feedback_pipeline(
+            os.getenv("FEEDBACK_PIPELINE_DIR", "data/feedback_pipeline"),
+            storage,
+            dataset_writer,
+            theta_updater,
+            fsync=os.getenv("FEEDBACK_PIPELINE_FSYNC", "1") != "0",
+            max_pending=int(os.getenv("FEEDBACK_PIPELINE_MAX_PENDING", "10000")),
+        )
+    return _pipeline
+
+
+def feedback_pipeline_metrics() -> Optional[Dict[str, object]]:
+    return _pipeline.metrics() if _pipeline is not None else None
+
+
+async def shutdown_feedback_pipeline(timeout: float = 10.0) -> None:
+    """Дожидается потребителей и сохраняет их позиции; вызывается до остановки хранилищ."""
+
+    global _pipeline
+    if _pipeline is not None:
+        await _pipeline.close(timeout)
+        _pipeline = None
+
+
+__all__ = [
+    "BatchHandler",
+    "FeedbackPipeline",
+    "RetryPolicy",
+    "build_feedback_pipeline",
+    "feedback_pipeline_metrics",
+    "get_feedback_pipeline",
+    "pipeline_enabled",
+    "shutdown_feedback_pipeline",
+]
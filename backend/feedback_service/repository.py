@@ -3,11 +3,14 @@
 from __future__ import annotations
 
 import logging
-from typing import Annotated
+from typing import Annotated, List, Optional, Sequence
+from uuid import uuid4
 
 from fastapi import Depends
 
 from .database import FeedbackStorage, FeedbackStorageError, get_feedback_storage
+from .dedup import DedupIndex, feedback_key, get_dedup_index
+from .pipeline import FeedbackPipeline, get_feedback_pipeline, pipeline_enabled
 from .rlhf_dataset import RLHFDatasetWriter, get_dataset_writer
 from .schemas import FeedbackPayload, FeedbackRecord
 from .theta import ThetaUpdater, get_theta_updater
@@ -23,16 +26,51 @@ class FeedbackRepository:
         storage: FeedbackStorage,
         dataset_writer: RLHFDatasetWriter,
         theta_updater: ThetaUpdater,
+        dedup_index: Optional[DedupIndex] = None,
+        pipeline: Optional[FeedbackPipeline] = None,
     ) -> None:
         self._storage = storage
         self._dataset_writer = dataset_writer
         self._theta_updater = theta_updater
+        self._dedup_index = dedup_index
+        self._pipeline = pipeline
+
+    async def create_feedback(self, payload: FeedbackPayload) -> Optional[FeedbackRecord]:
+        """Persist the payload and mirror it into the RLHF dataset.
+
+        Returns ``None`` without touching storage when the same
+        ``(conversation_id, message_id)`` has already been accepted. With a
+        pipeline the call returns once the record is in the acceptance log;
+        storage, dataset and θ catch up from their own queues.
+        """
+
+        key = None
+        if self._dedup_index is not None:
+            key = feedback_key(payload.conversation_id, payload.message_id)
+            if not await self._dedup_index.areserve(key):
+                return None
+
+        if self._pipeline is not None:
+            record = FeedbackRecord.create(record_id=uuid4(), payload=payload)
+            try:
+                await self._pipeline.accept(record)
+            except BaseException:
+                if key is not None:
+                    self._dedup_index.release(key)
+                raise
+            if key is not None:
+                self._dedup_index.commit(key)
+            return record
 
-    async def create_feedback(self, payload: FeedbackPayload) -> FeedbackRecord:
-        """Persist the payload and mirror it into the RLHF dataset."""
-
-        record = await self._storage.save_feedback(payload)
-        await self._dataset_writer.append(record)
+        try:
+            record = await self._storage.save_feedback(payload)
+            await self._dataset_writer.append(record)
+        except BaseException:
+            if key is not None:
+                self._dedup_index.release(key)
+            raise
+        if key is not None:
+            self._dedup_index.commit(key)
 
         try:
             await self._theta_updater.update(record)
@@ -41,6 +79,52 @@ class FeedbackRepository:
 
         return record
 
+    async def create_feedback_batch(self, payloads: Sequence[FeedbackPayload]) -> List[Optional[FeedbackRecord]]:
+        """Accept many payloads in one pass; ``None`` marks a duplicate at that position.
+
+        Duplicates are detected both against earlier requests and within the
+        batch itself. The records go to storage, the dataset and θ as one
+        batch (or as one group commit of the pipeline log).
+        """
+
+        keys: List[Optional[bytes]] = []
+        results: List[Optional[FeedbackRecord]] = []
+        for payload in payloads:
+            key = None
+            if self._dedup_index is not None:
+                key = feedback_key(payload.conversation_id, payload.message_id)
+                if not await self._dedup_index.areserve(key):
+                    keys.append(None)
+                    results.append(None)
+                    continue
+            keys.append(key)
+            results.append(FeedbackRecord.create(record_id=uuid4(), payload=payload))
+        records = [record for record in results if record is not None]
+        reserved = [key for key in keys if key is not None]
+        if not records:
+            return results
+
+        try:
+            if self._pipeline is not None:
+                await self._pipeline.accept_many(records)
+            else:
+                await self._storage.save_records(records)
+                for record in records:
+                    await self._dataset_writer.append(record)
+        except BaseException:
+            for key in reserved:
+                self._dedup_index.release(key)
+            raise
+        for key in reserved:
+            self._dedup_index.commit(key)
+
+        if self._pipeline is None:
+            try:
+                await self._theta_updater.update_many(records)
+            except Exception as error:  # pragma: no cover - защитный путь
+                logger.exception("Не удалось обновить θ на основе пачки отзывов: %s", error)
+        return results
+
 
 async def get_repository(
     storage: Annotated[FeedbackStorage, Depends(get_feedback_storage)],
@@ -49,7 +133,8 @@ async def get_repository(
 ) -> FeedbackRepository:
     """FastAPI dependency constructing a feedback repository instance."""
 
-    return FeedbackRepository(storage, dataset_writer, theta_updater)
+    pipeline = get_feedback_pipeline(storage, dataset_writer, theta_updater) if pipeline_enabled() else None
+    return FeedbackRepository(storage, dataset_writer, theta_updater, get_dedup_index(), pipeline)
 
 
 __all__ = [
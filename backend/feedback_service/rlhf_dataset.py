@@ -1,20 +1,148 @@
-"""Helpers for appending feedback into an RLHF training dataset."""
+"""Helpers for appending feedback into an RLHF training dataset.
+
+Записи копятся в очереди и пишутся одной долгоживущей задачей пачками в
+сегменты ``segment-000001.jsonl[.gz|.zst]`` внутри каталога датасета
+(по умолчанию ``data/rlhf_feedback/``). Сегмент закрывается по размеру или
+возрасту; ``manifest.json`` перечисляет сегменты с числом записей, размером,
+SHA-256 и диапазоном ``created_at``, так что обучение может читать закрытые
+сегменты параллельно. Ошибка записи пачки не теряется: ближайший
+:meth:`RLHFDatasetWriter.flush` поднимает её, и вызывающий (потребитель
+конвейера) повторяет свои записи.
+"""
 
 from __future__ import annotations
 
 import asyncio
+import gzip
+import hashlib
+import importlib
+import io
 import json
+import logging
 import os
+import threading
+import time
 from pathlib import Path
-from typing import Optional
+from typing import IO, Any, Dict, List, Optional
 
 from .schemas import FeedbackRecord
 
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+_SUFFIXES = {"none": ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+def _load_zstandard() -> Any:
+    """Load zstandard lazily; it is only needed for ``compression="zstd"``."""
+
+    return importlib.import_module("zstandard")
+
+
+def segment_directory(dataset_path: Path) -> Path:
+    """Map the legacy ``*.jsonl`` dataset path onto its segment directory."""
+
+    return dataset_path.with_suffix("") if dataset_path.suffix == ".jsonl" else dataset_path
+
+
+def open_segment(path: Path) -> IO[bytes]:
+    """Open a (possibly compressed) segment for binary reading."""
+
+    if path.name.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.name.endswith(".zst"):
+        zstandard = _load_zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(path.open("rb"), read_across_frames=True)
+    return path.open("rb")
+
+
+def read_manifest(directory: Path) -> Dict[str, Any]:
+    try:
+        return json.loads((directory / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {"version": 1, "segments": []}
+
+
+def _count_records(path: Path) -> int:
+    """Count complete lines in a segment, tolerating a torn compressed tail."""
+
+    count = 0
+    try:
+        with open_segment(path) as handle:
+            for line in handle:
+                if line.endswith(b"\n"):
+                    count += 1
+    except FileNotFoundError:
+        return 0
+    except (EOFError, OSError) as error:
+        logger.warning("Сегмент %s оборван: %s", path.name, error)
+    return count
+
+
+class _Segment:
+    """Открытый для записи сегмент датасета."""
+
+    def __init__(self, path: Path, compression: str) -> None:
+        self.path = path
+        self.compression = compression
+        self.records = 0
+        self.opened_at = time.monotonic()
+        self.first_created_at: Optional[str] = None
+        self.last_created_at: Optional[str] = None
+        self._raw = path.open("xb")
+        self._stream: IO[bytes]
+        if compression == "gzip":
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        elif compression == "zstd":
+            self._stream = _load_zstandard().ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+
+    @property
+    def size(self) -> int:
+        return self._raw.tell()
+
+    def write(self, lines: List[bytes], created: List[str]) -> None:
+        self._stream.write(b"".join(lines))
+        self._stream.flush()
+        self._raw.flush()
+        self.records += len(lines)
+        if self.first_created_at is None:
+            self.first_created_at = min(created)
+        self.last_created_at = max(created + [self.last_created_at or ""])
+
+    def entry(self) -> Dict[str, Any]:
+        return {
+            "name": self.path.name,
+            "records": self.records,
+            "compression": self.compression,
+            "first_created_at": self.first_created_at,
+            "last_created_at": self.last_created_at,
+            "sealed": False,
+        }
+
+    def close(self) -> None:
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+
 
 class RLHFDatasetWriter:
-    """Append feedback records into a JSONL dataset for RLHF pipelines."""
+    """Append feedback records into rotating JSONL segments for RLHF pipelines."""
 
-    def __init__(self, dataset_path: Optional[Path] = None) -> None:
+    def __init__(
+        self,
+        dataset_path: Optional[Path] = None,
+        *,
+        segment_bytes: int = 64 * 1024 * 1024,
+        segment_seconds: float = 3600.0,
+        compression: str = "none",
+        batch_size: int = 256,
+        flush_interval: float = 0.05,
+        max_queue: int = 10_000,
+    ) -> None:
         default_path = Path("data/rlhf_feedback.jsonl")
         if dataset_path is not None:
             path = dataset_path
@@ -22,38 +150,236 @@ class RLHFDatasetWriter:
             env_path = os.getenv("RLHF_DATASET_PATH")
             path = Path(env_path) if env_path else default_path
 
-        path.parent.mkdir(parents=True, exist_ok=True)
-        self._path = path
+        if compression not in _SUFFIXES:
+            raise ValueError(f"Неизвестный тип сжатия: {compression}")
+        self._directory = segment_directory(path)
+        self._segment_bytes = max(1, segment_bytes)
+        self._segment_seconds = segment_seconds
+        self._compression = compression
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = max(0.0, flush_interval)
+        self._max_queue = max_queue
+        self._queue: Optional[asyncio.Queue[Dict[str, Any]]] = None
+        self._worker: Optional[asyncio.Task[None]] = None
+        self._segment: Optional[_Segment] = None
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._io_lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
 
     async def append(self, record: FeedbackRecord) -> None:
-        """Append the supplied feedback record to the dataset file."""
-
-        payload = {
-            "id": str(record.id),
-            "conversation_id": record.conversation_id,
-            "message_id": record.message_id,
-            "rating": record.rating.value,
-            "assistant_message": record.assistant_message,
-            "user_message": record.user_message,
-            "comment": record.comment,
-            "mode": record.mode,
-            "created_at": record.created_at.isoformat(),
-        }
+        """Queue the supplied feedback record; waits only when the queue is full."""
+
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_queue)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run(self._queue))
+        await self._queue.put(record.to_json())
+
+    async def flush(self) -> None:
+        """Wait until every queued record has been written to the current segment.
+
+        Raises the first write error since the previous ``flush``: the records
+        of the failed batch were not written and must be appended again.
+        """
+
+        if self._queue is not None:
+            await self._queue.join()
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    async def rotate(self) -> None:
+        """Seal the current segment so that readers can pick it up."""
+
+        await self.flush()
+        await asyncio.to_thread(self._seal)
+
+    async def close(self) -> None:
+        """Drain the queue, stop the writer task and seal the open segment."""
+
+        try:
+            await self.flush()
+        except Exception as error:
+            logger.error("RLHF-датасет закрывается с недописанными записями: %s", error)
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._queue = None
+        await asyncio.to_thread(self._seal)
+
+    async def _run(self, queue: "asyncio.Queue[Dict[str, Any]]") -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Пока сегмент открыт, ждём не дольше его срока: простаивающий писатель тоже закрывает сегмент.
+                batch = [await asyncio.wait_for(queue.get(), self._segment_ttl())]
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self._seal_if_expired)
+                continue
+            deadline = loop.time() + self._flush_interval
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as error:
+                logger.error("Не удалось записать %d записей RLHF: %s", len(batch), error)
+                if self._error is None:
+                    self._error = error
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    def _segment_ttl(self) -> Optional[float]:
+        segment = self._segment
+        if segment is None:
+            return None
+        return max(0.0, segment.opened_at + self._segment_seconds - time.monotonic())
+
+    def _seal_if_expired(self) -> None:
+        with self._io_lock:
+            segment = self._segment
+            if segment is not None and time.monotonic() - segment.opened_at >= self._segment_seconds:
+                self._seal_locked()
 
-        await asyncio.to_thread(self._append_sync, payload)
+    def _write_batch(self, payloads: List[Dict[str, Any]]) -> None:
+        with self._io_lock:
+            self._write_batch_locked(payloads)
 
-    def _append_sync(self, payload: dict[str, object]) -> None:
-        with self._path.open("a", encoding="utf-8") as handle:
-            handle.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    def _write_batch_locked(self, payloads: List[Dict[str, Any]]) -> None:
+        segment = self._segment
+        if segment is not None and (
+            segment.size >= self._segment_bytes
+            or time.monotonic() - segment.opened_at >= self._segment_seconds
+        ):
+            self._seal_locked()
+            segment = None
+        if segment is None:
+            segment = self._open_segment()
+        lines = [(json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8") for payload in payloads]
+        segment.write(lines, [str(payload["created_at"]) for payload in payloads])
 
+    def _load_manifest(self) -> Dict[str, Any]:
+        if self._manifest is None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            self._manifest = read_manifest(self._directory)
+            for entry in self._manifest["segments"]:
+                if not entry.get("sealed"):
+                    # Сегмент остался открытым после падения процесса — закрываем как есть.
+                    path = self._directory / entry["name"]
+                    entry["records"] = _count_records(path)
+                    self._finalise_entry(entry, path)
+            self._write_manifest()
+        return self._manifest
 
-_dataset_writer = RLHFDatasetWriter()
+    def _open_segment(self) -> _Segment:
+        manifest = self._load_manifest()
+        index = int(manifest.get("next_index", 1))
+        manifest["next_index"] = index + 1
+        name = f"segment-{index:06d}{_SUFFIXES[self._compression]}"
+        self._segment = _Segment(self._directory / name, self._compression)
+        manifest["segments"].append(self._segment.entry())
+        self._write_manifest()
+        return self._segment
+
+    def _seal(self) -> None:
+        with self._io_lock:
+            self._seal_locked()
+
+    def _seal_locked(self) -> None:
+        segment = self._segment
+        if segment is None:
+            return
+        self._segment = None
+        segment.close()
+        entry = segment.entry()
+        self._finalise_entry(entry, segment.path)
+        self._update_manifest(entry)
+
+    def _finalise_entry(self, entry: Dict[str, Any], path: Path) -> None:
+        digest = hashlib.sha256()
+        try:
+            with path.open("rb") as handle:
+                for chunk in iter(lambda: handle.read(1 << 20), b""):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            entry["missing"] = True
+        entry["sha256"] = digest.hexdigest()
+        entry["bytes"] = path.stat().st_size if path.exists() else 0
+        entry["sealed"] = True
+
+    def _update_manifest(self, entry: Dict[str, Any]) -> None:
+        manifest = self._load_manifest()
+        segments = manifest["segments"]
+        for idx, existing in enumerate(segments):
+            if existing["name"] == entry["name"]:
+                segments[idx] = entry
+                break
+        else:
+            segments.append(entry)
+        self._write_manifest()
+
+    def _write_manifest(self) -> None:
+        assert self._manifest is not None
+        tmp_path = self._directory / f".{MANIFEST_NAME}.tmp"
+        with io.open(tmp_path, "w", encoding="utf-8") as handle:
+            json.dump(self._manifest, handle, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._directory / MANIFEST_NAME)
+
+
+_dataset_writer: Optional[RLHFDatasetWriter] = None
+
+
+def _create_writer_from_env() -> RLHFDatasetWriter:
+    return RLHFDatasetWriter(
+        segment_bytes=int(float(os.getenv("RLHF_SEGMENT_MB", "64")) * 1024 * 1024),
+        segment_seconds=float(os.getenv("RLHF_SEGMENT_SECONDS", "3600")),
+        compression=os.getenv("RLHF_COMPRESSION", "none"),
+    )
 
 
 async def get_dataset_writer() -> RLHFDatasetWriter:
     """FastAPI dependency returning a shared dataset writer."""
 
+    global _dataset_writer
+    if _dataset_writer is None:
+        _dataset_writer = _create_writer_from_env()
     return _dataset_writer
 
 
-__all__ = ["RLHFDatasetWriter", "get_dataset_writer"]
+async def shutdown_dataset_writer() -> None:
+    """Flush and seal the shared writer during application shutdown."""
+
+    global _dataset_writer
+    if _dataset_writer is not None:
+        await _dataset_writer.close()
+        _dataset_writer = None
+
+
+__all__ = [
+    "MANIFEST_NAME",
+    "RLHFDatasetWriter",
+    "get_dataset_writer",
+    "open_segment",
+    "read_manifest",
+    "segment_directory",
+    "shutdown_dataset_writer",
+]
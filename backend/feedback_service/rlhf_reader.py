@@ -0,0 +1,280 @@
+"""Потоковое чтение RLHF-датасета и сборка пар предпочтений.
+
+:func:`iter_feedback` читает сегменты, записанные
+:class:`~backend.feedback_service.rlhf_dataset.RLHFDatasetWriter` (и старый
+единый ``rlhf_feedback.jsonl``, если он остался), построчно: память не зависит
+от размера датасета, кроме множества 8-байтовых отпечатков ``message_id`` для
+дедупликации. Фильтры по дате сначала отсекают целые сегменты по диапазону
+``created_at`` из манифеста.
+
+:func:`build_preference_pairs` раскладывает отзывы по шардам по стабильному хэшу
+``conversation_id``, затем в пуле процессов собирает пары (полезный ответ,
+бесполезный ответ) на один и тот же запрос пользователя и пишет каждый шард
+колонками: для строковой колонки ``<name>.offsets.npy`` (int64, n + 1 смещений)
+и ``<name>.utf8`` (склеенные байты). Файлы ``.npy`` читаются ``numpy.load``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import sys
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterator, List, Optional, Sequence
+
+from .rlhf_dataset import open_segment, read_manifest, segment_directory
+
+logger = logging.getLogger(__name__)
+
+PAIR_COLUMNS = ("conversation_id", "prompt", "chosen", "rejected", "chosen_message_id", "rejected_message_id")
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def dataset_files(dataset_path: Path, *, since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Path]:
+    """Возвращает файлы датасета по порядку записи, отбрасывая сегменты вне окна дат."""
+
+    files: List[Path] = []
+    if dataset_path.suffix == ".jsonl" and dataset_path.is_file():
+        files.append(dataset_path)
+    directory = segment_directory(dataset_path)
+    for entry in read_manifest(directory)["segments"]:
+        first = _parse_time(entry.get("first_created_at"))
+        last = _parse_time(entry.get("last_created_at"))
+        if since is not None and last is not None and last < since:
+            continue
+        if until is not None and first is not None and first >= until:
+            continue
+        path = directory / entry["name"]
+        if path.exists():
+            files.append(path)
+    return files
+
+
+def iter_segment(path: Path) -> Iterator[Dict[str, Any]]:
+    """Выдаёт полные строки одного файла датасета; оборванный хвост пропускается."""
+
+    try:
+        with open_segment(path) as handle:
+            for line in handle:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning("Пропускаем повреждённую строку в %s", path.name)
+    except EOFError:
+        logger.warning("Сегмент %s оборван; прочитаны только полные строки", path.name)
+
+
+def iter_feedback(
+    dataset_path: Path | str = Path("data/rlhf_feedback.jsonl"),
+    *,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    modes: Optional[Collection[Optional[str]]] = None,
+    ratings: Optional[Collection[str]] = None,
+    dedup: bool = True,
+) -> Iterator[Dict[str, Any]]:
+    """Лениво выдаёт записи датасета (словари ``FeedbackRecord.to_json``) с фильтрами.
+
+    ``since`` включительно, ``until`` не включительно; при ``dedup`` повторный
+    ``message_id`` пропускается (остаётся первая запись).
+    """
+
+    seen: set[bytes] = set()
+    for path in dataset_files(Path(dataset_path), since=since, until=until):
+        for row in iter_segment(path):
+            if ratings is not None and row.get("rating") not in ratings:
+                continue
+            if modes is not None and row.get("mode") not in modes:
+                continue
+            if since is not None or until is not None:
+                created = _parse_time(row.get("created_at"))
+                if created is None:
+                    continue
+                if since is not None and created < since:
+                    continue
+                if until is not None and created >= until:
+                    continue
+            if dedup:
+                digest = hashlib.blake2b(str(row.get("message_id", "")).encode("utf-8"), digest_size=8).digest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            yield row
+
+
+def shard_of(conversation_id: str, shards: int) -> int:
+    """Стабильный между процессами номер шарда для диалога."""
+
+    digest = hashlib.blake2b(conversation_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % shards
+
+
+def _npy_header(dtype: str, length: int) -> bytes:
+    header = f"{{'descr': '{dtype}', 'fortran_order': False, 'shape': ({length},), }}"
+    # Формат .npy 1.0: магия, версия, длина заголовка; данные выровнены на 64 байта.
+    padding = 64 - (10 + len(header) + 1) % 64
+    header = header + " " * padding + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+def write_int64_npy(path: Path, values: Sequence[int]) -> None:
+    packed = array("q", values)
+    if sys.byteorder == "big":  # pragma: no cover - формат всегда little-endian
+        packed.byteswap()
+    with path.open("wb") as handle:
+        handle.write(_npy_header("<i8", len(packed)))
+        handle.write(packed.tobytes())
+
+
+def write_string_column(directory: Path, name: str, values: Sequence[str]) -> None:
+    offsets = [0]
+    with (directory / f"{name}.utf8").open("wb") as handle:
+        for value in values:
+            encoded = value.encode("utf-8")
+            handle.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    write_int64_npy(directory / f"{name}.offsets.npy", offsets)
+
+
+def read_string_column(directory: Path, name: str) -> List[str]:
+    """Читает строковую колонку шарда без NumPy."""
+
+    raw = (directory / f"{name}.offsets.npy").read_bytes()
+    (header_length,) = struct.unpack_from("<H", raw, 8)
+    offsets = array("q")
+    offsets.frombytes(raw[10 + header_length :])
+    if sys.byteorder == "big":  # pragma: no cover - формат всегда little-endian
+        offsets.byteswap()
+    data = (directory / f"{name}.utf8").read_bytes()
+    return [data[offsets[idx] : offsets[idx + 1]].decode("utf-8") for idx in range(len(offsets) - 1)]
+
+
+def _pairs_for_shard(partition: Path, output: Path, max_pairs_per_prompt: int) -> Dict[str, int]:
+    groups: Dict[tuple[str, str], Dict[str, List[Dict[str, Any]]]] = {}
+    for row in iter_segment(partition):
+        key = (str(row["conversation_id"]), row.get("user_message") or "")
+        bucket = groups.setdefault(key, {"useful": [], "not_useful": []})
+        if row.get("rating") in bucket:
+            bucket[row["rating"]].append(row)
+
+    columns: Dict[str, List[str]] = {name: [] for name in PAIR_COLUMNS}
+    for (conversation_id, prompt), bucket in sorted(groups.items()):
+        emitted = 0
+        for chosen in bucket["useful"]:
+            for rejected in bucket["not_useful"]:
+                if emitted >= max_pairs_per_prompt:
+                    break
+                columns["conversation_id"].append(conversation_id)
+                columns["prompt"].append(prompt)
+                columns["chosen"].append(chosen["assistant_message"])
+                columns["rejected"].append(rejected["assistant_message"])
+                columns["chosen_message_id"].append(str(chosen["message_id"]))
+                columns["rejected_message_id"].append(str(rejected["message_id"]))
+                emitted += 1
+
+    output.mkdir(parents=True, exist_ok=True)
+    for name, values in columns.items():
+        write_string_column(output, name, values)
+    return {"pairs": len(columns["chosen"]), "groups": len(groups)}
+
+
+def build_preference_pairs(
+    dataset_path: Path | str,
+    output_dir: Path | str,
+    *,
+    shards: int = 8,
+    workers: Optional[int] = None,
+    max_pairs_per_prompt: int = 16,
+    **filters: Any,
+) -> Dict[str, Any]:
+    """Собирает пары предпочтений в ``output_dir/shard-XXXX`` и пишет ``pairs.json``."""
+
+    output = Path(output_dir)
+    partitions = output / ".partitions"
+    partitions.mkdir(parents=True, exist_ok=True)
+    handles = [(partitions / f"part-{index:04d}.jsonl").open("w", encoding="utf-8") for index in range(shards)]
+    records = 0
+    try:
+        for row in iter_feedback(dataset_path, **filters):
+            handles[shard_of(str(row["conversation_id"]), shards)].write(
+                json.dumps(row, ensure_ascii=False) + "\n"
+            )
+            records += 1
+    finally:
+        for handle in handles:
+            handle.close()
+
+    jobs = [
+        (partitions / f"part-{index:04d}.jsonl", output / f"shard-{index:04d}", max_pairs_per_prompt)
+        for index in range(shards)
+    ]
+    if workers == 1 or shards == 1:
+        results = [_pairs_for_shard(*job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or min(shards, os.cpu_count() or 1)) as pool:
+            results = list(pool.map(_pairs_for_shard, *zip(*jobs)))
+    shutil.rmtree(partitions, ignore_errors=True)
+
+    summary = {
+        "records": records,
+        "columns": list(PAIR_COLUMNS),
+        "shards": [{"name": f"shard-{index:04d}", **result} for index, result in enumerate(results)],
+    }
+    (output / "pairs.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    return summary
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build RLHF preference pairs from feedback segments")
+    parser.add_argument("--dataset", default=os.getenv("RLHF_DATASET_PATH", "data/rlhf_feedback.jsonl"))
+    parser.add_argument("--out", required=True, help="output directory for pair shards")
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--since", type=_parse_time, default=None, help="ISO date, inclusive")
+    parser.add_argument("--until", type=_parse_time, default=None, help="ISO date, exclusive")
+    parser.add_argument("--mode", action="append", dest="modes", default=None)
+    args = parser.parse_args(argv)
+
+    summary = build_preference_pairs(
+        args.dataset,
+        args.out,
+        shards=args.shards,
+        workers=args.workers,
+        since=args.since,
+        until=args.until,
+        modes=args.modes,
+    )
+    print(json.dumps({"records": summary["records"], "pairs": sum(s["pairs"] for s in summary["shards"])}))
+    return 0
+
+
+__all__ = [
+    "PAIR_COLUMNS",
+    "build_preference_pairs",
+    "dataset_files",
+    "iter_feedback",
+    "iter_segment",
+    "read_string_column",
+    "shard_of",
+    "write_string_column",
+]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
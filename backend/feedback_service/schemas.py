@@ -6,7 +6,7 @@ from dataclasses import dataclass
 import sys
 from datetime import datetime, timezone
 from enum import Enum
-from typing import Literal, Optional
+from typing import Any, Literal, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field, field_validator
@@ -51,6 +51,25 @@ class FeedbackResponse(BaseModel):
     """Response returned by the API after successful persistence."""
 
     status: Literal["ok"] = "ok"
+    duplicate: bool = False
+
+
+class FeedbackBatchItem(BaseModel):
+    """Outcome for one element of a bulk submission, in request order."""
+
+    index: int
+    status: Literal["accepted", "duplicate", "invalid", "error"]
+    id: Optional[UUID] = None
+    error: Optional[str] = None
+
+
+class FeedbackBatchResponse(BaseModel):
+    """Response of ``POST /api/feedback/batch``."""
+
+    accepted: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    items: list[FeedbackBatchItem] = Field(default_factory=list)
 
 
 # Python 3.10+ поддерживает slots в dataclass; на более старших версиях используем обычный декоратор.
@@ -97,8 +116,41 @@ class FeedbackRecord:
             created_at=created_at or datetime.now(timezone.utc),
         )
 
+    def to_json(self) -> dict[str, Optional[str]]:
+        """Serialise the record into a JSON-compatible mapping."""
+
+        return {
+            "id": str(self.id),
+            "conversation_id": self.conversation_id,
+            "message_id": self.message_id,
+            "rating": self.rating.value,
+            "assistant_message": self.assistant_message,
+            "user_message": self.user_message,
+            "comment": self.comment,
+            "mode": self.mode,
+            "created_at": self.created_at.isoformat(),
+        }
+
+    @classmethod
+    def from_json(cls, payload: dict[str, Any]) -> "FeedbackRecord":
+        """Restore a record produced by :meth:`to_json`."""
+
+        return cls(
+            id=UUID(str(payload["id"])),
+            conversation_id=str(payload["conversation_id"]),
+            message_id=str(payload["message_id"]),
+            rating=FeedbackRating(payload["rating"]),
+            assistant_message=str(payload["assistant_message"]),
+            user_message=payload.get("user_message"),
+            comment=payload.get("comment"),
+            mode=payload.get("mode"),
+            created_at=datetime.fromisoformat(str(payload["created_at"])),
+        )
+
 
 __all__ = [
+    "FeedbackBatchItem",
+    "FeedbackBatchResponse",
     "FeedbackPayload",
     "FeedbackRating",
     "FeedbackRecord",
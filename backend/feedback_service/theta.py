@@ -7,15 +7,21 @@ import json
 import logging
 import math
 import os
-import random
-import struct
+import threading
+import time
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Final, List, TYPE_CHECKING
+from typing import Any, Callable, Final, List, Optional, Sequence, Tuple, TYPE_CHECKING
 
-from core.memory import LongTermMemory
+import numpy as np
+
+from core.memory import ConversationEmbeddingCache, LongTermMemory
 from core.representations import SymbolicEmbeddingSpace
 
+from .diagnostics import GradientDiagnostics
+from .theta_cache import publish_theta
+from .theta_store import ThetaWAL, decode_snapshot, encode_snapshot, write_atomic
+
 if TYPE_CHECKING:  # pragma: no cover - подсказки типов на этапе разработки
     from .schemas import FeedbackRecord
 else:
@@ -23,13 +29,83 @@ else:
 
 logger = logging.getLogger(__name__)
 
-try:
-    _EMBEDDING_SPACE = SymbolicEmbeddingSpace()
-    _LTM = LongTermMemory(_EMBEDDING_SPACE)
-except Exception as error:  # pragma: no cover - защитный путь на случай импортных ошибок
-    logger.warning("LongTermMemory недоступна: %s", error)
-    _EMBEDDING_SPACE = None
-    _LTM = None
+# (inode, mtime_ns, size) снимка и WAL; ``None`` — файла нет.
+_DiskSignature = Tuple[Optional[Tuple[int, int, int]], Optional[Tuple[int, int, int]]]
+
+_UNLOADED: Final = object()
+_LTM: Any = _UNLOADED
+_LTM_LOCK = threading.Lock()
+
+
+def get_long_term_memory() -> LongTermMemory | None:
+    """Возвращает общую долговременную память, загружая её при первом обращении.
+
+    Импорт модуля файл памяти не читает: его разбор стоит пропорционально
+    размеру ``data/long_term_memory.jsonl`` (путь задаёт ``KNP_LTM_PATH``) и
+    нужен только процессу, который действительно обрабатывает отзывы.
+    """
+
+    global _LTM
+
+    if _LTM is not _UNLOADED:
+        return _LTM
+    with _LTM_LOCK:
+        if _LTM is _UNLOADED:
+            try:
+                _LTM = LongTermMemory(SymbolicEmbeddingSpace(), path=os.getenv("KNP_LTM_PATH") or None)
+            except Exception as error:  # pragma: no cover - защитный путь на случай ошибок загрузки
+                logger.warning("LongTermMemory недоступна: %s", error)
+                _LTM = None
+    return _LTM
+
+
+async def warm_long_term_memory() -> LongTermMemory | None:
+    """Загружает долговременную память в потоке, не блокируя цикл событий."""
+
+    if _LTM is not _UNLOADED:
+        return _LTM
+    return await asyncio.to_thread(get_long_term_memory)
+
+
+def basis_matrix(signals: np.ndarray, n_theta: int) -> np.ndarray:
+    """Векторная версия ``ThetaUpdater._basis_values`` для массива сигналов."""
+
+    count = signals.shape[0]
+    basis = np.zeros((count, max(n_theta, 0)), dtype=np.float64)
+    if n_theta <= 0:
+        return basis
+    basis[:, 0] = signals
+    if n_theta == 1:
+        return basis
+    kmax = (n_theta - 1) // 2
+    z = 2.0 * signals - 1.0
+    t_prev, t_curr = np.ones_like(z), z
+    column = 1
+    for k in range(1, kmax + 1):
+        if k > 1:
+            t_prev, t_curr = t_curr, 2.0 * z * t_curr - t_prev
+        basis[:, column] = t_curr
+        column += 1
+        if column >= n_theta:
+            return basis
+        basis[:, column] = np.sin(np.pi * k * signals)
+        column += 1
+        if column >= n_theta:
+            return basis
+    basis[:, column] = 1.0  # свободный член
+    return basis
+
+
+def _fit_columns(features: np.ndarray, dimension: int) -> np.ndarray:
+    """Обрезает или дополняет нулями столбцы матрицы признаков до ``dimension``."""
+
+    if features.shape[1] >= dimension:
+        return features[:, :dimension]
+    return np.pad(features, ((0, 0), (0, dimension - features.shape[1])))
+
+
+# Столбцы признаков записи в порядке, в котором их читает _apply_batch.
+_METRICS: Final = ("assistant_length", "user_component", "mode_component", "context_strength", "signal")
 
 
 @dataclass
@@ -60,6 +136,16 @@ class ThetaUpdater:
         l2: float = 1e-3,
         clip: float = 2.5,
         max_theta: int = 16,
+        batch_size: int = 1,
+        batch_interval: float = 0.05,
+        max_queue: int = 10_000,
+        persist_every: int = 32,
+        persist_interval: float = 1.0,
+        wal_fsync: bool = False,
+        exports: Sequence[str] = ("json", "csv"),
+        diagnostics_every: int = 0,
+        context_mode: str = "ltm",
+        memory_flush_interval: float = 0.05,
     ) -> None:
         self._path = self._resolve_path(path)
         self._csv_path = self._path.with_suffix(".csv")
@@ -74,6 +160,27 @@ class ThetaUpdater:
         self._lock: asyncio.Lock | None = None
         self._state: ThetaState | None = None
         self._bin_path = self._path.with_suffix(".bin")
+        self._wal = ThetaWAL(self._path.with_suffix(".wal"), fsync=wal_fsync)
+        self._exports = tuple(exports)
+        self._batch_size = max(1, batch_size)
+        self._batch_interval = max(0.0, batch_interval)
+        self._max_queue = max_queue
+        self._persist_every = max(1, persist_every)
+        self._persist_interval = max(0.0, persist_interval)
+        self._pending_persist = 0
+        self._last_persist = time.monotonic()
+        self._persist_lock = asyncio.Lock()
+        self._queue: asyncio.Queue[FeedbackRecord] | None = None
+        self._worker: asyncio.Task[None] | None = None
+        self._persist_timer: asyncio.Task[None] | None = None
+        self._diagnostics = GradientDiagnostics(every=diagnostics_every)
+        self._context_mode = context_mode
+        self._conversations = ConversationEmbeddingCache()
+        self._memory_buffer: List[tuple[str, dict[str, str]]] = []
+        self._memory_flush: asyncio.Task[None] | None = None
+        self._memory_flush_interval = max(0.0, memory_flush_interval)
+        self._listeners: List[Callable[[], None]] = []
+        self._disk_signature: _DiskSignature | None = None
 
     @staticmethod
     def _resolve_path(path: Path | None) -> Path:
@@ -88,11 +195,55 @@ class ThetaUpdater:
 
     async def _ensure_state(self) -> ThetaState:
         if self._state is None:
-            state = await asyncio.to_thread(self._load_state_sync)
-            self._state = self._normalise_state(state)
+            self._state = await asyncio.to_thread(self._recover_state_sync)
         return self._state
 
+    def _disk_signature_sync(self) -> _DiskSignature:
+        signature = []
+        for path in (self._bin_path, self._wal.path):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                signature.append(None)
+            else:
+                signature.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        return signature[0], signature[1]
+
+    def _recover_state_sync(self) -> ThetaState:
+        """Загружает последний снимок и повторяет поверх него кадры WAL."""
+
+        # Подпись снимается до чтения: запись, пришедшая во время чтения, заметна в следующей проверке.
+        self._disk_signature = self._disk_signature_sync()
+        state = self._normalise_state(self._load_state_sync())
+        replayed = 0
+        for base_updates, learning_rate, items in self._wal.read():
+            if base_updates < state.updates:
+                continue
+            self._apply_batch(state, items, learning_rate=learning_rate, sample_diagnostics=False)
+            replayed += len(items)
+        if replayed:
+            logger.info("θ восстановлена из WAL: %d обновлений поверх снимка", replayed)
+        return state
+
     def _load_state_sync(self) -> ThetaState:
+        try:
+            snapshot = decode_snapshot(self._bin_path.read_bytes())
+        except FileNotFoundError:
+            pass
+        except ValueError as error:
+            logger.warning("Снимок θ %s повреждён, читаем JSON: %s", self._bin_path, error)
+        else:
+            return ThetaState(
+                theta=snapshot.theta,
+                pi=snapshot.pi,
+                rho=snapshot.rho,
+                updates=snapshot.updates,
+                ema_reward=snapshot.ema_reward,
+                sigma=snapshot.sigma,
+            )
+        return self._load_json_sync()
+
+    def _load_json_sync(self) -> ThetaState:
         try:
             with self._path.open("r", encoding="utf-8") as handle:
                 payload = json.load(handle)
@@ -167,75 +318,325 @@ class ThetaUpdater:
         state.sigma = max(0.01, min(state.sigma, 1.0))
         return state
 
-    def _save_state_sync(self, state: ThetaState) -> None:
-        data = {
-            "theta": state.theta,
-            "pi": state.pi,
-            "rho": state.rho,
-            "updates": state.updates,
-            "ema_reward": state.ema_reward,
-            "sigma": state.sigma,
-        }
-        self._path.parent.mkdir(parents=True, exist_ok=True)
-        with self._path.open("w", encoding="utf-8") as handle:
-            json.dump(data, handle, ensure_ascii=False, indent=2)
-        csv_parts = [
-            "θ:" + ",".join(f"{value:.12g}" for value in state.theta),
-            "π:" + ",".join(f"{value:.12g}" for value in state.pi),
-            "ρ:" + ",".join(f"{value:.12g}" for value in state.rho),
-            f"σ:{state.sigma:.12g}",
-        ]
-        csv_line = "\n".join(csv_parts) + "\n"
-        with self._csv_path.open("w", encoding="utf-8") as handle:
-            handle.write(csv_line)
+    def _save_state_sync(self, state: ThetaState, *, reset_wal: bool = False) -> None:
+        snapshot = encode_snapshot(
+            state.theta,
+            state.pi,
+            state.rho,
+            updates=state.updates,
+            ema_reward=state.ema_reward,
+            sigma=state.sigma,
+        )
+        write_atomic(self._bin_path, snapshot)
+        if reset_wal:
+            self._wal.reset()
+        else:
+            self._wal.compact(state.updates)
+        self._disk_signature = self._disk_signature_sync()
         try:
-            with self._bin_path.open("wb") as handle:
-                for value in state.theta + state.pi + state.rho + [state.sigma]:
-                    handle.write(struct.pack("<d", value))
+            self._write_exports_sync(state, self._exports)
         except OSError as error:
-            logger.warning("Не удалось записать params.bin: %s", error)
+            logger.warning("Не удалось обновить экспорт θ: %s", error)
+
+    def _write_exports_sync(self, state: ThetaState, formats: Sequence[str]) -> None:
+        if "json" in formats:
+            data = {
+                "theta": state.theta,
+                "pi": state.pi,
+                "rho": state.rho,
+                "updates": state.updates,
+                "ema_reward": state.ema_reward,
+                "sigma": state.sigma,
+            }
+            payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+            write_atomic(self._path, payload.encode("utf-8"), fsync=False)
+        if "csv" in formats:
+            csv_parts = [
+                "θ:" + ",".join(f"{value:.12g}" for value in state.theta),
+                "π:" + ",".join(f"{value:.12g}" for value in state.pi),
+                "ρ:" + ",".join(f"{value:.12g}" for value in state.rho),
+                f"σ:{state.sigma:.12g}",
+            ]
+            csv_line = "\n".join(csv_parts) + "\n"
+            write_atomic(self._csv_path, csv_line.encode("utf-8"), fsync=False)
+
+    async def export(self, formats: Sequence[str] = ("json", "csv")) -> None:
+        """Выгружает текущее состояние в JSON/CSV по запросу (например, для отладки)."""
+
+        lock = await self._ensure_lock()
+        async with lock:
+            state = self._copy_state(await self._ensure_state())
+        await asyncio.to_thread(self._write_exports_sync, state, tuple(formats))
 
     async def update(self, record: FeedbackRecord) -> None:
-        """Обновляет θ, не прерывая обработку запроса даже при ошибках."""
+        """Обновляет θ, не прерывая обработку запроса даже при ошибках.
+
+        В режиме мини-батчей (``batch_size > 1``) запись только ставится в очередь,
+        а градиентный шаг выполняет фоновая задача.
+        """
+
+        if self._batch_size > 1:
+            await self._enqueue(record)
+            return
 
+        item = await self._prepare_item(record)
+        if item is None:
+            return
         lock = await self._ensure_lock()
         async with lock:
             state = await self._ensure_state()
-            theta = state.theta
-            n_theta = len(theta)
-            signal, metrics = self._collect_features(record)
-            basis = self._basis_values(signal, n_theta)
-            reward = self._extract_reward(record)
-            if reward == 0.0:
-                logger.debug("Пропускаем обновление θ: неопознанный рейтинг %r", getattr(record, "rating", None))
-                return
             self._record_memory(record)
-            prediction = sum(value * feature for value, feature in zip(theta, basis))
+            await self._log_batch(state, [item])
+            self._apply_batch(state, [item])
+            publish_theta(self._csv_path, state.theta)
+            snapshot = self._mark_dirty(state, 1)
+        self._notify_listeners()
+        await self._persist_if_due(snapshot)
+
+    async def update_many(self, records: Sequence[FeedbackRecord]) -> None:
+        """Обновляет θ по пачке записей одним шагом (одна блокировка и один кадр WAL)."""
+
+        if not records:
+            return
+        if self._batch_size > 1:
+            for record in records:
+                await self._enqueue(record)
+            return
+        await self._apply_records(list(records))
+
+    async def flush(self) -> None:
+        """Применяет записи из очереди и сохраняет накопленные изменения на диск."""
+
+        if self._queue is not None:
+            await self._queue.join()
+        lock = await self._ensure_lock()
+        async with lock:
+            if self._state is None or self._pending_persist == 0:
+                return
+            snapshot = self._snapshot_for_persist(self._state)
+        await self._write_snapshot(snapshot)
+
+    async def aclose(self) -> None:
+        """Финальный сброс на остановке: очередь, отложенное сохранение и фоновые задачи."""
+
+        await self.flush()
+        for task in (self._worker, self._persist_timer):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._worker = None
+        self._persist_timer = None
+        self._queue = None
+        if self._memory_flush is not None:
+            await self._memory_flush
+            self._memory_flush = None
+        await self._diagnostics.aclose()
+
+    def diagnostics(self) -> dict[str, object]:
+        """Снимок метрик фоновой диагностики градиента."""
+
+        return self._diagnostics.snapshot()
+
+    async def _enqueue(self, record: FeedbackRecord) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_queue)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._batch_worker())
+        await self._queue.put(record)
+
+    async def _batch_worker(self) -> None:
+        queue = self._queue
+        assert queue is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self._batch_interval
+            while len(batch) < self._batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._apply_records(batch)
+            except Exception as error:  # pragma: no cover - защитный путь
+                logger.exception("Не удалось применить батч θ: %s", error)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _apply_records(self, records: List[FeedbackRecord]) -> None:
+        prepared = await asyncio.gather(*(self._prepare_item(record) for record in records))
+        accepted = [(record, item) for record, item in zip(records, prepared) if item is not None]
+        if not accepted:
+            return
+        lock = await self._ensure_lock()
+        async with lock:
+            state = await self._ensure_state()
+            items = []
+            for record, item in accepted:
+                self._record_memory(record)
+                items.append(item)
+            await self._log_batch(state, items)
+            self._apply_batch(state, items)
+            publish_theta(self._csv_path, state.theta)
+            snapshot = self._mark_dirty(state, len(items))
+        self._notify_listeners()
+        await self._persist_if_due(snapshot)
+
+    async def _prepare_item(self, record: FeedbackRecord) -> tuple[float, dict[str, float]] | None:
+        """Считает признаки записи вне блокировки θ (поиск в памяти идёт в её потоке)."""
+
+        reward = self._extract_reward(record)
+        if reward == 0.0:
+            logger.debug("Пропускаем обновление θ: неопознанный рейтинг %r", getattr(record, "rating", None))
+            return None
+        context_strength = await self._context_strength(record)
+        _, metrics = self._collect_features(record, context_strength=context_strength)
+        return reward, metrics
+
+    async def _context_strength(self, record: FeedbackRecord) -> float:
+        assistant_text = getattr(record, "assistant_message", "") or ""
+        if not assistant_text or self._context_mode == "off":
+            return 0.0
+        memory = await warm_long_term_memory()
+        if memory is None:
+            return 0.0
+        if self._context_mode == "conversation":
+            conversation_id = str(getattr(record, "conversation_id", ""))
+            embedding = await memory.aembed(assistant_text)
+            strength = max(0.0, self._conversations.similarity(conversation_id, embedding))
+            self._conversations.add(conversation_id, embedding)
+            return strength
+        matches = await memory.aquery(assistant_text, top_k=3)
+        if not matches:
+            return 0.0
+        return sum(max(0.0, score) for _, score in matches) / len(matches)
+
+    def _apply_batch(
+        self,
+        state: ThetaState,
+        items: List[tuple[float, dict[str, float]]],
+        *,
+        learning_rate: float | None = None,
+        sample_diagnostics: bool = True,
+    ) -> None:
+        """Один градиентный шаг по батчу: градиенты усредняются по всем записям.
+
+        Признаки батча собираются в матрицы, и шаг считается в NumPy без цикла
+        по записям; для батча из одной записи результат совпадает с
+        поэлементным обновлением.
+        """
+
+        if learning_rate is None:
             learning_rate = self._effective_learning_rate(state.updates)
-            error = reward - prediction
-
-            self._apply_vector_update(theta, basis, error, learning_rate)
-            pi_features = self._pi_features(metrics, reward, len(state.pi))
-            rho_features = self._rho_features(metrics, reward, prediction, error, state)
-            if state.pi:
-                self._apply_vector_update(state.pi, pi_features, reward, learning_rate * 0.6)
-            if state.rho:
-                self._apply_vector_update(state.rho, rho_features, reward, learning_rate * 0.4)
-
-            self._gradient_consistency(basis, error, state)
-            state.sigma = max(0.05, state.sigma * 0.995)
-
-            state.ema_reward = 0.9 * state.ema_reward + 0.1 * reward
-            state.updates += 1
-
-            await asyncio.to_thread(self._save_state_sync, state)
-            logger.debug(
-                "theta обновлена: updates=%d reward=%.3f lr=%.5f -> %s",
-                state.updates,
-                reward,
-                learning_rate,
-                ",".join(f"{value:.4f}" for value in theta),
-            )
+        count = len(items)
+        rewards = np.fromiter((reward for reward, _ in items), dtype=np.float64, count=count)
+        metrics = np.array([[values.get(name, 0.0) for name in _METRICS] for _, values in items], dtype=np.float64)
+        assistant, user, mode, context, signal = metrics.T
+
+        theta = np.asarray(state.theta, dtype=np.float64)
+        basis = basis_matrix(signal, theta.size)
+        prediction = basis @ theta
+        error = rewards - prediction
+        pi_features = _fit_columns(np.column_stack([assistant, user, mode, context, signal, rewards]), len(state.pi))
+        rho_features = _fit_columns(
+            np.column_stack([rewards, error, prediction, context, np.full(count, state.sigma), signal, np.ones(count)]),
+            len(state.rho),
+        )
+        if sample_diagnostics and self._diagnostics.enabled:
+            for row, value in zip(basis.tolist(), error.tolist()):
+                self._diagnostics.sample(row, value, state.sigma)
+
+        state.theta = self._step(theta, basis.T @ error / count, learning_rate)
+        if state.pi:
+            state.pi = self._step(np.asarray(state.pi), pi_features.T @ rewards / count, learning_rate * 0.6)
+        if state.rho:
+            state.rho = self._step(np.asarray(state.rho), rho_features.T @ rewards / count, learning_rate * 0.4)
+
+        # σ и EMA награды — те же рекуррентные шаги по записям, записанные в замкнутой форме.
+        state.sigma = max(0.05, state.sigma * 0.995**count)
+        weights = 0.1 * 0.9 ** np.arange(count - 1, -1, -1, dtype=np.float64)
+        state.ema_reward = float(0.9**count * state.ema_reward + weights @ rewards)
+        state.updates += count
+        logger.debug(
+            "theta обновлена: updates=%d batch=%d lr=%.5f -> %s",
+            state.updates,
+            count,
+            learning_rate,
+            ",".join(f"{value:.4f}" for value in state.theta),
+        )
+
+    def _step(self, vector: np.ndarray, gradient: np.ndarray, lr: float) -> List[float]:
+        return np.clip(vector * (1.0 - lr * self._l2) + lr * gradient, -self._clip, self._clip).tolist()
+
+    async def _log_batch(self, state: ThetaState, items: List[tuple[float, dict[str, float]]]) -> None:
+        # Запись идёт в потоке: ThetaWAL.compact() может держать блокировку WAL в потоке сохранения.
+        learning_rate = self._effective_learning_rate(state.updates)
+        await asyncio.to_thread(self._append_wal_sync, state.updates, learning_rate, items)
+
+    def _append_wal_sync(
+        self, base_updates: int, learning_rate: float, items: List[tuple[float, dict[str, float]]]
+    ) -> None:
+        self._wal.append(base_updates, learning_rate, items)
+        self._disk_signature = self._disk_signature_sync()
+
+    def _mark_dirty(self, state: ThetaState, count: int) -> ThetaState | None:
+        """Учитывает изменения; возвращает копию состояния, если пора сохранять."""
+
+        self._pending_persist += count
+        elapsed = time.monotonic() - self._last_persist
+        if self._pending_persist >= self._persist_every or (
+            self._persist_interval > 0.0 and elapsed >= self._persist_interval
+        ):
+            return self._snapshot_for_persist(state)
+        if self._persist_interval > 0.0:
+            self._schedule_persist()
+        return None
+
+    def _snapshot_for_persist(self, state: ThetaState) -> ThetaState:
+        self._pending_persist = 0
+        self._last_persist = time.monotonic()
+        return self._copy_state(state)
+
+    async def _persist_if_due(self, snapshot: ThetaState | None) -> None:
+        if snapshot is not None:
+            await self._write_snapshot(snapshot)
+
+    async def _write_snapshot(self, snapshot: ThetaState) -> None:
+        async with self._persist_lock:
+            await asyncio.to_thread(self._save_state_sync, snapshot)
+
+    def _schedule_persist(self) -> None:
+        if self._persist_timer is not None and not self._persist_timer.done():
+            return
+        delay = max(0.0, self._persist_interval - (time.monotonic() - self._last_persist))
+        self._persist_timer = asyncio.create_task(self._delayed_persist(delay))
+
+    async def _delayed_persist(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        lock = await self._ensure_lock()
+        async with lock:
+            if self._state is None or self._pending_persist == 0:
+                return
+            snapshot = self._snapshot_for_persist(self._state)
+        await self._write_snapshot(snapshot)
+
+    @staticmethod
+    def _copy_state(state: ThetaState) -> ThetaState:
+        return ThetaState(
+            theta=list(state.theta),
+            pi=list(state.pi),
+            rho=list(state.rho),
+            updates=state.updates,
+            ema_reward=state.ema_reward,
+            sigma=state.sigma,
+        )
 
     async def current_theta(self) -> List[float]:
         """Возвращает копию текущего вектора θ."""
@@ -249,20 +650,39 @@ class ThetaUpdater:
         lock = await self._ensure_lock()
         async with lock:
             state = await self._ensure_state()
-            return ThetaState(
-                theta=list(state.theta),
-                pi=list(state.pi),
-                rho=list(state.rho),
-                updates=state.updates,
-                ema_reward=state.ema_reward,
-                sigma=state.sigma,
-            )
+            return self._copy_state(state)
+
+    async def reload_if_changed(self) -> bool:
+        """Перечитывает снимок и WAL, если их изменил другой процесс; ``True`` — состояние заменено.
+
+        θ обновляет сервис отзывов, а процессы-читатели (агент с федеративной
+        синхронизацией) видят его только через общие файлы. Собственные записи
+        апдейтера подпись файлов не сбивают, поэтому в пишущем процессе вызов
+        сводится к двум ``stat``.
+        """
+
+        lock = await self._ensure_lock()
+        async with lock:
+            if self._state is None:
+                await self._ensure_state()
+                return False
+            signature = await asyncio.to_thread(self._disk_signature_sync)
+            if signature == self._disk_signature:
+                return False
+            self._state = await asyncio.to_thread(self._recover_state_sync)
+            return True
 
     async def persist_state(self, state: ThetaState) -> None:
+        """Заменяет состояние целиком (например, после федеративного слияния) и сохраняет снимок."""
+
         lock = await self._ensure_lock()
         async with lock:
             self._state = state
-            await asyncio.to_thread(self._save_state_sync, state)
+            publish_theta(self._csv_path, state.theta)
+            snapshot = self._snapshot_for_persist(state)
+            # WAL прежнего состояния больше не применим: сбрасываем его под блокировкой
+            async with self._persist_lock:
+                await asyncio.to_thread(self._save_state_sync, snapshot, reset_wal=True)
 
     @property
     def state_path(self) -> Path:
@@ -272,6 +692,42 @@ class ThetaUpdater:
     def csv_path(self) -> Path:
         return self._csv_path
 
+    @property
+    def snapshot_path(self) -> Path:
+        return self._bin_path
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """Подписывает вызываемый объект на локальные обновления θ (например, федеративную синхронизацию).
+
+        Слушатель вызывается в цикле событий после каждого применённого батча
+        отзывов и должен быть быстрым. Замена состояния через ``persist_state``
+        (слияние с пирами, офлайн-переобучение) слушателей не будит, чтобы узлы
+        не пересылали друг другу результаты слияний по кругу.
+        """
+
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        try:
+            self._listeners.remove(listener)
+        except ValueError:
+            pass
+
+    def _notify_listeners(self) -> None:
+        for listener in list(self._listeners):
+            try:
+                listener()
+            except Exception as error:  # pragma: no cover - слушатель не должен ломать обновление
+                logger.warning("Слушатель обновлений θ завершился ошибкой: %s", error)
+
+    @property
+    def l2(self) -> float:
+        return self._l2
+
+    @property
+    def clip(self) -> float:
+        return self._clip
+
     async def _ensure_lock(self) -> asyncio.Lock:
         if self._lock is None:
             self._lock = asyncio.Lock()
@@ -320,7 +776,9 @@ class ThetaUpdater:
             tkm2, tkm1 = tkm1, tk
         return tk
 
-    def _collect_features(self, record: FeedbackRecord) -> tuple[float, dict[str, float]]:
+    def _collect_features(
+        self, record: FeedbackRecord, *, context_strength: float = 0.0
+    ) -> tuple[float, dict[str, float]]:
         assistant_text = (getattr(record, "assistant_message", "") or "")
         assistant_length = min(len(assistant_text) / 600.0, 1.0)
         user_component = 0.0
@@ -334,12 +792,6 @@ class ThetaUpdater:
             checksum = sum(ord(ch) for ch in mode_text)
             mode_component = (checksum % 997) / 997.0
 
-        context_strength = 0.0
-        if _LTM is not None and assistant_text:
-            matches = _LTM.query(assistant_text, top_k=3)
-            if matches:
-                context_strength = sum(max(0.0, score) for _, score in matches) / len(matches)
-
         signal = (
             0.45 * assistant_length
             + 0.2 * mode_component
@@ -359,7 +811,7 @@ class ThetaUpdater:
         return signal, metrics
 
     def _record_memory(self, record: FeedbackRecord) -> None:
-        if _LTM is None or _EMBEDDING_SPACE is None:
+        if _LTM is None:
             return
         assistant_text = getattr(record, "assistant_message", None)
         user_text = getattr(record, "user_message", None)
@@ -373,100 +825,23 @@ class ThetaUpdater:
         elif rating is not None:
             meta_common["rating"] = str(rating)
         if assistant_text:
-            _LTM.append(assistant_text, meta={**meta_common, "role": "assistant"})
+            self._memory_buffer.append((assistant_text, {**meta_common, "role": "assistant"}))
         if user_text:
-            _LTM.append(user_text, meta={**meta_common, "role": "user"})
-
-    def _apply_vector_update(self, vector: List[float], features: List[float], signal: float, lr: float) -> None:
-        for idx, feature in enumerate(features):
-            if idx >= len(vector):
-                break
-            prior = vector[idx]
-            gradient = signal * feature
-            adjusted = prior * (1.0 - lr * self._l2) + lr * gradient
-            if adjusted > self._clip:
-                adjusted = self._clip
-            elif adjusted < -self._clip:
-                adjusted = -self._clip
-            vector[idx] = adjusted
-
-    def _pi_features(self, metrics: dict[str, float], reward: float, dimension: int) -> List[float]:
-        base = [
-            metrics.get("assistant_length", 0.0),
-            metrics.get("user_component", 0.0),
-            metrics.get("mode_component", 0.0),
-            metrics.get("context_strength", 0.0),
-            metrics.get("signal", 0.0),
-            reward,
-        ]
-        return self._pad_features(base, dimension)
-
-    def _rho_features(
-        self,
-        metrics: dict[str, float],
-        reward: float,
-        prediction: float,
-        error: float,
-        state: ThetaState,
-    ) -> List[float]:
-        base = [
-            reward,
-            error,
-            prediction,
-            metrics.get("context_strength", 0.0),
-            state.sigma,
-            metrics.get("signal", 0.0),
-            1.0,
-        ]
-        return self._pad_features(base, len(state.rho))
-
-    @staticmethod
-    def _pad_features(base: List[float], dimension: int) -> List[float]:
-        if dimension <= 0:
-            return []
-        if len(base) >= dimension:
-            return base[:dimension]
-        return base + [0.0] * (dimension - len(base))
-
-    def _gradient_consistency(self, basis: List[float], error: float, state: ThetaState) -> None:
-        if not basis or state.sigma <= 0.0:
-            return
-        samples = (4, 8, 16)
-        estimates: List[List[float]] = []
-        for sample in samples:
-            accum = [0.0] * len(basis)
-            for _ in range(sample):
-                for idx, feature in enumerate(basis):
-                    direction = 1.0 if random.random() > 0.5 else -1.0
-                    accum[idx] += (error / state.sigma) * feature * direction
-            estimates.append([value / sample for value in accum])
-        corr_4_8 = self._correlation(estimates[0], estimates[1])
-        corr_8_16 = self._correlation(estimates[1], estimates[2])
-        if corr_4_8 < 0.9 or corr_8_16 < 0.9:
-            logger.debug(
-                "Низкая корреляция градиентных оценок: corr(4,8)=%.3f corr(8,16)=%.3f",
-                corr_4_8,
-                corr_8_16,
-            )
-
-    @staticmethod
-    def _correlation(a: List[float], b: List[float]) -> float:
-        if len(a) != len(b) or not a:
-            return 1.0
-        mean_a = sum(a) / len(a)
-        mean_b = sum(b) / len(b)
-        num = 0.0
-        den_a = 0.0
-        den_b = 0.0
-        for va, vb in zip(a, b):
-            da = va - mean_a
-            db = vb - mean_b
-            num += da * db
-            den_a += da * da
-            den_b += db * db
-        if den_a == 0.0 or den_b == 0.0:
-            return 1.0
-        return num / math.sqrt(den_a * den_b)
+            self._memory_buffer.append((user_text, {**meta_common, "role": "user"}))
+        if self._memory_buffer and (self._memory_flush is None or self._memory_flush.done()):
+            self._memory_flush = asyncio.create_task(self._flush_memory())
+
+    async def _flush_memory(self) -> None:
+        """Пишет накопленные записи памяти одним батчем в потоке LongTermMemory."""
+
+        await asyncio.sleep(self._memory_flush_interval)
+        memory = await warm_long_term_memory()
+        while self._memory_buffer and memory is not None:
+            batch, self._memory_buffer = self._memory_buffer, []
+            try:
+                await memory.aappend_many(batch)
+            except Exception as error:  # pragma: no cover - память не должна ронять θ
+                logger.warning("Не удалось записать долговременную память: %s", error)
 
     def _extract_reward(self, record: FeedbackRecord) -> float:
         rating = getattr(record, "rating", None)
@@ -497,8 +872,33 @@ async def get_theta_updater() -> ThetaUpdater:
     if _theta_updater is None:
         async with _theta_lock:
             if _theta_updater is None:
-                _theta_updater = ThetaUpdater()
+                _theta_updater = ThetaUpdater(
+                    batch_size=int(os.getenv("KNP_THETA_BATCH_SIZE", "1")),
+                    batch_interval=float(os.getenv("KNP_THETA_BATCH_INTERVAL_MS", "50")) / 1000.0,
+                    persist_every=int(os.getenv("KNP_THETA_PERSIST_EVERY", "32")),
+                    persist_interval=float(os.getenv("KNP_THETA_PERSIST_INTERVAL_MS", "1000")) / 1000.0,
+                    wal_fsync=os.getenv("KNP_THETA_WAL_FSYNC", "0") == "1",
+                    diagnostics_every=int(os.getenv("KNP_THETA_DIAG_EVERY", "0")),
+                    context_mode=os.getenv("KNP_THETA_CONTEXT_MODE", "ltm"),
+                )
     return _theta_updater
 
 
-__all__ = ["ThetaUpdater", "ThetaState", "get_theta_updater"]
+async def shutdown_theta_updater() -> None:
+    """Сбрасывает очередь и несохранённое состояние синглтона при остановке приложения."""
+
+    global _theta_updater
+    if _theta_updater is not None:
+        await _theta_updater.aclose()
+        _theta_updater = None
+
+
+__all__ = [
+    "ThetaUpdater",
+    "ThetaState",
+    "basis_matrix",
+    "get_long_term_memory",
+    "get_theta_updater",
+    "shutdown_theta_updater",
+    "warm_long_term_memory",
+]
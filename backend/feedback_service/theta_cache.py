@@ -0,0 +1,184 @@
+"""Процессный кэш θ для горячего пути инференса.
+
+Кэш держит в памяти последний прочитанный вектор θ и его версию. Файл
+перечитывается только фоновым наблюдателем (по изменению inode/mtime/размера),
+а :class:`~backend.feedback_service.theta.ThetaUpdater` в том же процессе
+публикует новые значения напрямую, минуя диск.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_THETA_FILE = "data/knp_theta.csv"
+
+
+@dataclass(frozen=True)
+class ThetaSnapshot:
+    """Неизменяемый снимок θ вместе с номером версии."""
+
+    theta: Tuple[float, ...]
+    version: int
+
+
+def parse_theta_text(content: str) -> list[float]:
+    """Разбирает θ из CSV: как «плоский» список, так и формат ``θ:...`` апдейтера."""
+
+    lines = [line.strip() for line in content.splitlines() if line.strip()]
+    labelled = [line for line in lines if ":" in line]
+    if labelled:
+        source = ""
+        for line in labelled:
+            label, _, values = line.partition(":")
+            if label.strip() in {"θ", "theta"}:
+                source = values
+                break
+    else:
+        source = ",".join(lines)
+
+    values: list[float] = []
+    for chunk in source.split(","):
+        token = chunk.strip()
+        if not token:
+            continue
+        try:
+            values.append(float(token))
+        except ValueError:
+            return []
+    return values
+
+
+def resolve_theta_file(path: Path | str | None = None) -> Path:
+    """Возвращает абсолютный путь к CSV с θ (по умолчанию из ``KNP_THETA_FILE``)."""
+
+    if path is None:
+        path = os.getenv("KNP_THETA_FILE", _DEFAULT_THETA_FILE)
+    path_obj = Path(path)
+    if not path_obj.is_absolute():
+        path_obj = Path.cwd() / path_obj
+    return path_obj.resolve()
+
+
+class ThetaCache:
+    """Хранит θ в памяти и обновляет его по сигналам наблюдателя или апдейтера."""
+
+    def __init__(self, path: Path | str, *, poll_interval: float = 0.5) -> None:
+        self._path = Path(path)
+        self._poll_interval = poll_interval
+        self._snapshot = ThetaSnapshot(theta=(), version=0)
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def snapshot(self) -> ThetaSnapshot:
+        """Возвращает текущий снимок без обращения к диску."""
+
+        return self._snapshot
+
+    def publish(self, theta: Iterable[float]) -> ThetaSnapshot:
+        """Принимает новое θ из процесса; версия растёт только при изменении значений."""
+
+        values = tuple(float(value) for value in theta)
+        with self._lock:
+            if values != self._snapshot.theta:
+                self._snapshot = ThetaSnapshot(theta=values, version=self._snapshot.version + 1)
+            return self._snapshot
+
+    def refresh(self) -> bool:
+        """Перечитывает файл, если изменились inode, mtime или размер."""
+
+        try:
+            stat = self._path.stat()
+        except FileNotFoundError:
+            return False
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._signature:
+            return False
+        try:
+            content = self._path.read_text(encoding="utf-8")
+        except OSError as error:
+            logger.warning("Не удалось прочитать θ из %s: %s", self._path, error)
+            return False
+        self._signature = signature
+        values = parse_theta_text(content)
+        if not values:
+            return False
+        before = self._snapshot.version
+        return self.publish(values).version != before
+
+    def start(self, *, poll_interval: float | None = None) -> None:
+        """Запускает фоновый поток, отслеживающий изменения файла."""
+
+        if poll_interval is not None:
+            self._poll_interval = poll_interval
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="theta-cache-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=self._poll_interval * 2 + 1.0)
+        self._thread = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self._poll_interval):
+            try:
+                self.refresh()
+            except Exception as error:  # pragma: no cover - наблюдатель не должен падать
+                logger.warning("Ошибка наблюдателя θ %s: %s", self._path, error)
+
+
+_caches: Dict[Path, ThetaCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_theta_cache(path: Path | str | None = None) -> ThetaCache:
+    """Возвращает процессный кэш для указанного CSV, создавая и заполняя его при первом вызове."""
+
+    resolved = resolve_theta_file(path)
+    with _caches_lock:
+        cache = _caches.get(resolved)
+        if cache is None:
+            cache = ThetaCache(resolved)
+            _caches[resolved] = cache
+            cache.refresh()
+        return cache
+
+
+def publish_theta(path: Path | str, theta: Iterable[float]) -> None:
+    """Передаёт θ в уже зарегистрированный кэш; без подписчиков ничего не делает."""
+
+    cache = _caches.get(resolve_theta_file(path))
+    if cache is not None:
+        cache.publish(theta)
+
+
+__all__ = [
+    "ThetaCache",
+    "ThetaSnapshot",
+    "get_theta_cache",
+    "parse_theta_text",
+    "publish_theta",
+    "resolve_theta_file",
+]
@@ -0,0 +1,250 @@
+"""Двоичный снимок θ и журнал упреждающей записи (WAL) для :mod:`.theta`.
+
+Снимок — заголовок с магией и версией формата, затем массивы float64 θ/π/ρ и
+CRC32; пишется во временный файл и атомарно подменяется через ``os.replace``.
+WAL хранит кадры применённых батчей (шаг обучения, награда и признаки каждой
+записи), так что состояние восстанавливается повтором кадров поверх последнего
+снимка без сохранения на каждом обновлении.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"KNPT"
+SNAPSHOT_VERSION = 1
+_HEADER = struct.Struct("<4sHHHHQdd")
+_CRC = struct.Struct("<I")
+
+WAL_FIELDS: Tuple[str, ...] = (
+    "assistant_length",
+    "user_component",
+    "comment_component",
+    "mode_component",
+    "context_strength",
+    "signal",
+)
+_FRAME_HEADER = struct.Struct("<IIQd")
+_ITEM_WIDTH = 1 + len(WAL_FIELDS)
+
+WalItem = Tuple[float, dict]
+
+
+@dataclass
+class SnapshotData:
+    """Поля, извлечённые из двоичного снимка."""
+
+    theta: List[float]
+    pi: List[float]
+    rho: List[float]
+    updates: int
+    ema_reward: float
+    sigma: float
+
+
+def _doubles_to_bytes(values: Sequence[float]) -> bytes:
+    packed = array("d", values)
+    if sys.byteorder == "big":  # pragma: no cover - формат всегда little-endian
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _doubles_from_bytes(view: memoryview) -> List[float]:
+    values = array("d")
+    values.frombytes(view)
+    if sys.byteorder == "big":  # pragma: no cover - формат всегда little-endian
+        values.byteswap()
+    return values.tolist()
+
+
+def encode_snapshot(
+    theta: Sequence[float],
+    pi: Sequence[float],
+    rho: Sequence[float],
+    *,
+    updates: int,
+    ema_reward: float,
+    sigma: float,
+) -> bytes:
+    header = _HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(theta), len(pi), len(rho), updates, ema_reward, sigma
+    )
+    body = header + _doubles_to_bytes(list(theta) + list(pi) + list(rho))
+    return body + _CRC.pack(zlib.crc32(body))
+
+
+def decode_snapshot(data: bytes) -> SnapshotData:
+    """Разбирает снимок; при повреждении или чужом формате бросает ``ValueError``."""
+
+    view = memoryview(data)
+    if len(view) < _HEADER.size + _CRC.size:
+        raise ValueError("snapshot too short")
+    magic, version, n_theta, n_pi, n_rho, updates, ema_reward, sigma = _HEADER.unpack_from(view)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("bad snapshot magic")
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"unsupported snapshot version {version}")
+    end = _HEADER.size + 8 * (n_theta + n_pi + n_rho)
+    if len(view) != end + _CRC.size:
+        raise ValueError("snapshot size mismatch")
+    (crc,) = _CRC.unpack_from(view, end)
+    if crc != zlib.crc32(view[:end]):
+        raise ValueError("snapshot checksum mismatch")
+    values = _doubles_from_bytes(view[_HEADER.size : end])
+    return SnapshotData(
+        theta=values[:n_theta],
+        pi=values[n_theta : n_theta + n_pi],
+        rho=values[n_theta + n_pi :],
+        updates=updates,
+        ema_reward=ema_reward,
+        sigma=sigma,
+    )
+
+
+def write_atomic(path: Path, data: bytes, *, fsync: bool = True) -> None:
+    """Записывает файл целиком через временный файл и ``os.replace``."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with tmp_path.open("wb") as handle:
+        handle.write(data)
+        handle.flush()
+        if fsync:
+            os.fsync(handle.fileno())
+    os.replace(tmp_path, path)
+    if fsync and hasattr(os, "O_DIRECTORY"):
+        try:
+            dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:  # pragma: no cover - не все ФС позволяют открыть каталог
+            return
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class ThetaWAL:
+    """Журнал батчей обновлений θ с контрольными суммами кадров."""
+
+    def __init__(self, path: Path, *, fsync: bool = False) -> None:
+        self._path = path
+        self._fsync = fsync
+        self._lock = threading.Lock()
+        self._repaired = False
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def append(self, base_updates: int, learning_rate: float, items: Sequence[WalItem]) -> None:
+        values: List[float] = []
+        for reward, metrics in items:
+            values.append(reward)
+            values.extend(float(metrics.get(name, 0.0)) for name in WAL_FIELDS)
+        payload = _doubles_to_bytes(values)
+        header = _FRAME_HEADER.pack(len(items), zlib.crc32(payload), base_updates, learning_rate)
+        frame = header + payload
+        with self._lock:
+            if not self._repaired:
+                self._truncate_torn_tail()
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with self._path.open("ab") as handle:
+                handle.write(frame)
+                handle.flush()
+                if self._fsync:
+                    os.fsync(handle.fileno())
+
+    def read(self) -> Iterator[Tuple[int, float, List[WalItem]]]:
+        """Возвращает кадры ``(base_updates, learning_rate, items)`` до первого битого кадра."""
+
+        try:
+            data = self._path.read_bytes()
+        except FileNotFoundError:
+            return
+        yield from self._frames(memoryview(data))
+
+    def compact(self, min_base_updates: int) -> None:
+        """Удаляет кадры, уже вошедшие в снимок с ``updates == min_base_updates``."""
+
+        with self._lock:
+            try:
+                data = self._path.read_bytes()
+            except FileNotFoundError:
+                return
+            view = memoryview(data)
+            kept = bytearray()
+            for base, _, start, end in self._frame_bounds(view):
+                if base >= min_base_updates:
+                    kept += view[start:end]
+            if not kept:
+                self._path.unlink(missing_ok=True)
+                return
+            write_atomic(self._path, bytes(kept), fsync=self._fsync)
+
+    def _truncate_torn_tail(self) -> None:
+        # Хвост после падения чинит только пишущий процесс, перед первой записью:
+        # читатели (например, агент) журнал не трогают.
+        self._repaired = True
+        try:
+            data = self._path.read_bytes()
+        except FileNotFoundError:
+            return
+        valid = 0
+        for _, _, _, end in self._frame_bounds(memoryview(data)):
+            valid = end
+        if valid < len(data):
+            os.truncate(self._path, valid)
+
+    def reset(self) -> None:
+        """Полностью очищает журнал (после записи снимка с заменой состояния)."""
+
+        with self._lock:
+            self._path.unlink(missing_ok=True)
+
+    def _frames(self, view: memoryview) -> Iterator[Tuple[int, float, List[WalItem]]]:
+        for base, count, start, end in self._frame_bounds(view):
+            learning_rate = _FRAME_HEADER.unpack_from(view, start)[3]
+            values = _doubles_from_bytes(view[start + _FRAME_HEADER.size : end])
+            items: List[WalItem] = []
+            for index in range(count):
+                chunk = values[index * _ITEM_WIDTH : (index + 1) * _ITEM_WIDTH]
+                items.append((chunk[0], dict(zip(WAL_FIELDS, chunk[1:]))))
+            yield base, learning_rate, items
+
+    @staticmethod
+    def _frame_bounds(view: memoryview) -> Iterator[Tuple[int, int, int, int]]:
+        offset = 0
+        while offset + _FRAME_HEADER.size <= len(view):
+            count, crc, base, _ = _FRAME_HEADER.unpack_from(view, offset)
+            end = offset + _FRAME_HEADER.size + 8 * _ITEM_WIDTH * count
+            if count == 0 or end > len(view):
+                logger.warning("WAL θ оборван на смещении %d", offset)
+                return
+            if zlib.crc32(view[offset + _FRAME_HEADER.size : end]) != crc:
+                logger.warning("WAL θ повреждён на смещении %d", offset)
+                return
+            yield base, count, offset, end
+            offset = end
+
+
+__all__ = [
+    "SNAPSHOT_MAGIC",
+    "SNAPSHOT_VERSION",
+    "SnapshotData",
+    "ThetaWAL",
+    "WAL_FIELDS",
+    "decode_snapshot",
+    "encode_snapshot",
+    "write_atomic",
+]
@@ -0,0 +1,270 @@
+"""Офлайн-переобучение θ/π/ρ по всему RLHF-датасету.
+
+Онлайновый :class:`~backend.feedback_service.theta.ThetaUpdater` делает шаг
+``θ ← θ(1 − η·l2) + η·(r − θ·b)·b`` на каждую запись; его неподвижная точка —
+решение гребневой регрессии ``(E[b bᵀ] + l2·I)·θ = E[r·b]``. Градиент π и ρ
+от них самих не зависит, и его формальная неподвижная точка ``E[r·f] / l2``
+при малом l2 упирается в ``clip``, поэтому π и ρ подбираются той же
+гребневой регрессией награды по своим признакам: ``(E[f fᵀ] + l2·I)·v = E[r·f]``.
+
+Все нужные математические ожидания линейны по записям, поэтому сегменты
+датасета обрабатываются параллельно в пуле процессов (частичные суммы
+складываются), а признаки каждой пачки считаются векторно в NumPy. Признаки ρ
+зависят от θ только линейно (прогноз ``θ·b`` и ошибка ``r − θ·b``), поэтому
+их моменты выражаются через моменты вектора ``z = (r, b, s, 1)`` и второй
+проход не нужен.
+
+Отзывы повторяются, как правило, в пределах одного сегмента, поэтому
+дедупликация по ``message_id`` выполняется внутри сегмента.
+
+Запуск: ``python -m backend.feedback_service.theta_trainer --dataset data/rlhf_feedback.jsonl``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from .rlhf_reader import dataset_files, iter_feedback, iter_segment
+from .theta import ThetaState, ThetaUpdater, basis_matrix
+
+logger = logging.getLogger(__name__)
+
+_REWARDS = {"useful": 1.0, "not_useful": -1.0}
+_CHUNK = 65_536
+
+
+@dataclass
+class PartialSums:
+    """Частичные суммы по части датасета; складываются в порядке файлов.
+
+    ``moments`` — сумма ``z zᵀ`` для ``z = (r, b₀…bₙ₋₁, s, 1)``, ``pi_moments`` —
+    сумма ``g gᵀ`` для ``g = (r, f_π)``.
+    """
+
+    count: int
+    moments: np.ndarray
+    pi_moments: np.ndarray
+    ema: float
+
+    @property
+    def n_theta(self) -> int:
+        return self.moments.shape[0] - 3
+
+    @property
+    def gram(self) -> np.ndarray:
+        n = self.n_theta
+        return self.moments[1 : n + 1, 1 : n + 1]
+
+    @property
+    def reward_basis(self) -> np.ndarray:
+        return self.moments[0, 1 : self.n_theta + 1]
+
+    def merge(self, later: "PartialSums") -> "PartialSums":
+        return PartialSums(
+            count=self.count + later.count,
+            moments=self.moments + later.moments,
+            pi_moments=self.pi_moments + later.pi_moments,
+            # EMA с нулевым стартом: хвост затухает на 0.9 за каждую последующую запись.
+            ema=self.ema * 0.9**later.count + later.ema,
+        )
+
+    @classmethod
+    def empty(cls, n_theta: int, pi_dim: int) -> "PartialSums":
+        return cls(0, np.zeros((n_theta + 3, n_theta + 3)), np.zeros((pi_dim + 1, pi_dim + 1)), 0.0)
+
+
+def _feature_rows(rows: Iterable[Dict[str, Any]]) -> np.ndarray:
+    """Признаки ``_collect_features`` (без контекста LTM) и награда: столбцы a, u, c, m, r."""
+
+    values: List[tuple[float, float, float, float, float]] = []
+    for row in rows:
+        reward = _REWARDS.get(str(row.get("rating", "")).lower())
+        if reward is None:
+            continue
+        mode = row.get("mode")
+        values.append(
+            (
+                min(len(row.get("assistant_message") or "") / 600.0, 1.0),
+                min(len(row.get("user_message") or "") / 400.0, 1.0),
+                0.1 if row.get("comment") else 0.0,
+                (sum(ord(ch) for ch in mode) % 997) / 997.0 if mode else 0.5,
+                reward,
+            )
+        )
+    return np.asarray(values, dtype=np.float64).reshape(-1, 5)
+
+
+def _chunk_sums(features: np.ndarray, n_theta: int, pi_dim: int) -> PartialSums:
+    assistant, user, comment, mode, reward = features.T
+    signal = np.clip(0.45 * assistant + 0.2 * mode + 0.15 * user + comment, 0.0, 1.0)
+    z = np.column_stack([reward, basis_matrix(signal, n_theta), signal, np.ones_like(signal)])
+    pi_base = np.stack([assistant, user, mode, np.zeros_like(signal), signal, reward], axis=1)
+    g = np.zeros((features.shape[0], pi_dim + 1))
+    g[:, 0] = reward
+    width = min(pi_dim, pi_base.shape[1])
+    g[:, 1 : width + 1] = pi_base[:, :width]
+    weights = 0.1 * 0.9 ** np.arange(features.shape[0] - 1, -1, -1, dtype=np.float64)
+    return PartialSums(
+        count=int(features.shape[0]),
+        moments=z.T @ z,
+        pi_moments=g.T @ g,
+        ema=float(weights @ reward),
+    )
+
+
+def _sums_from_rows(rows: Iterable[Dict[str, Any]], n_theta: int, pi_dim: int) -> PartialSums:
+    total = PartialSums.empty(n_theta, pi_dim)
+    chunk: List[Dict[str, Any]] = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= _CHUNK:
+            total = total.merge(_chunk_sums(_feature_rows(chunk), n_theta, pi_dim))
+            chunk = []
+    if chunk:
+        total = total.merge(_chunk_sums(_feature_rows(chunk), n_theta, pi_dim))
+    return total
+
+
+def _unique_rows(path: Path) -> Iterator[Dict[str, Any]]:
+    seen: set[str] = set()
+    for row in iter_segment(path):
+        message_id = str(row.get("message_id", ""))
+        if message_id in seen:
+            continue
+        seen.add(message_id)
+        yield row
+
+
+def partial_sums(path: Path, n_theta: int, pi_dim: int) -> PartialSums:
+    """Суммы по одному файлу датасета (выполняется в процессе пула)."""
+
+    return _sums_from_rows(_unique_rows(path), n_theta, pi_dim)
+
+
+def _ridge(gram: np.ndarray, rhs: np.ndarray, *, l2: float, clip: float) -> np.ndarray:
+    if rhs.size == 0:
+        return rhs
+    solution = np.linalg.solve(gram + l2 * np.eye(rhs.size), rhs)
+    return np.clip(solution, -clip, clip)
+
+
+def _rho_projection(theta: np.ndarray, sigma: float, rho_dim: int) -> np.ndarray:
+    """Матрица ``M``: признаки ρ записи равны ``M·z`` (см. ``ThetaUpdater._apply_batch``)."""
+
+    n_theta = theta.size
+    rows = np.zeros((7, n_theta + 3))
+    rows[0, 0] = 1.0  # награда
+    rows[1, 0], rows[1, 1 : n_theta + 1] = 1.0, -theta  # ошибка r − θ·b
+    rows[2, 1 : n_theta + 1] = theta  # прогноз θ·b
+    # rows[3] — сила контекста LTM, офлайн она равна нулю
+    rows[4, -1] = sigma
+    rows[5, n_theta + 1] = 1.0  # сигнал
+    rows[6, -1] = 1.0
+    projection = np.zeros((rho_dim, n_theta + 3))
+    width = min(rho_dim, rows.shape[0])
+    projection[:width] = rows[:width]
+    return projection
+
+
+def solve_state(sums: PartialSums, template: ThetaState, *, l2: float, clip: float) -> ThetaState:
+    """Гребневые решения для θ, π и ρ по накопленным суммам.
+
+    Счётчик ``updates`` — число отзывов, на которых обучена θ: от него зависят
+    веса федеративного слияния. Живое состояние уже учло онлайн-шагами те же
+    записи датасета, поэтому счётчики не складываются, а берётся больший из
+    них: повторное переобучение счётчик не раздувает.
+    """
+
+    if sums.count == 0:
+        return template
+    count = float(sums.count)
+    theta = _ridge(sums.gram / count, sums.reward_basis / count, l2=l2, clip=clip)
+    sigma = max(0.05, ThetaState().sigma * 0.995**sums.count)
+
+    pi_moments = sums.pi_moments[: len(template.pi) + 1, : len(template.pi) + 1] / count
+    pi = _ridge(pi_moments[1:, 1:], pi_moments[1:, 0], l2=l2, clip=clip)
+
+    projection = _rho_projection(theta, sigma, len(template.rho))
+    moments = sums.moments / count
+    rho = _ridge(projection @ moments @ projection.T, projection @ moments[:, 0], l2=l2, clip=clip)
+
+    return ThetaState(
+        theta=theta.tolist(),
+        pi=pi.tolist(),
+        rho=rho.tolist(),
+        updates=max(template.updates, sums.count),
+        ema_reward=sums.ema,
+        sigma=sigma,
+    )
+
+
+def accumulate(files: Sequence[Path], n_theta: int, pi_dim: int, *, workers: Optional[int] = None) -> PartialSums:
+    total = PartialSums.empty(n_theta, pi_dim)
+    if workers == 1 or len(files) <= 1:
+        results = [partial_sums(path, n_theta, pi_dim) for path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers or min(len(files), os.cpu_count() or 1)) as pool:
+            results = list(pool.map(partial_sums, files, [n_theta] * len(files), [pi_dim] * len(files)))
+    for result in results:
+        total = total.merge(result)
+    return total
+
+
+async def retrain(
+    dataset_path: Path | str,
+    updater: ThetaUpdater,
+    *,
+    workers: Optional[int] = None,
+    dry_run: bool = False,
+    **filters: Any,
+) -> ThetaState:
+    """Переобучает состояние по датасету и сохраняет его через ``persist_state``."""
+
+    template = await updater.current_state()
+    n_theta, pi_dim = len(template.theta), len(template.pi)
+    if any(value is not None for value in filters.values()):
+        # С фильтрами датасет читается одним потоком с глобальной дедупликацией.
+        rows = iter_feedback(dataset_path, **filters)
+        sums = await asyncio.to_thread(_sums_from_rows, rows, n_theta, pi_dim)
+    else:
+        files = dataset_files(Path(dataset_path))
+        sums = await asyncio.to_thread(accumulate, files, n_theta, pi_dim, workers=workers)
+    state = solve_state(sums, template, l2=updater.l2, clip=updater.clip)
+    if not dry_run and sums.count:
+        await updater.persist_state(state)
+    return state
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline θ re-fit from the RLHF dataset")
+    parser.add_argument("--dataset", default=os.getenv("RLHF_DATASET_PATH", "data/rlhf_feedback.jsonl"))
+    parser.add_argument("--state", default=None, help="θ state path (default: KNP_THETA_STATE_PATH)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--dry-run", action="store_true", help="print the fitted state without saving it")
+    args = parser.parse_args(argv)
+
+    updater = ThetaUpdater(Path(args.state) if args.state else None)
+    state = asyncio.run(retrain(args.dataset, updater, workers=args.workers, dry_run=args.dry_run))
+    print(
+        json.dumps(
+            {"updates": state.updates, "theta": state.theta, "pi": state.pi, "rho": state.rho, "sigma": state.sigma}
+        )
+    )
+    return 0
+
+
+__all__ = ["PartialSums", "basis_matrix", "retrain", "solve_state"]
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
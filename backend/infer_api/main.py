@@ -1,61 +1,82 @@
 
+from contextlib import asynccontextmanager
+from typing import Optional
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, conint, conlist
 import os
 import subprocess
-from pathlib import Path
+
+from backend.agent.result_cache import InferenceResultCache, state_fingerprint
+from backend.feedback_service.theta_cache import ThetaCache, get_theta_cache
 
 BIN = os.getenv("KNP_INFER_BIN", "apps/kolibri_infer")
-app = FastAPI(title="Kolibri Nano Infer API", version="0.2.0")
+THETA_POLL_INTERVAL = float(os.getenv("KNP_THETA_POLL_INTERVAL", "0.5"))
+
+_cache: Optional[ThetaCache] = None
+_results = InferenceResultCache.from_env("KNP_INFER_CACHE")
+
 
+def _theta_cache() -> ThetaCache:
+    global _cache
+    if _cache is None:
+        _cache = get_theta_cache(os.getenv("KNP_THETA_FILE"))
+    return _cache
 
-def _load_theta_from_file(path: str) -> list[float]:
-    if not path:
-        return []
-    file_path = Path(path)
-    if not file_path.is_absolute():
-        file_path = (Path.cwd() / file_path).resolve()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the θ file watcher for the lifetime of the application."""
+
+    cache = _theta_cache()
+    cache.start(poll_interval=THETA_POLL_INTERVAL)
     try:
-        content = file_path.read_text(encoding="utf-8")
-    except FileNotFoundError:
-        return []
-
-    values: list[float] = []
-    for chunk in content.replace("\n", ",").split(","):
-        token = chunk.strip()
-        if not token:
-            continue
-        try:
-            values.append(float(token))
-        except ValueError:
-            return []
-    return values
+        yield
+    finally:
+        cache.stop()
+        if _results is not None:
+            _results.close()
+
+
+app = FastAPI(title="Kolibri Nano Infer API", version="0.2.0", lifespan=lifespan)
+
 
 class InferRequest(BaseModel):
     q: conint(ge=1)
     beam: conint(ge=1, le=256) = 8
     depth: conint(ge=1, le=128) = 6
-    theta: conlist(float, min_items=0, max_items=32) | None = None
+    theta: conlist(float, min_length=0, max_length=32) | None = None
 
 class InferResponse(BaseModel):
     best_id: int
     value: float
     score: float
+    theta_version: Optional[int] = None
 
 @app.post("/api/infer", response_model=InferResponse)
 def infer(req: InferRequest):
     args = [BIN, "--q", str(req.q), "--beam", str(req.beam), "--depth", str(req.depth)]
-    env = os.environ.copy()
     theta_values = list(req.theta) if req.theta else None
-    theta_file = env.get("KNP_THETA_FILE", "data/knp_theta.csv")
-    resolved_theta_file = str((Path.cwd() / theta_file).resolve()) if not Path(theta_file).is_absolute() else theta_file
-    env["KNP_THETA_FILE"] = resolved_theta_file
+    theta_version: Optional[int] = None
     if theta_values is None:
-        file_theta = _load_theta_from_file(resolved_theta_file)
-        if file_theta:
-            theta_values = file_theta
+        snapshot = _theta_cache().snapshot()
+        if snapshot.theta:
+            theta_values = list(snapshot.theta)
+            theta_version = snapshot.version
+    key = None
+    if _results is not None:
+        version = state_fingerprint(theta_values or ())
+        if theta_version is not None:
+            _results.observe_version(version)
+        key = ("infer", req.q, req.beam, req.depth, version, BIN)
+        cached = _results.get(key)
+        if cached is not None:
+            best_id, value, score = cached
+            return InferResponse(best_id=best_id, value=value, score=score, theta_version=theta_version)
+    env = os.environ.copy()
     if theta_values:
-        env["KNP_THETA"] = ",".join(str(x) for x in theta_values)
+        # θ передаётся явно, чтобы бинарник не перечитывал файл на каждом запросе.
+        env["KNP_THETA"] = ",".join(repr(x) for x in theta_values)
     try:
         p = subprocess.run(args, env=env, capture_output=True, text=True, timeout=5)
         if p.returncode != 0:
@@ -63,8 +84,18 @@ def infer(req: InferRequest):
         parts = p.stdout.strip().split()
         if len(parts)!=3:
             raise HTTPException(500, f"bad output: {p.stdout!r}")
-        return InferResponse(best_id=int(parts[0]), value=float(parts[1]), score=float(parts[2]))
+        best_id, value, score = int(parts[0]), float(parts[1]), float(parts[2])
+        if key is not None:
+            _results.put(key, [best_id, value, score], size=64)
+        return InferResponse(best_id=best_id, value=value, score=score, theta_version=theta_version)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(500, f"error: {e}")
+
+
+@app.get("/api/infer/cache")
+def infer_cache():
+    if _results is None:
+        return {"enabled": False}
+    return {"enabled": True, **_results.stats()}
@@ -22,6 +22,15 @@ from .parser import (
     WhileStatement,
     parse_script,
 )
+from .vm import (
+    Bytecode,
+    ExecutionResult,
+    KolibriScriptError,
+    KolibriVM,
+    StepLimitExceeded,
+    compile_program,
+    run_script,
+)
 from .genome import (
     KsdValidationError,
     KolibriGenomeLedger,
@@ -52,6 +61,14 @@ __all__ = [
     "VariableDeclaration",
     "WhileStatement",
     "parse_script",
+    # vm exports
+    "Bytecode",
+    "ExecutionResult",
+    "KolibriScriptError",
+    "KolibriVM",
+    "StepLimitExceeded",
+    "compile_program",
+    "run_script",
     # genome exports
     "KsdValidationError",
     "KolibriGenomeLedger",
@@ -0,0 +1,339 @@
+"""Компилируемые выражения KolibriScript.
+
+Текст выражения один раз разбирается в типизированное дерево (Pratt-парсер),
+константные поддеревья сворачиваются, а результат превращается в цепочку
+замыканий ``fn(переменные, sim)``. Скомпилированные выражения кэшируются по
+тексту и исходному отрезку, поэтому условие ``пока`` или команда
+``выражение`` разбираются один раз, а дальше исполняются без повторного
+токенизатора и обхода AST.
+
+Грамматика (по убыванию приоритета)::
+
+    атом        число | "строка" | имя | фитнес имя | ( выражение )
+    степень     атом ** унарное            (правоассоциативно)
+    унарное     (+|-) унарное | степень
+    произведение унарное ((*|/|%) унарное)*
+    сумма       произведение ((+|-) произведение)*
+    сравнение   сумма ((>|<|>=|<=|==|!=) сумма)?
+"""
+
+from __future__ import annotations
+
+import operator
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
+
+from .parser import SourceSpan
+
+__all__ = [
+    "Binary",
+    "CompiledExpression",
+    "Const",
+    "ExpressionError",
+    "Fitness",
+    "MAX_POWER_BITS",
+    "Unary",
+    "Var",
+    "compile_expression",
+    "fold_constants",
+    "parse_expression",
+]
+
+Evaluator = Callable[[Mapping[str, Any], Any], Any]
+
+
+class ExpressionError(ValueError):
+    """Выражение не удалось разобрать или оно выходит за допустимое подмножество."""
+
+
+@dataclass(frozen=True)
+class Const:
+    value: Any
+
+
+@dataclass(frozen=True)
+class Var:
+    name: str
+
+
+@dataclass(frozen=True)
+class Fitness:
+    formula: str
+
+
+@dataclass(frozen=True)
+class Unary:
+    op: str
+    operand: "ExprNode"
+
+
+@dataclass(frozen=True)
+class Binary:
+    op: str
+    left: "ExprNode"
+    right: "ExprNode"
+
+
+ExprNode = Union[Const, Var, Fitness, Unary, Binary]
+
+# Верхняя граница размера целой степени: `10 ** 10 ** 10` иначе зависнет ещё при
+# свёртке констант, до всякого лимита шагов виртуальной машины.
+MAX_POWER_BITS = 1 << 16
+
+
+def _power(base: Any, exponent: Any) -> Any:
+    if (
+        isinstance(base, int)
+        and isinstance(exponent, int)
+        and exponent > 0
+        and abs(base) > 1
+        and (abs(base).bit_length() - 1) * exponent > MAX_POWER_BITS
+    ):
+        raise OverflowError(f"слишком большая степень: {base} ** {exponent}")
+    return operator.pow(base, exponent)
+
+
+_BINARY: Dict[str, Callable[[Any, Any], Any]] = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "%": operator.mod,
+    "**": _power,
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+_UNARY: Dict[str, Callable[[Any], Any]] = {"+": operator.pos, "-": operator.neg}
+_COMPARISONS = frozenset({">", "<", ">=", "<=", "==", "!="})
+_PRECEDENCE = {
+    **{op: 10 for op in _COMPARISONS},
+    "+": 20,
+    "-": 20,
+    "*": 30,
+    "/": 30,
+    "%": 30,
+    "**": 50,
+}
+_UNARY_PRECEDENCE = 40
+_TWO_CHAR = ("**", ">=", "<=", "==", "!=")
+_DIGITS = r"\d(?:_?\d)*"
+# Числовые литералы Python: 1_000, 0x10, 0o17, 0b101, 1.5, .5, 1e3, 2.5E-3.
+_NUMBER = re.compile(
+    r"0[xX](?:_?[0-9a-fA-F])+|0[oO](?:_?[0-7])+|0[bB](?:_?[01])+"
+    rf"|(?:{_DIGITS}\.(?:{_DIGITS})?|\.{_DIGITS}|{_DIGITS})(?:[eE][+-]?{_DIGITS})?"
+)
+_ONE_CHAR = "+-*/%()<>"
+_FITNESS = "фитнес"
+
+# Подмножество команды `выражение` в KolibriSim: целая арифметика без имён.
+_INTEGER_OPS = frozenset({"+", "-", "*", "**"})
+
+Token = Tuple[str, Any]
+
+
+def _tokenize(text: str) -> List[Token]:
+    tokens: List[Token] = []
+    index, length = 0, len(text)
+    while index < length:
+        ch = text[index]
+        if ch.isspace():
+            index += 1
+        elif ch.isdigit() or (ch == "." and index + 1 < length and text[index + 1].isdigit()):
+            match = _NUMBER.match(text, index)
+            assert match is not None
+            literal = match.group()
+            index = match.end()
+            if index < length and (text[index].isalnum() or text[index] in "._"):
+                raise ExpressionError(f"некорректное число {text[match.start() : index + 1]!r}")
+            if literal[:2].lower() in ("0x", "0o", "0b"):
+                tokens.append(("NUM", int(literal, 0)))
+            elif any(mark in literal for mark in ".eE"):
+                tokens.append(("NUM", float(literal)))
+            else:
+                tokens.append(("NUM", int(literal)))
+        elif ch == '"':
+            end = text.find('"', index + 1)
+            if end < 0:
+                raise ExpressionError("незакрытая строка")
+            tokens.append(("STR", text[index + 1 : end]))
+            index = end + 1
+        elif ch.isalpha() or ch == "_":
+            start = index
+            while index < length and (text[index].isalnum() or text[index] == "_"):
+                index += 1
+            tokens.append(("NAME", text[start:index]))
+        elif text[index : index + 2] in _TWO_CHAR:
+            tokens.append(("OP", text[index : index + 2]))
+            index += 2
+        elif ch in _ONE_CHAR:
+            tokens.append(("OP", ch))
+            index += 1
+        else:
+            raise ExpressionError(f"неожиданный символ {ch!r}")
+    tokens.append(("END", None))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens: List[Token]) -> None:
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self) -> Token:
+        return self.tokens[self.position]
+
+    def take(self) -> Token:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self) -> ExprNode:
+        node = self.expression(0)
+        if self.peek()[0] != "END":
+            raise ExpressionError(f"лишняя лексема {self.peek()[1]!r}")
+        return node
+
+    def expression(self, min_precedence: int) -> ExprNode:
+        left = self.prefix()
+        while True:
+            kind, value = self.peek()
+            if kind != "OP" or value not in _PRECEDENCE:
+                return left
+            precedence = _PRECEDENCE[value]
+            if precedence <= min_precedence and not (value == "**" and precedence == min_precedence):
+                return left
+            self.take()
+            if value in _COMPARISONS:
+                right = self.expression(precedence)
+                if self.peek()[0] == "OP" and self.peek()[1] in _COMPARISONS:
+                    raise ExpressionError("цепочки сравнений не поддерживаются")
+            elif value == "**":
+                right = self.expression(precedence - 1)
+            else:
+                right = self.expression(precedence)
+            left = Binary(value, left, right)
+
+    def prefix(self) -> ExprNode:
+        kind, value = self.take()
+        if kind == "NUM" or kind == "STR":
+            return Const(value)
+        if kind == "NAME":
+            if value == _FITNESS and self.peek()[0] == "NAME":
+                return Fitness(self.take()[1])
+            return Var(value)
+        if kind == "OP" and value in _UNARY:
+            return Unary(value, self.expression(_UNARY_PRECEDENCE))
+        if kind == "OP" and value == "(":
+            node = self.expression(0)
+            if self.take() != ("OP", ")"):
+                raise ExpressionError("ожидалась `)`")
+            return node
+        raise ExpressionError("ожидался операнд" if kind == "END" else f"неожиданная лексема {value!r}")
+
+
+def parse_expression(text: str) -> ExprNode:
+    """Разбирает текст выражения в дерево без свёртки констант."""
+
+    return _Parser(_tokenize(text)).parse()
+
+
+def fold_constants(node: ExprNode) -> ExprNode:
+    """Вычисляет поддеревья из одних констант; ошибки оставляет до исполнения."""
+
+    if isinstance(node, Unary):
+        operand = fold_constants(node.operand)
+        if isinstance(operand, Const):
+            try:
+                return Const(_UNARY[node.op](operand.value))
+            except (ArithmeticError, TypeError):
+                pass
+        return Unary(node.op, operand)
+    if isinstance(node, Binary):
+        left, right = fold_constants(node.left), fold_constants(node.right)
+        if isinstance(left, Const) and isinstance(right, Const):
+            try:
+                return Const(_BINARY[node.op](left.value, right.value))
+            except (ArithmeticError, TypeError, ValueError):
+                pass
+        return Binary(node.op, left, right)
+    return node
+
+
+def _compile(node: ExprNode) -> Evaluator:
+    if isinstance(node, Const):
+        value = node.value
+        return lambda env, sim: value
+    if isinstance(node, Var):
+        name = node.name
+        return lambda env, sim: env[name]
+    if isinstance(node, Fitness):
+        formula = node.formula
+        return lambda env, sim: sim.formuly[formula]["fitness"]
+    if isinstance(node, Unary):
+        unary = _UNARY[node.op]
+        operand = _compile(node.operand)
+        return lambda env, sim: unary(operand(env, sim))
+    binary = _BINARY[node.op]
+    left = _compile(node.left)
+    # После свёртки константа бывает только с одной стороны: подставляем её без вызова.
+    if isinstance(node.right, Const):
+        right_value = node.right.value
+        return lambda env, sim: binary(left(env, sim), right_value)
+    right = _compile(node.right)
+    if isinstance(node.left, Const):
+        left_value = node.left.value
+        return lambda env, sim: binary(left_value, right(env, sim))
+    return lambda env, sim: binary(left(env, sim), right(env, sim))
+
+
+def _check_integer(node: ExprNode) -> ExprNode:
+    """Оставляет целую арифметику команды `выражение`: литералы усекаются до int."""
+
+    if isinstance(node, Const) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return Const(int(node.value))
+    if isinstance(node, Unary):
+        return Unary(node.op, _check_integer(node.operand))
+    if isinstance(node, Binary) and node.op in _INTEGER_OPS:
+        return Binary(node.op, _check_integer(node.left), _check_integer(node.right))
+    raise ExpressionError("поддерживаются только простые арифметические выражения")
+
+
+@dataclass(frozen=True)
+class CompiledExpression:
+    """Свёрнутое дерево выражения и готовое к вызову замыкание."""
+
+    source: str
+    tree: ExprNode
+    evaluate: Evaluator
+
+    @property
+    def is_constant(self) -> bool:
+        return isinstance(self.tree, Const)
+
+    def __call__(self, variables: Optional[Mapping[str, Any]] = None, sim: Any = None) -> Any:
+        return self.evaluate(variables if variables is not None else {}, sim)
+
+
+@lru_cache(maxsize=4096)
+def _compile_cached(text: str, span: Optional[SourceSpan], integer: bool) -> CompiledExpression:
+    tree = parse_expression(text)
+    if integer:
+        tree = _check_integer(tree)
+    tree = fold_constants(tree)
+    return CompiledExpression(text, tree, _compile(tree))
+
+
+def compile_expression(text: str, span: Optional[SourceSpan] = None, *, integer: bool = False) -> CompiledExpression:
+    """Компилирует выражение (с кэшем по тексту и отрезку исходника).
+
+    ``integer=True`` — режим команды `выражение`: только ``+ - * **`` и унарные
+    знаки над числами, литералы усекаются до целых.
+    """
+
+    return _compile_cached(text, span, integer)
@@ -156,6 +156,22 @@ class Lexer:
         ".": "DOT",
         "=": "ASSIGN",
         ">": "GREATER",
+        "<": "LESS",
+        "+": "PLUS",
+        "-": "MINUS",
+        "*": "STAR",
+        "/": "SLASH",
+        "%": "PERCENT",
+        "(": "LPAREN",
+        ")": "RPAREN",
+    }
+
+    COMPOUND_TOKENS = {
+        "**": "POWER",
+        ">=": "GREATER_EQUAL",
+        "<=": "LESS_EQUAL",
+        "==": "EQUAL",
+        "!=": "NOT_EQUAL",
     }
 
     def __init__(self, source: str) -> None:
@@ -183,6 +199,13 @@ class Lexer:
                 self.column += 2
                 yield Token("ARROW", "->", SourceSpan(start, self._location(back=1)))
                 continue
+            pair = self.source[self.index : self.index + 2]
+            if pair in self.COMPOUND_TOKENS:
+                token = self._make_token(self.COMPOUND_TOKENS[pair], pair, length=2)
+                self.index += 2
+                self.column += 2
+                yield token
+                continue
             if ch == '"':
                 yield self._read_string()
                 continue
@@ -0,0 +1,380 @@
+"""Байткод и виртуальная машина KolibriScript поверх KolibriSim.
+
+Дерево :class:`~core.kolibri_script.parser.Program` один раз компилируется в
+плоский список целых ``[opcode, аргумент, opcode, аргумент, …]`` с таблицами
+констант и имён. Машина стековая: выражения кладут значения на стек, команды
+их снимают и вызывают методы :class:`~core.kolibri_sim.KolibriSim`. Выражения
+заранее компилируются в замыкания (:mod:`.expressions`): константы и голые
+имена превращаются в ``LOAD_CONST``/``LOAD_VAR``, остальное — в один ``EVAL``. Цикл
+исполнения — одна локальная функция без вызовов на каждую инструкцию, а лимит
+шагов защищает от бесконечных ``пока``.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from .expressions import CompiledExpression, ExpressionError, Var, compile_expression
+from .parser import (
+    CallEvolution,
+    CreateFormula,
+    DropFormula,
+    EvaluateFormula,
+    Expression,
+    IfStatement,
+    Node,
+    PrintCanvas,
+    Program,
+    SaveFormula,
+    ShowStatement,
+    SourceSpan,
+    SwarmSend,
+    TeachAssociation,
+    VariableDeclaration,
+    WhileStatement,
+    parse_script,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from ..kolibri_sim import KolibriSim
+
+__all__ = [
+    "Bytecode",
+    "ExecutionResult",
+    "KolibriScriptError",
+    "KolibriVM",
+    "OPCODE_NAMES",
+    "StepLimitExceeded",
+    "compile_program",
+    "run_script",
+]
+
+# Инструкции выражений и переходов.
+LOAD_CONST = 0
+LOAD_VAR = 1
+EVAL = 2
+JUMP = 3
+HALT = 4
+# Всё, что начиная с _FIRST_STATEMENT, — исполнение одного оператора сценария.
+JUMP_IF_FALSE = 5
+STORE = 6
+SHOW = 7
+TEACH = 8
+CREATE = 9
+EVALUATE = 10
+SAVE = 11
+DROP = 12
+EVOLVE = 13
+CANVAS = 14
+SWARM = 15
+_FIRST_STATEMENT = JUMP_IF_FALSE
+
+OPCODE_NAMES = (
+    "LOAD_CONST",
+    "LOAD_VAR",
+    "EVAL",
+    "JUMP",
+    "HALT",
+    "JUMP_IF_FALSE",
+    "STORE",
+    "SHOW",
+    "TEACH",
+    "CREATE",
+    "EVALUATE",
+    "SAVE",
+    "DROP",
+    "EVOLVE",
+    "CANVAS",
+    "SWARM",
+)
+
+_GENERATION = "поколение"
+_RESULT = "итог"
+_TASK = "задача"
+_BUILTINS: Mapping[str, Any] = {"истина": True, "ложь": False, _GENERATION: 0, _RESULT: 0.0}
+
+
+class KolibriScriptError(RuntimeError):
+    """Ошибка компиляции или исполнения сценария с привязкой к исходному тексту."""
+
+    def __init__(self, message: str, span: Optional[SourceSpan] = None) -> None:
+        if span is not None:
+            message = f"{span.start.line}:{span.start.column}: {message}"
+        super().__init__(message)
+        self.span = span
+
+
+class StepLimitExceeded(KolibriScriptError):
+    """Сценарий исчерпал отведённое число инструкций."""
+
+
+@dataclass(frozen=True)
+class Bytecode:
+    """Скомпилированная программа: пары ``opcode, аргумент`` и таблицы операндов."""
+
+    code: Tuple[int, ...]
+    consts: Tuple[Any, ...]
+    names: Tuple[str, ...]
+    spans: Tuple[SourceSpan, ...]
+
+    def __len__(self) -> int:
+        return len(self.code) // 2
+
+    def disassemble(self) -> List[str]:
+        lines = []
+        for index in range(len(self)):
+            op, arg = self.code[2 * index], self.code[2 * index + 1]
+            name = OPCODE_NAMES[op]
+            if op == LOAD_CONST:
+                name += f" {self.consts[arg]!r}"
+            elif op == EVAL:
+                name += f" {self.consts[arg].source}"
+            elif op in (LOAD_VAR, STORE, CREATE, EVALUATE, SAVE, DROP, SWARM):
+                name += f" {self.names[arg]}"
+            elif op in (JUMP, JUMP_IF_FALSE):
+                name += f" -> {arg // 2}"
+            lines.append(f"{index:4d} {name}")
+        return lines
+
+
+class _Compiler:
+    def __init__(self) -> None:
+        self.code: List[int] = []
+        self.consts: List[Any] = []
+        self.names: List[str] = []
+        self.spans: List[SourceSpan] = []
+        self._const_index: Dict[Tuple[type, Any], int] = {}
+        self._expression_index: Dict[int, int] = {}
+        self._name_index: Dict[str, int] = {}
+
+    def emit(self, op: int, arg: int, span: SourceSpan) -> int:
+        self.code.extend((op, arg))
+        self.spans.append(span)
+        return len(self.code) - 2
+
+    def const(self, value: Any) -> int:
+        key = (type(value), value)
+        if key not in self._const_index:
+            self._const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self._const_index[key]
+
+    def name(self, value: str) -> int:
+        if value not in self._name_index:
+            self._name_index[value] = len(self.names)
+            self.names.append(value)
+        return self._name_index[value]
+
+    def patch(self, position: int, target: int) -> None:
+        self.code[position + 1] = target
+
+    # --- Выражения ---
+    def expression(self, expression: Expression) -> None:
+        span = expression.span
+        try:
+            compiled = compile_expression(expression.text, span)
+        except ExpressionError as error:
+            raise KolibriScriptError(f"{error}: {expression.text}", span) from error
+        tree = compiled.tree
+        if compiled.is_constant:
+            self.emit(LOAD_CONST, self.const(tree.value), span)
+        elif isinstance(tree, Var):
+            self.emit(LOAD_VAR, self.name(tree.name), span)
+        else:
+            self.emit(EVAL, self._compiled(compiled), span)
+
+    def _compiled(self, compiled: CompiledExpression) -> int:
+        # Скомпилированные выражения кэшируются, поэтому одинаковый текст делит слот.
+        key = id(compiled)
+        if key not in self._expression_index:
+            self._expression_index[key] = len(self.consts)
+            self.consts.append(compiled)
+        return self._expression_index[key]
+
+    # --- Операторы ---
+    def block(self, statements: Sequence[Node]) -> None:
+        for statement in statements:
+            self.statement(statement)
+
+    def statement(self, node: Node) -> None:
+        span = node.span
+        if isinstance(node, ShowStatement):
+            self.expression(node.value)
+            self.emit(SHOW, 0, span)
+        elif isinstance(node, VariableDeclaration):
+            self.expression(node.value)
+            self.emit(STORE, self.name(node.name), span)
+        elif isinstance(node, TeachAssociation):
+            self.expression(node.left)
+            self.expression(node.right)
+            self.emit(TEACH, 0, span)
+        elif isinstance(node, CreateFormula):
+            self.expression(node.expression)
+            self.emit(CREATE, self.name(node.name), span)
+        elif isinstance(node, EvaluateFormula):
+            self.expression(node.task)
+            self.emit(EVALUATE, self.name(node.name), span)
+        elif isinstance(node, SaveFormula):
+            self.emit(SAVE, self.name(node.name), span)
+        elif isinstance(node, DropFormula):
+            self.emit(DROP, self.name(node.name), span)
+        elif isinstance(node, CallEvolution):
+            self.emit(EVOLVE, 0, span)
+        elif isinstance(node, PrintCanvas):
+            self.emit(CANVAS, 0, span)
+        elif isinstance(node, SwarmSend):
+            self.emit(SWARM, self.name(node.name), span)
+        elif isinstance(node, IfStatement):
+            self.expression(node.condition)
+            to_else = self.emit(JUMP_IF_FALSE, 0, span)
+            self.block(node.then_body)
+            if node.else_body:
+                to_end = self.emit(JUMP, 0, span)
+                self.patch(to_else, len(self.code))
+                self.block(node.else_body)
+                self.patch(to_end, len(self.code))
+            else:
+                self.patch(to_else, len(self.code))
+        elif isinstance(node, WhileStatement):
+            start = len(self.code)
+            self.expression(node.condition)
+            to_end = self.emit(JUMP_IF_FALSE, 0, span)
+            self.block(node.body)
+            self.emit(JUMP, start, span)
+            self.patch(to_end, len(self.code))
+        else:
+            raise KolibriScriptError(f"неизвестный узел {type(node).__name__}", span)
+
+
+def compile_program(program: Program) -> Bytecode:
+    """Компилирует дерево разбора в байткод."""
+
+    compiler = _Compiler()
+    compiler.block(program.statements)
+    compiler.emit(HALT, 0, program.span)
+    return Bytecode(tuple(compiler.code), tuple(compiler.consts), tuple(compiler.names), tuple(compiler.spans))
+
+
+@dataclass
+class ExecutionResult:
+    """Итог прогона: вывод `показать`, переменные и счётчики исполнения."""
+
+    output: List[str] = field(default_factory=list)
+    variables: Dict[str, Any] = field(default_factory=dict)
+    outbox: List[Dict[str, Any]] = field(default_factory=list)
+    steps: int = 0
+    statements: int = 0
+
+
+class KolibriVM:
+    """Исполняет :class:`Bytecode` на экземпляре KolibriSim.
+
+    ``max_steps`` ограничивает число выполненных инструкций (``None`` — без
+    ограничения). ``on_swarm_send`` получает пакет ``{имя: формула}`` для
+    каждой команды `рой отправить`; без него пакеты копятся в ``outbox``.
+    """
+
+    def __init__(
+        self,
+        sim: "KolibriSim",
+        *,
+        max_steps: Optional[int] = 1_000_000,
+        on_swarm_send: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> None:
+        self.sim = sim
+        self.max_steps = max_steps
+        self.on_swarm_send = on_swarm_send
+
+    def run(self, bytecode: Bytecode, variables: Optional[Mapping[str, Any]] = None) -> ExecutionResult:
+        result = ExecutionResult(variables={**_BUILTINS, **(variables or {})})
+        code = bytecode.code
+        consts = bytecode.consts
+        names = bytecode.names
+        env = result.variables
+        output = result.output
+        sim = self.sim
+        limit = self.max_steps if self.max_steps is not None else float("inf")
+        stack: List[Any] = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        steps = 0
+        statements = 0
+        try:
+            while True:
+                op = code[pc]
+                arg = code[pc + 1]
+                pc += 2
+                steps += 1
+                if steps > limit:
+                    raise StepLimitExceeded(f"превышен лимит в {limit} шагов", bytecode.spans[pc // 2 - 1])
+                if op >= _FIRST_STATEMENT:
+                    statements += 1
+                if op == LOAD_CONST:
+                    push(consts[arg])
+                elif op == LOAD_VAR:
+                    push(env[names[arg]])
+                elif op == JUMP_IF_FALSE:
+                    if not pop():
+                        pc = arg
+                elif op == JUMP:
+                    pc = arg
+                elif op == EVAL:
+                    push(consts[arg].evaluate(env, sim))
+                elif op == STORE:
+                    env[names[arg]] = pop()
+                elif op == SHOW:
+                    output.append(str(pop()))
+                elif op == EVOLVE:
+                    sim.evolyuciya_formul("script")
+                    env[_GENERATION] += 1
+                elif op == TEACH:
+                    right = pop()
+                    sim.obuchit_svjaz(str(pop()), str(right))
+                elif op == CREATE:
+                    sim.sozdat_formulu(names[arg], str(pop()))
+                elif op == EVALUATE:
+                    # Оценка задачи моделируется ГПСЧ симуляции, как в турнирах KolibriSim.
+                    env[_TASK] = pop()
+                    env[_RESULT] = sim.ocenit_formulu(names[arg], sim.generator.random())
+                elif op == SAVE:
+                    sim.sohranit_formulu_v_genom(names[arg])
+                elif op == DROP:
+                    sim.otbrosit_formulu(names[arg])
+                elif op == CANVAS:
+                    output.append(" ".join("".join(map(str, sloj)) for sloj in sim.poluchit_canvas()))
+                elif op == SWARM:
+                    packet = sim.podgotovit_otpravku_roju(names[arg])
+                    if self.on_swarm_send is not None:
+                        self.on_swarm_send(packet)
+                    else:
+                        result.outbox.append(packet)
+                elif op == HALT:
+                    break
+        except KolibriScriptError:
+            raise
+        except KeyError as error:
+            raise KolibriScriptError(f"неизвестное имя {error.args[0]}", bytecode.spans[pc // 2 - 1]) from error
+        except Exception as error:
+            raise KolibriScriptError(str(error), bytecode.spans[pc // 2 - 1]) from error
+        finally:
+            result.steps = steps
+            result.statements = statements
+        return result
+
+
+def run_script(
+    source: str,
+    sim: "KolibriSim",
+    *,
+    max_steps: Optional[int] = 1_000_000,
+    variables: Optional[Mapping[str, Any]] = None,
+) -> ExecutionResult:
+    """Разбирает, компилирует и исполняет сценарий; диагностика парсера становится ошибкой."""
+
+    parsed = parse_script(source)
+    if parsed.program is None or parsed.diagnostics:
+        first = parsed.diagnostics[0] if parsed.diagnostics else None
+        raise KolibriScriptError(first.message if first else "пустой сценарий", first.span if first else None)
+    return KolibriVM(sim, max_steps=max_steps).run(compile_program(parsed.program), variables)
@@ -2,7 +2,6 @@
 
 from __future__ import annotations
 
-import ast
 import dataclasses
 import hashlib
 import hmac
@@ -13,6 +12,7 @@ import time
 from pathlib import Path
 from typing import Any, Dict, List, Mapping, Optional, Protocol, Sequence, TypedDict, cast
 
+from .kolibri_script.expressions import compile_expression
 from .kolibri_script.genome import (
     KolibriGenomeLedger,
     SecretsConfig,
@@ -353,30 +353,9 @@ class KolibriSim:
         raise ValueError(f"неизвестная команда: {komanda}")
 
     def _bezopasnoe_vychislenie(self, vyrazhenie: str) -> int:
-        """Вычисляет арифметическое выражение через AST, исключая опасные конструкции."""
-
-        uzel = ast.parse(vyrazhenie, mode="eval")
-        return int(self._evaluate_ast(uzel.body))
-
-    def _evaluate_ast(self, uzel: ast.AST) -> int:
-        """Рекурсивный интерпретатор арифметических выражений для команд REPL."""
-
-        if isinstance(uzel, ast.BinOp) and isinstance(uzel.op, (ast.Add, ast.Sub, ast.Mult, ast.Pow)):
-            levy = self._evaluate_ast(uzel.left)
-            pravy = self._evaluate_ast(uzel.right)
-            if isinstance(uzel.op, ast.Add):
-                return levy + pravy
-            if isinstance(uzel.op, ast.Sub):
-                return levy - pravy
-            if isinstance(uzel.op, ast.Mult):
-                return levy * pravy
-            return levy ** pravy
-        if isinstance(uzel, ast.UnaryOp) and isinstance(uzel.op, (ast.UAdd, ast.USub)):
-            znachenie = self._evaluate_ast(uzel.operand)
-            return znachenie if isinstance(uzel.op, ast.UAdd) else -znachenie
-        if isinstance(uzel, ast.Constant) and isinstance(uzel.value, (int, float)):
-            return int(uzel.value)
-        raise ValueError("поддерживаются только простые арифметические выражения")
+        """Вычисляет целое арифметическое выражение скомпилированным и кэшированным деревом."""
+
+        return int(compile_expression(vyrazhenie, integer=True)())
 
     # --- Эволюция формул ---
     def evolyuciya_formul(self, kontekst: str) -> str:
@@ -416,6 +395,42 @@ class KolibriSim:
         self._registrirovat("FITNESS", f"{nazvanie}:{novoe_znachenie:.3f}")
         return novoe_znachenie
 
+    def sozdat_formulu(self, nazvanie: str, kod: str, kontekst: str = "script") -> str:
+        """Добавляет формулу с заданным именем и кодом (команда `создать формулу`)."""
+
+        zapis: FormulaZapis = {"kod": kod, "fitness": 0.0, "parents": [], "context": kontekst}
+        self.formuly[nazvanie] = zapis
+        if nazvanie not in self.populyaciya:
+            self.populyaciya.append(nazvanie)
+            if len(self.populyaciya) > self.predel_populyacii:
+                self.populyaciya.pop(0)
+        self._registrirovat("FORMULA", f"{nazvanie}:{kod}")
+        return nazvanie
+
+    def sohranit_formulu_v_genom(self, nazvanie: str) -> ZapisBloka:
+        """Фиксирует формулу в геноме блоком `GENE_STORE` и возвращает этот блок."""
+
+        zapis = self.formuly[nazvanie]
+        self._registrirovat("GENE_STORE", f"{nazvanie}:{zapis['kod']}:{zapis['fitness']:.3f}")
+        return self.genom[-1]
+
+    def otbrosit_formulu(self, nazvanie: str) -> bool:
+        """Удаляет формулу из пула без записи в геном; возвращает, была ли она там."""
+
+        if self.formuly.pop(nazvanie, None) is None:
+            return False
+        if nazvanie in self.populyaciya:
+            self.populyaciya.remove(nazvanie)
+        self._registrirovat("DROP", nazvanie)
+        return True
+
+    def podgotovit_otpravku_roju(self, nazvanie: str) -> Dict[str, FormulaRecord]:
+        """Готовит формулу к отправке соседям в формате `exchange_formulas_with_peer`."""
+
+        zapis = self.formuly[nazvanie]
+        self._registrirovat("SWARM_SEND", nazvanie)
+        return {nazvanie: dict(zapis)}  # type: ignore[dict-item]
+
     def zapustit_turniry(self, kolichestvo: int) -> None:
         """Имитация нескольких раундов эволюции с неизменной численностью популяции."""
 
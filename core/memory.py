@@ -2,13 +2,16 @@
 
 from __future__ import annotations
 
+import asyncio
 import json
 import math
+import threading
 import time
-from collections import deque
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Deque, Iterable, List, Optional
+from typing import Deque, Iterable, List, Optional, Sequence, Tuple
 
 from .representations import SymbolicEmbeddingSpace
 
@@ -73,6 +76,8 @@ class LongTermMemory:
         self.max_entries = max_entries
         self.records: List[MemoryRecord] = []
         self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._executor: Optional[ThreadPoolExecutor] = None
         self._load()
 
     def _load(self) -> None:
@@ -104,39 +109,81 @@ class LongTermMemory:
         self._rewrite()
 
     def append(self, text: str, *, meta: Optional[dict[str, str]] = None) -> MemoryRecord:
-        if not text:
-            raise ValueError("Memory text must be non-empty")
-        embedding = self.embeddings.embed_text(text)
-        ttl = self.ttl_seconds
-        meta_copy = dict(meta or {})
-        tags = list(meta_copy.pop("tags", []))
-        record = MemoryRecord(
-            text=text,
-            embedding=embedding,
-            timestamp=time.time(),
-            meta=meta_copy,
-            tags=tags,
-            ttl=ttl,
-        )
-        self.records.append(record)
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-        with self.path.open("a", encoding="utf-8") as handle:
-            handle.write(json.dumps(record.to_json(), ensure_ascii=False) + "\n")
-        self._prune_expired()
-        self._ensure_capacity()
-        return record
+        return self.append_many([(text, meta)])[0]
+
+    def append_many(self, items: Sequence[Tuple[str, Optional[dict[str, str]]]]) -> List[MemoryRecord]:
+        """Добавляет несколько записей за одно открытие файла."""
+
+        created: List[MemoryRecord] = []
+        for text, meta in items:
+            if not text:
+                raise ValueError("Memory text must be non-empty")
+            meta_copy = dict(meta or {})
+            tags = list(meta_copy.pop("tags", []))
+            created.append(
+                MemoryRecord(
+                    text=text,
+                    embedding=self.embeddings.embed_text(text),
+                    timestamp=time.time(),
+                    meta=meta_copy,
+                    tags=tags,
+                    ttl=self.ttl_seconds,
+                )
+            )
+        if not created:
+            return created
+        with self._lock:
+            self.records.extend(created)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("a", encoding="utf-8") as handle:
+                handle.write(
+                    "".join(json.dumps(record.to_json(), ensure_ascii=False) + "\n" for record in created)
+                )
+            self._prune_expired()
+            self._ensure_capacity()
+        return created
 
     def query(self, text: str, *, top_k: int = 3) -> List[tuple[MemoryRecord, float]]:
-        if not self.records:
-            return []
-        self._prune_expired()
-        query_embedding = self.embeddings.embed_text(text)
-        scored = [
-            (record, _cosine_similarity(query_embedding, record.embedding)) for record in self.records
-        ]
+        return self.query_embedding(self.embeddings.embed_text(text), top_k=top_k)
+
+    def query_embedding(self, embedding: List[float], *, top_k: int = 3) -> List[tuple[MemoryRecord, float]]:
+        with self._lock:
+            if not self.records:
+                return []
+            self._prune_expired()
+            scored = [
+                (record, _cosine_similarity(embedding, record.embedding)) for record in self.records
+            ]
         scored.sort(key=lambda item: item[1], reverse=True)
         return scored[:top_k]
 
+    async def aquery(self, text: str, *, top_k: int = 3) -> List[tuple[MemoryRecord, float]]:
+        """Асинхронный :meth:`query`: поиск выполняется в выделенном потоке памяти."""
+
+        return await self._run(self.query, text, top_k=top_k)
+
+    async def aappend_many(
+        self, items: Sequence[Tuple[str, Optional[dict[str, str]]]]
+    ) -> List[MemoryRecord]:
+        """Асинхронный :meth:`append_many` без блокировки цикла событий."""
+
+        return await self._run(self.append_many, list(items))
+
+    async def aembed(self, text: str) -> List[float]:
+        return await self._run(self.embeddings.embed_text, text)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def _run(self, func, *args, **kwargs):  # type: ignore[no-untyped-def]
+        if self._executor is None:
+            # Один поток: чтения и записи памяти упорядочены и не конкурируют за файл.
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ltm")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
     def _prune_expired(self) -> None:
         now = time.time()
         changed = False
@@ -153,6 +200,34 @@ class LongTermMemory:
             self._rewrite()
 
 
+class ConversationEmbeddingCache:
+    """LRU средних эмбеддингов по диалогам для быстрой оценки контекста без скана памяти."""
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.capacity = capacity
+        self._entries: "OrderedDict[str, Tuple[List[float], int]]" = OrderedDict()
+
+    def similarity(self, conversation_id: str, embedding: List[float]) -> float:
+        entry = self._entries.get(conversation_id)
+        if entry is None:
+            return 0.0
+        self._entries.move_to_end(conversation_id)
+        return _cosine_similarity(embedding, entry[0])
+
+    def add(self, conversation_id: str, embedding: List[float]) -> None:
+        entry = self._entries.pop(conversation_id, None)
+        if entry is None:
+            self._entries[conversation_id] = (list(embedding), 1)
+        else:
+            total, count = entry
+            self._entries[conversation_id] = (
+                [(value * count + new) / (count + 1) for value, new in zip(total, embedding)],
+                count + 1,
+            )
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+
 @dataclass
 class WorkingMemorySlot:
     q: int
@@ -203,4 +278,10 @@ class WorkingMemoryBuffer:
         ]
 
 
-__all__ = ["LongTermMemory", "MemoryRecord", "WorkingMemoryBuffer", "WorkingMemorySlot"]
+__all__ = [
+    "ConversationEmbeddingCache",
+    "LongTermMemory",
+    "MemoryRecord",
+    "WorkingMemoryBuffer",
+    "WorkingMemorySlot",
+]
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Compare the JSON envelope and the binary wire format for Θ deltas (size and sign+verify time)."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from backend.federation.delta import ThetaDelta, sign_delta, verify_and_load  # noqa: E402
+from backend.federation.wire import DTYPES, decode_delta, encode_delta  # noqa: E402
+
+KEY = b"bench-key"
+
+
+def _delta(width: int, seed: int) -> ThetaDelta:
+    rng = random.Random(seed)
+    return ThetaDelta(
+        theta=[rng.uniform(-2.5, 2.5) for _ in range(width)],
+        pi=[rng.uniform(-1.0, 1.0) for _ in range(width)],
+        rho=[rng.uniform(-1.0, 1.0) for _ in range(width)],
+        sigma=0.12,
+        updates=rng.randint(1, 10_000),
+        ema_reward=rng.uniform(-1.0, 1.0),
+    )
+
+
+def _time(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="federation wire format benchmark")
+    parser.add_argument("--widths", type=int, nargs="*", default=[16, 256, 4096])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    for width in args.widths:
+        delta = _delta(width, width)
+        envelope = sign_delta(delta, KEY)
+        row = {
+            "width": width,
+            "json": {
+                "bytes": len(envelope.encode("utf-8")),
+                "encode_us": round(_time(lambda: sign_delta(delta, KEY), args.repeat), 1),
+                "decode_us": round(_time(lambda: verify_and_load(envelope, KEY), args.repeat), 1),
+            },
+        }
+        for dtype in DTYPES:
+            blob = encode_delta(delta, KEY, dtype=dtype)
+            row[dtype] = {
+                "bytes": len(blob),
+                "encode_us": round(_time(lambda: encode_delta(delta, KEY, dtype=dtype), args.repeat), 1),
+                "decode_us": round(_time(lambda: decode_delta(blob, KEY), args.repeat), 1),
+            }
+        print(json.dumps(row))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Compare POST /api/feedback with POST /api/feedback/batch in-process.
+
+The app is driven through httpx's ASGI transport, so the numbers include
+request parsing, validation and the repository (dedup, pipeline log, dataset
+writer and θ) but no network. Storage is an in-memory stand-in.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault("KNP_THETA_CONTEXT_MODE", "off")
+
+
+class MemoryStorage:
+    def __init__(self) -> None:
+        self.records = 0
+
+    async def save_feedback(self, payload):
+        raise NotImplementedError
+
+    async def save_records(self, records) -> None:
+        self.records += len(records)
+
+    async def close(self) -> None:
+        return None
+
+
+def _payload(prefix: str, idx: int) -> dict:
+    return {
+        "conversation_id": f"{prefix}-conv-{idx % 50}",
+        "message_id": f"{prefix}-msg-{idx}",
+        "rating": "useful" if idx % 3 else "not_useful",
+        "assistant_message": f"Ответ Колибри номер {idx}",
+        "user_message": "Вопрос",
+    }
+
+
+async def _bench(records: int, batch_size: int, concurrency: int, use_pipeline: bool, tmp_path: Path) -> dict:
+    import httpx
+
+    from backend.feedback_service.dedup import DedupIndex
+    from backend.feedback_service.main import app
+    from backend.feedback_service.pipeline import build_feedback_pipeline
+    from backend.feedback_service.repository import FeedbackRepository, get_repository
+    from backend.feedback_service.rlhf_dataset import RLHFDatasetWriter
+    from backend.feedback_service.theta import ThetaUpdater
+
+    storage = MemoryStorage()
+    dataset = RLHFDatasetWriter(tmp_path / "rlhf_feedback.jsonl")
+    theta = ThetaUpdater(tmp_path / "theta.json", context_mode="off")
+    pipeline = build_feedback_pipeline(tmp_path / "pipeline", storage, dataset, theta) if use_pipeline else None
+    repository = FeedbackRepository(storage, dataset, theta, DedupIndex(tmp_path / "dedup.keys"), pipeline)
+    app.dependency_overrides[get_repository] = lambda: repository
+    results: dict = {"records": records, "pipeline": use_pipeline}
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def _single(idx: int) -> None:
+                async with semaphore:
+                    response = await client.post("/api/feedback", json=_payload("single", idx))
+                    response.raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(_single(idx) for idx in range(records)))
+            elapsed = time.perf_counter() - start
+            results["single"] = {"seconds": round(elapsed, 4), "records_per_s": round(records / elapsed, 1)}
+
+            for fmt in ("json", "ndjson"):
+                start = time.perf_counter()
+                for offset in range(0, records, batch_size):
+                    chunk = [_payload(fmt, idx) for idx in range(offset, min(records, offset + batch_size))]
+                    if fmt == "json":
+                        response = await client.post("/api/feedback/batch", json=chunk)
+                    else:
+                        body = "\n".join(json.dumps(item, ensure_ascii=False) for item in chunk)
+                        response = await client.post(
+                            "/api/feedback/batch",
+                            content=body.encode("utf-8"),
+                            headers={"content-type": "application/x-ndjson"},
+                        )
+                    response.raise_for_status()
+                    assert response.json()["accepted"] == len(chunk)
+                elapsed = time.perf_counter() - start
+                results[f"batch_{fmt}"] = {
+                    "batch_size": batch_size,
+                    "seconds": round(elapsed, 4),
+                    "records_per_s": round(records / elapsed, 1),
+                }
+    finally:
+        app.dependency_overrides.clear()
+        if pipeline is not None:
+            await pipeline.close()
+        await theta.aclose()
+        await dataset.close()
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="single vs bulk feedback submission benchmark")
+    parser.add_argument("--records", type=int, default=5_000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32, help="in-flight single-record requests")
+    parser.add_argument("--no-pipeline", action="store_true", help="use the serial repository path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # θ appends to long-term memory; keep it inside the scratch directory.
+        os.environ["KNP_LTM_PATH"] = str(Path(tmp) / "long_term_memory.jsonl")
+        results = asyncio.run(
+            _bench(args.records, args.batch_size, args.concurrency, not args.no_pipeline, Path(tmp))
+        )
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""KolibriScript VM throughput in statements per second.
+
+Runs one loop-heavy script twice: against a real ``KolibriSim`` (every
+``вызвать эволюцию`` writes an HMAC-chained genome block) and against a no-op
+stand-in that isolates the bytecode dispatch cost.
+
+    python scripts/bench_kolibri_script.py --iterations 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from core.kolibri_script.parser import parse_script  # noqa: E402
+from core.kolibri_script.vm import KolibriVM, compile_program  # noqa: E402
+from core.kolibri_sim import KolibriSim  # noqa: E402
+
+SCRIPT = """начало:
+    пока {iterations} > поколение делать
+        вызвать эволюцию
+        переменная шаг = поколение
+        если шаг > {half} тогда
+            переменная фаза = "поздно"
+        иначе
+            переменная фаза = "рано"
+        конец
+    конец
+конец."""
+
+
+class _DispatchOnlySim:
+    """Accepts the calls the benchmark script makes and does nothing."""
+
+    def evolyuciya_formul(self, kontekst: str) -> str:
+        return "F"
+
+
+def _measure(bytecode, sim) -> dict:
+    vm = KolibriVM(sim, max_steps=None)
+    start = time.perf_counter()
+    result = vm.run(bytecode)
+    elapsed = time.perf_counter() - start
+    return {
+        "statements": result.statements,
+        "instructions": result.steps,
+        "seconds": round(elapsed, 4),
+        "statements_per_s": round(result.statements / elapsed),
+        "instructions_per_s": round(result.steps / elapsed),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="KolibriScript VM benchmark")
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args()
+
+    source = SCRIPT.format(iterations=args.iterations, half=args.iterations // 2)
+    start = time.perf_counter()
+    bytecode = compile_program(parse_script(source).program)
+    compile_ms = (time.perf_counter() - start) * 1000.0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # KolibriSim keeps its long-term memory under ./data
+        report = {
+            "iterations": args.iterations,
+            "instructions_compiled": len(bytecode),
+            "compile_ms": round(compile_ms, 3),
+            "dispatch_only": _measure(bytecode, _DispatchOnlySim()),
+            "kolibri_sim": _measure(bytecode, KolibriSim(zerno=1, trace_path="")),
+        }
+        os.chdir(ROOT)
+    print(json.dumps(report, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
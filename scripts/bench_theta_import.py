@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Measure import time of backend.feedback_service.theta against LTM file size."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from statistics import median
+
+ROOT = Path(__file__).resolve().parents[1]
+
+_PROBE = """
+import time
+start = time.perf_counter()
+import backend.feedback_service.theta as theta
+imported = time.perf_counter()
+theta.get_long_term_memory()
+loaded = time.perf_counter()
+print((imported - start) * 1000.0, (loaded - imported) * 1000.0)
+"""
+
+
+def write_memory(path: Path, records: int) -> None:
+    with path.open("w", encoding="utf-8") as handle:
+        for idx in range(records):
+            entry = {
+                "text": f"Ответ Колибри номер {idx}",
+                "embedding": [((idx * 31 + dim) % 97) / 97.0 for dim in range(32)],
+                "meta": {"role": "assistant"},
+                "timestamp": 0.0,
+            }
+            handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def run_once(memory_path: Path) -> tuple[float, float]:
+    env = {**os.environ, "KNP_LTM_PATH": str(memory_path), "PYTHONPATH": str(ROOT)}
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE], check=True, capture_output=True, text=True, cwd=ROOT, env=env
+    ).stdout.split()
+    return float(output[0]), float(output[1])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="theta import-time benchmark")
+    parser.add_argument("--sizes", nargs="*", type=int, default=[0, 1_000, 10_000, 50_000], help="LTM records")
+    parser.add_argument("--runs", type=int, default=5, help="runs per size")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            memory_path = Path(tmp) / f"ltm_{size}.jsonl"
+            write_memory(memory_path, size)
+            timings = [run_once(memory_path) for _ in range(args.runs)]
+            import_ms = median(timing[0] for timing in timings)
+            load_ms = median(timing[1] for timing in timings)
+            print(f"records={size:6d} import={import_ms:8.2f}ms first_use={load_ms:8.2f}ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Local simulation of tree-shaped federation merges.
+
+Simulated nodes are split across worker processes. Each worker plays the leaf
+level of the tree: it signs its nodes' deltas, verifies them as their parent
+would, and folds every ``fan_in`` of them into a signed partial aggregate.
+The parent process reduces those aggregates level by level (verifying every
+signature) until at most ``fan_in`` remain for the root, and compares the
+result with a flat merge of all deltas.
+
+    python scripts/simulate_federation_tree.py --nodes 10000 --fan-in 32 --workers 8
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from backend.feedback_service.theta import ThetaState  # noqa: E402
+from backend.federation.aggregate import aggregate, sign_aggregate, verify_aggregate  # noqa: E402
+from backend.federation.delta import ThetaDelta, sign_delta, verify_and_load  # noqa: E402
+from backend.federation.merge import merge_deltas_batch  # noqa: E402
+
+KEY = b"simulation-key"
+
+
+def node_delta(node: int, seed: int, width: int) -> ThetaDelta:
+    rng = random.Random(seed * 1_000_003 + node)
+    return ThetaDelta(
+        theta=[rng.uniform(-2.5, 2.5) for _ in range(width)],
+        pi=[rng.uniform(-1.0, 1.0) for _ in range(8)],
+        rho=[rng.uniform(-1.0, 1.0) for _ in range(8)],
+        sigma=rng.uniform(0.05, 0.2),
+        updates=rng.randint(1, 500),
+        ema_reward=rng.uniform(-1.0, 1.0),
+    )
+
+
+def leaf_level(nodes: range, seed: int, width: int, fan_in: int) -> List[str]:
+    """Sign node deltas, verify them and emit one signed aggregate per ``fan_in`` nodes."""
+
+    signed = [sign_delta(node_delta(node, seed, width), KEY) for node in nodes]
+    outputs = []
+    for offset in range(0, len(signed), fan_in):
+        children = [verify_and_load(raw, KEY) for raw in signed[offset : offset + fan_in]]
+        outputs.append(sign_aggregate(aggregate(children), KEY))
+    return outputs
+
+
+def reduce_level(signed: List[str], fan_in: int) -> List[str]:
+    return [
+        sign_aggregate(aggregate(verify_aggregate(raw, KEY) for raw in signed[offset : offset + fan_in]), KEY)
+        for offset in range(0, len(signed), fan_in)
+    ]
+
+
+def simulate(nodes: int, fan_in: int, workers: int, seed: int, width: int) -> dict:
+    state = ThetaState(theta=[1.0, 0.3, -0.2, 0.12], pi=[0.0] * 8, rho=[0.0] * 8)
+    chunk = fan_in * max(1, -(-nodes // (fan_in * workers)))
+    ranges = [range(start, min(nodes, start + chunk)) for start in range(0, nodes, chunk)]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        level = [
+            raw
+            for part in pool.map(leaf_level, ranges, [seed] * len(ranges), [width] * len(ranges), [fan_in] * len(ranges))
+            for raw in part
+        ]
+    leaf_seconds = time.perf_counter() - start
+    depth = 1
+    while len(level) > fan_in:
+        level = reduce_level(level, fan_in)
+        depth += 1
+    root_inputs = len(level)
+    root = aggregate(verify_aggregate(raw, KEY) for raw in level)
+    merged = root.apply_to(state)
+    tree_seconds = time.perf_counter() - start
+
+    deltas = [node_delta(node, seed, width) for node in range(nodes)]
+    start = time.perf_counter()
+    flat = merge_deltas_batch(state, deltas)
+    flat_seconds = time.perf_counter() - start
+    deviation = max(abs(a - b) for a, b in zip(merged.theta + merged.pi, flat.theta + flat.pi))
+
+    return {
+        "nodes": nodes,
+        "fan_in": fan_in,
+        "workers": workers,
+        "depth": depth,
+        "root_inputs": root_inputs,
+        "aggregated_nodes": root.nodes,
+        "leaf_seconds": round(leaf_seconds, 3),
+        "tree_seconds": round(tree_seconds, 3),
+        "flat_merge_seconds": round(flat_seconds, 3),
+        "max_abs_deviation_vs_flat": deviation,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="tree aggregation scaling simulation")
+    parser.add_argument("--nodes", type=int, nargs="*", default=[100, 1_000, 10_000])
+    parser.add_argument("--fan-in", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--width", type=int, default=16, help="length of θ per node")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    for nodes in args.nodes:
+        print(json.dumps(simulate(nodes, args.fan_in, args.workers, args.seed, args.width)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,5 +1,16 @@
 """Kolibri SDK public interface."""
 
-from .client import KolibriAgentClient, AgentStep, AgentState
+from .async_client import AsyncKolibriAgentClient
+from .bench import LoadResult, generate_load, step_load
+from .client import KolibriAgentClient, AgentStep, AgentState, LazyTrace
 
-__all__ = ["KolibriAgentClient", "AgentStep", "AgentState"]
+__all__ = [
+    "KolibriAgentClient",
+    "AsyncKolibriAgentClient",
+    "AgentStep",
+    "AgentState",
+    "LazyTrace",
+    "LoadResult",
+    "generate_load",
+    "step_load",
+]
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import asyncio
+import importlib
+import json
+import random
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+import httpx
+
+from .client import AgentState, AgentStep, _state_from_json, _step_from_json
+
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+_IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+# A POST is only retried when the server cannot have run it: the request never
+# left the client, or the server refused it outright. A read error, or a 502/504
+# from a proxy, may come after the step already ran.
+_UNSENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+_UNSENT_STATUSES = frozenset({429, 503})
+
+
+def _load_json_decoder() -> Callable[[bytes], Any]:
+    """orjson if it is installed, otherwise the standard library."""
+
+    try:
+        return importlib.import_module("orjson").loads
+    except ImportError:
+        return json.loads
+
+
+class AsyncKolibriAgentClient:
+    """Asynchronous client for the Kolibri agent REST API.
+
+    One pooled ``httpx.AsyncClient`` (optionally HTTP/2, which needs the ``h2``
+    package) is shared by all calls. Idempotent requests are retried on any
+    transport error and on 429/502/503/504 responses; ``POST /api/agent/step``
+    only when it cannot have reached the agent (connection errors, 429, 503).
+    Retries use exponential backoff with full jitter.
+    ``fast=True`` decodes with orjson when available and keeps the trace as raw
+    dicts until it is read.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:8056",
+        *,
+        http2: bool = False,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        timeout: float = 10.0,
+        max_concurrency: int = 32,
+        retries: int = 3,
+        backoff_base: float = 0.05,
+        backoff_max: float = 2.0,
+        fast: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_keepalive_connections
+            ),
+            transport=transport,
+        )
+        self._max_concurrency = max(1, max_concurrency)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._retries = max(0, retries)
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._fast = fast
+        self._loads = _load_json_decoder() if fast else json.loads
+        self.retried = 0
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def _request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        if method.upper() in _IDEMPOTENT_METHODS:
+            retry_errors: tuple = (httpx.TransportError,)
+            retry_statuses = RETRY_STATUSES
+        else:
+            retry_errors, retry_statuses = _UNSENT_ERRORS, _UNSENT_STATUSES
+        attempt = 0
+        while True:
+            try:
+                response = await self._client.request(method, url, **kwargs)
+                if response.status_code not in retry_statuses or attempt >= self._retries:
+                    response.raise_for_status()
+                    return response
+            except retry_errors:
+                if attempt >= self._retries:
+                    raise
+            attempt += 1
+            self.retried += 1
+            delay = min(self._backoff_max, self._backoff_base * 2 ** (attempt - 1))
+            await asyncio.sleep(random.uniform(0.0, delay))
+
+    def _decode(self, response: httpx.Response) -> Any:
+        return self._loads(response.content)
+
+    async def step(
+        self,
+        *,
+        q: int | str,
+        beam: int = 16,
+        depth: int = 8,
+        tags: Optional[Iterable[str]] = None,
+        timeout: Optional[float] = None,
+    ) -> AgentStep:
+        payload: dict = {"q": q, "beam": beam, "depth": depth}
+        if tags:
+            payload["tags"] = list(tags)
+        kwargs: dict = {"json": payload}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        response = await self._request("POST", "/api/agent/step", **kwargs)
+        return _step_from_json(self._decode(response), lazy_trace=self._fast)
+
+    async def step_many(
+        self,
+        queries: Sequence[int | str],
+        *,
+        beam: int = 16,
+        depth: int = 8,
+        tags: Optional[Iterable[str]] = None,
+        return_exceptions: bool = False,
+    ) -> List[Any]:
+        """Run ``step`` for every query, at most ``max_concurrency`` in flight; results keep query order."""
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        semaphore = self._semaphore
+        tag_list = list(tags) if tags else None
+
+        async def one(q: int | str) -> AgentStep:
+            async with semaphore:
+                return await self.step(q=q, beam=beam, depth=depth, tags=tag_list)
+
+        return await asyncio.gather(*(one(q) for q in queries), return_exceptions=return_exceptions)
+
+    async def state(self, timeout: Optional[float] = None) -> AgentState:
+        kwargs: dict = {} if timeout is None else {"timeout": timeout}
+        response = await self._request("GET", "/api/agent/state", **kwargs)
+        return _state_from_json(self._decode(response))
+
+    async def __aenter__(self) -> "AsyncKolibriAgentClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.aclose()
+
+
+__all__ = ["AsyncKolibriAgentClient", "RETRY_STATUSES"]
@@ -0,0 +1,394 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+import httpx
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .async_client import AsyncKolibriAgentClient
+
+PERCENTILES = (50.0, 95.0, 99.0, 99.9)
+
+
+class LatencyHistogram:
+    """HDR-style log-linear histogram of latencies in microseconds.
+
+    Values below ``2**significant_bits`` are counted exactly; above that every
+    power-of-two range is split into ``2**(significant_bits - 1)`` buckets, so
+    the relative error stays under ``2**-(significant_bits - 1)`` (about 1.6 %
+    for the default 7 bits) at any magnitude and memory grows only with the
+    logarithm of the largest value.
+    """
+
+    def __init__(self, significant_bits: int = 7) -> None:
+        self._bits = significant_bits
+        self._half = 1 << (significant_bits - 1)
+        self._counts: Counter[int] = Counter()
+        self.count = 0
+        self.total_us = 0
+        self.min_us: Optional[int] = None
+        self.max_us = 0
+
+    def _index(self, value: int) -> int:
+        shift = max(0, value.bit_length() - self._bits)
+        return (shift << (self._bits - 1)) + (value >> shift)
+
+    def _upper(self, index: int) -> int:
+        if index < (1 << self._bits):
+            return index
+        shift = (index - self._half) >> (self._bits - 1)
+        sub = index - (shift << (self._bits - 1))
+        return ((sub + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        value = max(0, int(seconds * 1_000_000))
+        self._counts[self._index(value)] += 1
+        self.count += 1
+        self.total_us += value
+        self.max_us = max(self.max_us, value)
+        self.min_us = value if self.min_us is None else min(self.min_us, value)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        self._counts.update(other._counts)
+        self.count += other.count
+        self.total_us += other.total_us
+        self.max_us = max(self.max_us, other.max_us)
+        if other.min_us is not None:
+            self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+
+    def percentile_us(self, p: float) -> int:
+        """Upper bound of the bucket holding the ``p``-th percentile (never below the true value)."""
+
+        if not self.count:
+            return 0
+        rank = max(1, int(p / 100.0 * self.count + 0.5))
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            if seen >= rank:
+                return min(self._upper(index), self.max_us)
+        return self.max_us
+
+    def summary(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"count": self.count}
+        if self.count:
+            result["min_ms"] = (self.min_us or 0) / 1000.0
+            result["mean_ms"] = round(self.total_us / self.count / 1000.0, 3)
+            for p in PERCENTILES:
+                result[f"p{p:g}_ms".replace(".", "")] = self.percentile_us(p) / 1000.0
+            result["max_ms"] = self.max_us / 1000.0
+        return result
+
+
+@dataclass
+class LoadResult:
+    """Outcome of a load run: latency histogram of successful calls plus error and drop counts."""
+
+    histogram: LatencyHistogram = field(default_factory=LatencyHistogram)
+    statuses: Counter = field(default_factory=Counter)
+    errors: int = 0
+    dropped: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def requests(self) -> int:
+        return self.histogram.count + self.errors
+
+    @property
+    def throughput(self) -> float:
+        return self.histogram.count / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, p: float) -> float:
+        """``p``-th percentile latency in seconds (see :meth:`LatencyHistogram.percentile_us`)."""
+
+        return self.histogram.percentile_us(p) / 1_000_000
+
+    def summary(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "requests": self.requests,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "elapsed_s": round(self.elapsed, 4),
+            "throughput_rps": round(self.throughput, 2),
+            "latency": self.histogram.summary(),
+        }
+        if self.statuses:
+            result["status"] = {str(code): count for code, count in sorted(self.statuses.items())}
+        return result
+
+
+async def generate_load(
+    call: Callable[[int], Awaitable[Any]],
+    *,
+    concurrency: int = 16,
+    rps: Optional[float] = None,
+    poisson: bool = False,
+    max_in_flight: int = 10_000,
+    requests: Optional[int] = None,
+    duration: Optional[float] = None,
+    observe: Optional[Callable[[int, Optional[float]], None]] = None,
+) -> LoadResult:
+    """Call ``call(i)`` closed-loop from ``concurrency`` workers, or open-loop at ``rps``.
+
+    In open-loop mode calls start on a fixed (or Poisson) schedule regardless of
+    how many are still outstanding, and latency is measured from the *scheduled*
+    start, so a stalled server shows up in the tail instead of silently lowering
+    the offered load (coordinated omission). Arrivals beyond ``max_in_flight``
+    outstanding calls are counted as dropped. A call that raises is an error.
+    The run stops after ``requests`` calls or ``duration`` seconds, whichever
+    comes first; ``observe(i, latency)`` sees every finished call, with
+    ``None`` for errors.
+    """
+
+    if requests is None and duration is None:
+        raise ValueError("requests or duration is required")
+    result = LoadResult()
+    limit = requests if requests is not None else float("inf")
+    started = time.perf_counter()
+    deadline = started + duration if duration is not None else float("inf")
+
+    async def fire(index: int, scheduled: float) -> None:
+        latency: Optional[float] = None
+        try:
+            await call(index)
+        except Exception:
+            result.errors += 1
+        else:
+            latency = time.perf_counter() - scheduled
+            result.histogram.record(latency)
+        if observe is not None:
+            observe(index, latency)
+
+    if rps is not None:
+        interval = 1.0 / rps
+        pending: set[asyncio.Task[None]] = set()
+        scheduled = started
+        for index in itertools.count():
+            if not poisson:
+                # Multiply instead of accumulating so float drift cannot add an extra arrival.
+                scheduled = started + index * interval
+            if index >= limit or scheduled >= deadline:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(pending) >= max(1, max_in_flight):
+                result.dropped += 1
+            else:
+                task = asyncio.create_task(fire(index, scheduled))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if poisson:
+                scheduled += random.expovariate(rps)
+        if pending:
+            await asyncio.gather(*pending)
+    else:
+        counter = itertools.count()
+
+        async def worker() -> None:
+            while time.perf_counter() < deadline:
+                index = next(counter)
+                if index >= limit:
+                    return
+                await fire(index, time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+async def step_load(
+    client: "AsyncKolibriAgentClient",
+    *,
+    concurrency: int = 16,
+    rps: Optional[float] = None,
+    requests: Optional[int] = None,
+    duration: Optional[float] = None,
+    beam: int = 16,
+    depth: int = 8,
+) -> LoadResult:
+    """Drive ``/api/agent/step`` with distinct queries through :func:`generate_load`."""
+
+    return await generate_load(
+        lambda index: client.step(q=index, beam=beam, depth=depth),
+        concurrency=concurrency,
+        rps=rps,
+        requests=requests,
+        duration=duration,
+    )
+
+
+@dataclass
+class Target:
+    name: str
+    url: str
+    payload: Callable[[int], Dict[str, Any]]
+    result: LoadResult = field(default_factory=LoadResult)
+
+    def summary(self) -> Dict[str, Any]:
+        return {"url": self.url, **self.result.summary()}
+
+
+def step_target(base_url: str, *, beam: int = 16, depth: int = 8) -> Target:
+    return Target("step", f"{base_url.rstrip('/')}/api/agent/step", lambda i: {"q": i, "beam": beam, "depth": depth})
+
+
+def infer_target(base_url: str, *, beam: int = 8, depth: int = 6) -> Target:
+    return Target("infer", f"{base_url.rstrip('/')}/api/infer", lambda i: {"q": i + 1, "beam": beam, "depth": depth})
+
+
+def feedback_target(base_url: str) -> Target:
+    return Target(
+        "feedback",
+        f"{base_url.rstrip('/')}/api/feedback",
+        lambda i: {
+            "conversation_id": f"bench-{os.getpid()}",
+            "message_id": f"bench-{os.getpid()}-{i}",
+            "rating": "useful" if i % 2 else "not_useful",
+            "assistant_message": f"bench message {i}",
+        },
+    )
+
+
+class LoadBench:
+    """Drives a rotation of targets through :func:`generate_load` open-loop at ``rps`` or closed-loop.
+
+    Call ``i`` goes to ``targets[i % len(targets)]``; the report holds the
+    overall :class:`LoadResult` summary and one per target. Responses with
+    status 400 and above count as errors.
+    """
+
+    def __init__(
+        self,
+        targets: Sequence[Target],
+        *,
+        duration: float,
+        rps: Optional[float] = None,
+        concurrency: Optional[int] = None,
+        poisson: bool = False,
+        max_in_flight: int = 10_000,
+        timeout: float = 10.0,
+        http2: bool = False,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        if not targets:
+            raise ValueError("at least one target is required")
+        if (rps is None) == (concurrency is None):
+            raise ValueError("exactly one of rps and concurrency is required")
+        self.targets = list(targets)
+        self.duration = duration
+        self.rps = rps
+        self.concurrency = concurrency
+        self.poisson = poisson
+        self.max_in_flight = max(1, max_in_flight)
+        limit = concurrency or max_in_flight
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=min(limit, 1000), max_keepalive_connections=min(limit, 1000)),
+            transport=transport,
+        )
+        self.result = LoadResult()
+
+    def _target(self, index: int) -> Target:
+        return self.targets[index % len(self.targets)]
+
+    async def _call(self, index: int) -> None:
+        target = self._target(index)
+        response = await self._client.post(target.url, json=target.payload(index))
+        target.result.statuses[response.status_code] += 1
+        response.raise_for_status()
+
+    def _observe(self, index: int, latency: Optional[float]) -> None:
+        result = self._target(index).result
+        if latency is None:
+            result.errors += 1
+        else:
+            result.histogram.record(latency)
+
+    async def run(self) -> Dict[str, Any]:
+        try:
+            self.result = await generate_load(
+                self._call,
+                concurrency=self.concurrency or 1,
+                rps=self.rps,
+                poisson=self.poisson,
+                max_in_flight=self.max_in_flight,
+                duration=self.duration,
+                observe=self._observe,
+            )
+        finally:
+            await self._client.aclose()
+        for target in self.targets:
+            target.result.elapsed = self.result.elapsed
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "mode": "open" if self.rps is not None else "closed",
+            "arrivals": "poisson" if self.poisson else "uniform",
+            "target_rps": self.rps,
+            "concurrency": self.concurrency,
+            **self.result.summary(),
+            "targets": {target.name: target.summary() for target in self.targets},
+        }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(app: str, *, port: Optional[int] = None, wait: float = 30.0) -> Tuple[subprocess.Popen, str]:
+    """Start ``uvicorn <app>`` on localhost and wait until it accepts connections."""
+
+    port = port or _free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    )
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"uvicorn did not start within {wait:g}s")
+
+
+def stop_local_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:  # pragma: no cover - stuck server
+        process.kill()
+
+
+__all__ = [
+    "LatencyHistogram",
+    "LoadBench",
+    "LoadResult",
+    "PERCENTILES",
+    "Target",
+    "feedback_target",
+    "generate_load",
+    "infer_target",
+    "start_local_server",
+    "step_load",
+    "step_target",
+    "stop_local_server",
+]
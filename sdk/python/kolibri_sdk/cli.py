@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
 import json
 import sys
 
+from .bench import LoadBench, feedback_target, infer_target, start_local_server, step_target, stop_local_server
 from .client import KolibriAgentClient
 
 
@@ -20,12 +22,64 @@ def _build_parser() -> argparse.ArgumentParser:
     state_parser = subparsers.add_parser("state", help="Снимок состояния агента")
     state_parser.add_argument("--full", action="store_true", help="Показать рабочую память")
 
+    bench_parser = subparsers.add_parser("bench", help="Нагрузочный тест с гистограммой задержек (JSON)")
+    load = bench_parser.add_mutually_exclusive_group(required=True)
+    load.add_argument("--rps", type=float, help="Открытый цикл: целевая частота запросов в секунду")
+    load.add_argument("--concurrency", type=int, help="Замкнутый цикл: число одновременных клиентов")
+    bench_parser.add_argument("--duration", type=float, default=10.0, help="Длительность, секунды")
+    bench_parser.add_argument("--poisson", action="store_true", help="Пуассоновские прибытия вместо равномерных")
+    bench_parser.add_argument("--beam", type=int, default=16)
+    bench_parser.add_argument("--depth", type=int, default=8)
+    bench_parser.add_argument("--no-step", action="store_true", help="Не нагружать /api/agent/step")
+    bench_parser.add_argument("--infer-url", help="Добавить /api/infer этого сервиса")
+    bench_parser.add_argument("--feedback-url", help="Добавить /api/feedback этого сервиса")
+    bench_parser.add_argument("--max-in-flight", type=int, default=10_000)
+    bench_parser.add_argument("--timeout", type=float, default=10.0)
+    bench_parser.add_argument("--http2", action="store_true")
+    bench_parser.add_argument(
+        "--serve",
+        metavar="MODULE:APP",
+        help="Запустить локальный uvicorn (например backend.agent.main:app) и нагружать его",
+    )
+
     return parser
 
 
+def _bench(args: argparse.Namespace) -> int:
+    server = None
+    base_url = args.base_url
+    if args.serve:
+        server, base_url = start_local_server(args.serve)
+    try:
+        targets = [] if args.no_step else [step_target(base_url, beam=args.beam, depth=args.depth)]
+        if args.infer_url:
+            targets.append(infer_target(args.infer_url))
+        if args.feedback_url:
+            targets.append(feedback_target(args.feedback_url))
+        bench = LoadBench(
+            targets,
+            duration=args.duration,
+            rps=args.rps,
+            concurrency=args.concurrency,
+            poisson=args.poisson,
+            max_in_flight=args.max_in_flight,
+            timeout=args.timeout,
+            http2=args.http2,
+        )
+        report = asyncio.run(bench.run())
+    finally:
+        if server is not None:
+            stop_local_server(server)
+    json.dump(report, sys.stdout, indent=2, ensure_ascii=False)
+    sys.stdout.write("\n")
+    return 0
+
+
 def main(argv: list[str] | None = None) -> int:
     parser = _build_parser()
     args = parser.parse_args(argv)
+    if args.command == "bench":
+        return _bench(args)
 
     client = KolibriAgentClient(base_url=args.base_url)
     try:
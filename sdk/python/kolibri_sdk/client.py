@@ -1,8 +1,9 @@
 from __future__ import annotations
 
 import datetime as _dt
+from collections.abc import Sequence
 from dataclasses import dataclass
-from typing import Iterable, List, Optional
+from typing import Any, Iterable, Iterator, List, Optional
 
 import httpx
 
@@ -48,6 +49,73 @@ class AgentState:
     working_memory: List[WorkingMemorySlot]
 
 
+class LazyTrace(Sequence):
+    """Trace that keeps raw dicts and builds :class:`TraceNode` objects only when they are read."""
+
+    __slots__ = ("_raw", "_nodes")
+
+    def __init__(self, raw: List[dict]) -> None:
+        self._raw = raw
+        self._nodes: Optional[List[TraceNode]] = None
+
+    def _materialize(self) -> List[TraceNode]:
+        if self._nodes is None:
+            self._nodes = [TraceNode(**node) for node in self._raw]
+            self._raw = []
+        return self._nodes
+
+    def __len__(self) -> int:
+        return len(self._nodes) if self._nodes is not None else len(self._raw)
+
+    def __getitem__(self, index: Any) -> Any:
+        return self._materialize()[index]
+
+    def __iter__(self) -> Iterator[TraceNode]:
+        return iter(self._materialize())
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Sequence):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LazyTrace({len(self)} nodes)"
+
+
+def _slots(data: dict) -> List[WorkingMemorySlot]:
+    return [WorkingMemorySlot(**slot) for slot in data.get("working_memory", [])]
+
+
+def _step_from_json(data: dict, *, lazy_trace: bool = False) -> AgentStep:
+    trace = data.get("trace", [])
+    return AgentStep(
+        q=data["q"],
+        modulated_q=data["modulated_q"],
+        chi=data["chi"],
+        phi=data["phi"],
+        score=data["score"],
+        best_id=data["best_id"],
+        beam=data["beam"],
+        depth=data["depth"],
+        trace=LazyTrace(trace) if lazy_trace else [TraceNode(**node) for node in trace],  # type: ignore[arg-type]
+        working_memory=_slots(data),
+        theta=data.get("theta", {}),
+        timestamp=_dt.datetime.fromtimestamp(data.get("timestamp", 0.0)),
+    )
+
+
+def _state_from_json(data: dict) -> AgentState:
+    return AgentState(
+        theta=data.get("theta", []),
+        pi=data.get("pi", []),
+        rho=data.get("rho", []),
+        sigma=data.get("sigma", 0.0),
+        updates=data.get("updates", 0),
+        ema_reward=data.get("ema_reward", 0.0),
+        working_memory=_slots(data),
+    )
+
+
 class KolibriAgentClient:
     """Python client for Kolibri agent REST API."""
 
@@ -71,35 +139,12 @@ class KolibriAgentClient:
             payload["tags"] = list(tags)
         response = self._client.post("/api/agent/step", json=payload, timeout=timeout)
         response.raise_for_status()
-        data = response.json()
-        return AgentStep(
-            q=data["q"],
-            modulated_q=data["modulated_q"],
-            chi=data["chi"],
-            phi=data["phi"],
-            score=data["score"],
-            best_id=data["best_id"],
-            beam=data["beam"],
-            depth=data["depth"],
-            trace=[TraceNode(**node) for node in data.get("trace", [])],
-            working_memory=[WorkingMemorySlot(**slot) for slot in data.get("working_memory", [])],
-            theta=data.get("theta", {}),
-            timestamp=_dt.datetime.fromtimestamp(data.get("timestamp", 0.0)),
-        )
+        return _step_from_json(response.json())
 
     def state(self, timeout: Optional[float] = 5.0) -> AgentState:
         response = self._client.get("/api/agent/state", timeout=timeout)
         response.raise_for_status()
-        data = response.json()
-        return AgentState(
-            theta=data.get("theta", []),
-            pi=data.get("pi", []),
-            rho=data.get("rho", []),
-            sigma=data.get("sigma", 0.0),
-            updates=data.get("updates", 0),
-            ema_reward=data.get("ema_reward", 0.0),
-            working_memory=[WorkingMemorySlot(**slot) for slot in data.get("working_memory", [])],
-        )
+        return _state_from_json(response.json())
 
     def __enter__(self) -> "KolibriAgentClient":
         return self
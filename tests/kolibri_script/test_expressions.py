@@ -0,0 +1,155 @@
+"""Тесты компилируемых выражений KolibriScript."""
+
+from __future__ import annotations
+
+import ast
+import sys
+import textwrap
+import time
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from core.kolibri_script.expressions import (  # noqa: E402
+    MAX_POWER_BITS,
+    Binary,
+    Const,
+    ExpressionError,
+    Unary,
+    Var,
+    compile_expression,
+    parse_expression,
+)
+from core.kolibri_script.parser import parse_script  # noqa: E402
+from core.kolibri_script.vm import EVAL, LOAD_CONST, KolibriScriptError, compile_program, run_script  # noqa: E402
+from core.kolibri_sim import KolibriSim  # noqa: E402
+
+
+@pytest.fixture()
+def sim(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> KolibriSim:
+    # Долговременная память пишет в data/ относительно рабочего каталога.
+    monkeypatch.chdir(tmp_path)
+    return KolibriSim(zerno=3, trace_path="")
+
+
+def test_precedence_folding_and_cache() -> None:
+    assert parse_expression("-2 ** 2 + x") == Binary("+", Unary("-", Binary("**", Const(2), Const(2))), Var("x"))
+    assert compile_expression("2 ** 3 ** 2")() == 512
+
+    folded = compile_expression("x * (2 + 3) > 10 - 1")
+    assert folded.tree == Binary(">", Binary("*", Var("x"), Const(5)), Const(9))
+    assert folded({"x": 2}) is True and folded({"x": 1}) is False
+    assert compile_expression("x * (2 + 3) > 10 - 1") is folded
+
+    with pytest.raises(ExpressionError, match="цепочки"):
+        compile_expression("1 < 2 < 3")
+    with pytest.raises(ExpressionError, match="только простые арифметические"):
+        compile_expression("x + 1", integer=True)
+
+
+def test_vm_compiles_conditions_once(sim: KolibriSim) -> None:
+    script = textwrap.dedent(
+        """
+        начало:
+            переменная шаг = 2 * (3 + 4)
+            пока поколение * 2 < шаг - 8 делать
+                вызвать эволюцию
+            конец
+            если поколение >= 3 тогда
+                показать поколение ** 2 - 1
+            конец
+        конец.
+        """
+    ).strip()
+    bytecode = compile_program(parse_script(script).program)
+
+    assert bytecode.code[:2] == (LOAD_CONST, bytecode.consts.index(14))
+    assert [line.split(maxsplit=1)[1] for line in bytecode.disassemble() if "EVAL" in line] == [
+        "EVAL поколение * 2 < шаг - 8",
+        "EVAL поколение >= 3",
+        "EVAL поколение ** 2 - 1",
+    ]
+    assert sum(op == EVAL for op in bytecode.code[::2]) == 3
+
+    result = run_script(script, sim)
+    assert result.variables["поколение"] == 3 and result.output == ["8"]
+
+    with pytest.raises(KolibriScriptError, match="2:14: ожидался операнд"):
+        run_script("начало:\n    показать 1 +\nконец.", sim)
+
+
+def test_sim_expression_command_keeps_integer_semantics(sim: KolibriSim) -> None:
+    assert sim.dobrovolnaya_otpravka("выражение", "(1 + 2) * 3 - 2 ** 3") == "1"
+    assert sim.dobrovolnaya_otpravka("выражение", "2.7 * 2") == "4"
+    with pytest.raises(ValueError):
+        sim.dobrovolnaya_otpravka("выражение", "__import__('os')")
+
+
+def _legacy_eval(text: str) -> int:
+    """Прежний разбор команды `выражение` через ``ast`` — эталон для сравнения."""
+
+    def _walk(node: ast.AST) -> int:
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Pow)):
+            left, right = _walk(node.left), _walk(node.right)
+            if isinstance(node.op, ast.Add):
+                return left + right
+            if isinstance(node.op, ast.Sub):
+                return left - right
+            if isinstance(node.op, ast.Mult):
+                return left * right
+            return left**right
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            value = _walk(node.operand)
+            return value if isinstance(node.op, ast.UAdd) else -value
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return int(node.value)
+        raise ValueError("поддерживаются только простые арифметические выражения")
+
+    return int(_walk(ast.parse(text, mode="eval").body))
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "2+2*2",
+        "-2 ** 2",
+        "2 ** -1",
+        "2 ** 3 ** 2",
+        "(1 + 2) * (3 - 4)",
+        "2.7 * 2",
+        ".5 + 1.",
+        "1e3 + 2.5E-1",
+        "0x10 * 0o17 - 0b101",
+        "1_000 * 3",
+        "+-+3",
+    ],
+)
+def test_integer_mode_matches_legacy_ast_evaluator(sim: KolibriSim, text: str) -> None:
+    assert sim._bezopasnoe_vychislenie(text) == _legacy_eval(text)
+
+
+@pytest.mark.parametrize("text", ["2 +", "(1 + 2", "1 / 2", "x + 1", "1 < 2", '"a"', "2 % 3", "1x"])
+def test_integer_mode_rejects_what_legacy_evaluator_rejects(sim: KolibriSim, text: str) -> None:
+    with pytest.raises((SyntaxError, ValueError)):
+        _legacy_eval(text)
+    with pytest.raises(ValueError):
+        sim._bezopasnoe_vychislenie(text)
+
+
+def test_huge_powers_are_not_folded_and_fail_under_the_vm(sim: KolibriSim) -> None:
+    started = time.perf_counter()
+    compiled = compile_expression("10 ** 10 ** 10")
+    assert isinstance(compiled.tree, Binary) and compiled.tree.right == Const(10**10)
+    assert compile_expression("2 ** 100")() == 2**100
+    with pytest.raises(OverflowError):
+        compiled()
+
+    with pytest.raises(KolibriScriptError, match="2:14: слишком большая степень"):
+        run_script("начало:\n    показать 10 ** 10 ** 10\nконец.", sim)
+    with pytest.raises(OverflowError):
+        sim.dobrovolnaya_otpravka("выражение", f"2 ** {MAX_POWER_BITS + 1}")
+    assert time.perf_counter() - started < 1.0
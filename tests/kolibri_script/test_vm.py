@@ -0,0 +1,87 @@
+"""Тесты байткода и виртуальной машины KolibriScript."""
+
+from __future__ import annotations
+
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from core.kolibri_script.parser import parse_script  # noqa: E402
+from core.kolibri_script.vm import (  # noqa: E402
+    KolibriScriptError,
+    KolibriVM,
+    StepLimitExceeded,
+    compile_program,
+    run_script,
+)
+from core.kolibri_sim import KolibriSim  # noqa: E402
+
+
+@pytest.fixture()
+def sim(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> KolibriSim:
+    # Долговременная память пишет в data/ относительно рабочего каталога.
+    monkeypatch.chdir(tmp_path)
+    return KolibriSim(zerno=7, trace_path="")
+
+
+def test_program_runs_against_sim(sim: KolibriSim) -> None:
+    script = textwrap.dedent(
+        """
+        начало:
+            показать "Kolibri готов к обучению"
+            переменная память = "фрактал"
+            показать память
+            обучить связь "привет" -> "здравствуй"
+            создать формулу сумма из "a + b"
+            оценить сумма на задаче "2+2"
+            если фитнес сумма > 2 тогда
+                сохранить сумма в геном
+            иначе
+                рой отправить сумма
+                отбросить сумма
+            конец
+            пока 3 > поколение делать
+                вызвать эволюцию
+            конец
+        конец.
+        """
+    ).strip()
+
+    result = run_script(script, sim)
+
+    assert result.output == ["Kolibri готов к обучению", "фрактал"]
+    assert sim.znanija["привет"] == "здравствуй"
+    assert result.variables["память"] == "фрактал" and result.variables["задача"] == "2+2"
+    assert result.outbox == [{"сумма": {"kod": "a + b", "fitness": result.variables["итог"], "parents": [],
+                                        "context": "script"}}]
+    assert "сумма" not in sim.formuly and len(sim.formuly) == 3
+    assert result.variables["поколение"] == 3
+    assert result.statements == 16 and sim.proverit_genom()
+
+
+def test_bytecode_is_flat_and_shares_constants(sim: KolibriSim) -> None:
+    parsed = parse_script('начало:\n    показать "a"\n    показать "a"\n    если истина тогда\n        показать "b"\n    конец\nконец.')
+    bytecode = compile_program(parsed.program)
+
+    assert all(isinstance(value, int) for value in bytecode.code)
+    assert bytecode.consts == ("a", "b")
+    assert bytecode.disassemble()[5] == "   5 JUMP_IF_FALSE -> 8"
+    assert KolibriVM(sim).run(bytecode).output == ["a", "a", "b"]
+
+
+def test_step_limit_and_errors_point_to_source(sim: KolibriSim) -> None:
+    endless = "начало:\n    пока истина делать\n        показать 1\n    конец\nконец."
+    with pytest.raises(StepLimitExceeded) as info:
+        run_script(endless, sim, max_steps=100)
+    assert info.value.span.start.line in (2, 3)
+
+    with pytest.raises(KolibriScriptError, match="3:5: неизвестное имя"):
+        run_script("начало:\n    показать 1\n    оценить нет на задаче 1\nконец.", sim)
+    with pytest.raises(KolibriScriptError):
+        run_script("начало:\n    телепортировать 1\nконец.", sim)
@@ -3,6 +3,8 @@ from __future__ import annotations
 import asyncio
 from pathlib import Path
 
+import pytest
+
 from backend.feedback_service.theta import ThetaState, ThetaUpdater
 from backend.federation.delta import ThetaDelta, sign_delta, verify_and_load
 from backend.federation.merge import merge_deltas
@@ -35,3 +37,277 @@ def test_merge_and_persist(tmp_path: Path) -> None:
 
     value = asyncio.run(_work())
     assert value == asyncio.run(updater.current_state()).theta[0]
+
+
+def _delta(seed: int) -> ThetaDelta:
+    return ThetaDelta(
+        theta=[0.1 * seed, -0.3 + seed, 1e-9 * seed, 0.7],
+        pi=[float(seed)] * 3,
+        rho=[0.5] * (seed % 3),
+        sigma=0.1 + 0.01 * seed,
+        updates=seed,
+        ema_reward=0.05 * seed,
+    )
+
+
+def test_batch_merge_matches_flat_merge_and_ignores_order() -> None:
+    from backend.federation.merge import merge_deltas_batch
+
+    state = ThetaState(theta=[1.0, 0.3, -0.2, 0.12], pi=[0.0] * 3, rho=[0.0] * 3)
+    deltas = [_delta(seed) for seed in range(1, 40)]
+    batched = merge_deltas_batch(state, deltas)
+    flat = merge_deltas(state, deltas)
+    for left, right in ((batched.theta, flat.theta), (batched.pi, flat.pi), (batched.rho, flat.rho)):
+        assert len(left) == len(right)
+        assert all(abs(a - b) < 1e-12 for a, b in zip(left, right))
+    assert abs(batched.sigma - flat.sigma) < 1e-12
+    assert merge_deltas_batch(state, list(reversed(deltas))) == batched
+
+
+def test_merge_batch_endpoint_persists_once(tmp_path: Path) -> None:
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from backend.feedback_service.theta import get_theta_updater
+    from backend.federation.router import FEDERATION_KEY, router
+
+    updater = ThetaUpdater(path=tmp_path / "theta.json")
+    persisted: list[ThetaState] = []
+    original = updater.persist_state
+
+    async def _persist(state: ThetaState) -> None:
+        persisted.append(state)
+        await original(state)
+
+    updater.persist_state = _persist  # type: ignore[method-assign]
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_theta_updater] = lambda: updater
+    client = TestClient(app)
+
+    signed = [sign_delta(_delta(seed), FEDERATION_KEY) for seed in range(1, 6)]
+    forged = sign_delta(_delta(9), b"wrong-key")
+    response = client.post("/api/federation/merge_batch", json={"deltas": signed + [forged]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["merged"] == 5 and [item["index"] for item in body["rejected"]] == [5]
+    assert len(persisted) == 1
+
+    ndjson = "\n".join(signed[:2]).encode("utf-8")
+    response = client.post(
+        "/api/federation/merge_batch", content=ndjson, headers={"content-type": "application/x-ndjson"}
+    )
+    assert response.json()["merged"] == 2 and len(persisted) == 2
+
+
+def test_partial_aggregates_are_exactly_associative() -> None:
+    import random
+
+    from backend.federation.aggregate import PartialAggregate, aggregate, sign_aggregate, verify_aggregate
+
+    deltas = [_delta(seed) for seed in range(1, 30)]
+    flat = aggregate(deltas)
+    shuffled = list(deltas)
+    random.Random(3).shuffle(shuffled)
+    tree = aggregate(aggregate(shuffled[start : start + 4]) for start in range(0, len(shuffled), 4))
+    assert tree == flat and flat.nodes == 29
+    assert aggregate([flat, PartialAggregate()]) == flat
+
+    state = ThetaState(theta=[1.0, 0.3, -0.2, 0.12], pi=[0.0] * 3, rho=[0.0] * 3)
+    merged, reference = flat.apply_to(state), merge_deltas(state, deltas)
+    assert all(abs(a - b) < 1e-12 for a, b in zip(merged.theta + merged.rho, reference.theta + reference.rho))
+    assert abs(merged.sigma - reference.sigma) < 1e-12
+
+    signed = sign_aggregate(flat, b"key")
+    assert verify_aggregate(signed, b"key") == flat
+    with pytest.raises(ValueError):
+        verify_aggregate(sign_delta(deltas[0], b"key"), b"key")
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("f64", 0.0), ("f16", 2e-3), ("q8", 0.02)])
+def test_binary_wire_roundtrip(dtype: str, tolerance: float) -> None:
+    from backend.federation.wire import decode_delta, encode_delta
+
+    delta = _delta(7)
+    blob = encode_delta(delta, b"key", dtype=dtype)
+    restored = decode_delta(blob, b"key")
+    for left, right in ((restored.theta, delta.theta), (restored.pi, delta.pi), (restored.rho, delta.rho)):
+        assert len(left) == len(right)
+        assert all(abs(a - b) <= tolerance * max(1.0, abs(b)) for a, b in zip(left, right))
+    assert (restored.updates, restored.sigma) == (delta.updates, delta.sigma)
+    assert len(blob) < len(sign_delta(delta, b"key"))
+
+    tampered = bytearray(blob)
+    tampered[60] ^= 1
+    with pytest.raises(ValueError):
+        decode_delta(bytes(tampered), b"key")
+
+
+def test_federation_endpoints_negotiate_binary(tmp_path: Path) -> None:
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from backend.feedback_service.theta import get_theta_updater
+    from backend.federation.router import FEDERATION_KEY, router
+    from backend.federation.wire import CONTENT_TYPE, STREAM_CONTENT_TYPE, decode_delta, encode_delta, encode_stream
+
+    updater = ThetaUpdater(path=tmp_path / "theta.json")
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_theta_updater] = lambda: updater
+    client = TestClient(app)
+
+    exported = client.post("/api/federation/export", headers={"accept": f"{CONTENT_TYPE}; dtype=f16"})
+    assert exported.headers["content-type"].startswith(CONTENT_TYPE)
+    assert decode_delta(exported.content, FEDERATION_KEY).theta
+    assert "delta" in client.post("/api/federation/export").json()
+
+    merged = client.post("/api/federation/merge", content=exported.content, headers={"content-type": CONTENT_TYPE})
+    assert merged.json() == {"status": "ok"}
+    forged = client.post(
+        "/api/federation/merge", content=encode_delta(_delta(1), b"other"), headers={"content-type": CONTENT_TYPE}
+    )
+    assert forged.status_code == 400
+
+    stream = encode_stream([encode_delta(_delta(seed), FEDERATION_KEY) for seed in range(1, 4)])
+    batch = client.post("/api/federation/merge_batch", content=stream, headers={"content-type": STREAM_CONTENT_TYPE})
+    assert batch.json()["merged"] == 3
+
+
+def test_sparse_deltas_converge_with_error_feedback() -> None:
+    import random
+
+    from backend.federation.sparse import NeedFullState, PeerBaseStore, SparseDeltaEncoder
+
+    rng = random.Random(5)
+    encoder = SparseDeltaEncoder("node-a", density=0.1)
+    receiver = PeerBaseStore()
+    current = ThetaDelta(
+        theta=[rng.uniform(-1, 1) for _ in range(200)], pi=[0.0] * 8, rho=[0.0] * 8, sigma=0.2, updates=5,
+        ema_reward=0.0,
+    )
+
+    full = encoder.encode(current, None)
+    assert full["kind"] == "full"
+    with pytest.raises(NeedFullState):
+        receiver.apply(encoder.encode(current, full["version"]))
+    receiver.apply(full)
+    version = receiver.version_of("node-a")
+    assert version == full["version"]
+
+    target = ThetaDelta(
+        theta=[value + rng.uniform(-0.5, 0.5) for value in current.theta], pi=[0.1] * 8, rho=[0.0] * 8,
+        sigma=0.2, updates=6, ema_reward=0.1,
+    )
+    errors = []
+    for _ in range(40):
+        payload = encoder.encode(target, version)
+        assert payload["kind"] == "sparse" and len(payload["vectors"]["theta"]["indices"]) <= 20
+        restored = receiver.apply(payload)
+        version = payload["version"]
+        errors.append(max(abs(a - b) for a, b in zip(restored.theta, target.theta)))
+    assert errors[-1] < 0.01 < errors[0]
+
+
+def test_merge_sparse_endpoint_falls_back_to_full_state(tmp_path: Path) -> None:
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from backend.feedback_service.theta import get_theta_updater
+    from backend.federation.router import FEDERATION_KEY, router
+    from backend.federation.sparse import SparseDeltaEncoder, sign_payload
+
+    updater = ThetaUpdater(path=tmp_path / "theta.json")
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_theta_updater] = lambda: updater
+    client = TestClient(app)
+
+    encoder = SparseDeltaEncoder("node-b")
+    full = encoder.full(_delta(5))
+    stale = encoder.encode(_delta(8), full["version"])
+    response = client.post("/api/federation/merge_sparse", json={"delta": sign_payload(stale, FEDERATION_KEY)})
+    assert response.status_code == 409 and response.json()["need_full"] is True
+
+    response = client.post("/api/federation/merge_sparse", json={"delta": sign_payload(full, FEDERATION_KEY)})
+    assert response.json()["version"] == full["version"]
+    sparse = encoder.encode(_delta(8), full["version"])
+    assert sparse["kind"] == "sparse"
+    response = client.post("/api/federation/merge_sparse", json={"delta": sign_payload(sparse, FEDERATION_KEY)})
+    assert response.status_code == 200 and response.json()["version"] == sparse["version"]
+
+
+def test_dp_noise_is_keyed_and_independent_of_values() -> None:
+    import math
+
+    from backend.federation.privacy import NoiseGenerator, NoiseSpec
+
+    spec = NoiseSpec.calibrate(0.5, sensitivity=2.0, delta=1e-5)
+    assert spec.scale == pytest.approx(2.0 * math.sqrt(2.0 * math.log(1.25e5)) / 0.5)
+    assert NoiseSpec.calibrate(0.5, mechanism="laplace").scale == pytest.approx(2.0)
+
+    vectors = [[1.0] * 300, [0.0] * 50, [5.0] * 50]
+    first = NoiseGenerator(b"secret").perturb(vectors, spec)
+    assert first == NoiseGenerator(b"secret").perturb(vectors, spec)
+    assert first != NoiseGenerator(b"other").perturb(vectors, spec)
+
+    generator = NoiseGenerator(b"secret")
+    assert generator.perturb(vectors, spec) != generator.perturb(vectors, spec)
+    # The same state exported twice must not reproduce the noise (the old value-seeded scheme did).
+    one = ThetaDelta.from_state(ThetaState(theta=[0.5] * 4), noise=spec)
+    two = ThetaDelta.from_state(ThetaState(theta=[0.5] * 4), noise=spec)
+    assert one.theta != two.theta
+    samples = NoiseGenerator(b"k").sample(20_000, NoiseSpec("laplace", 1.0))
+    assert abs(samples.mean()) < 0.05 and samples.std() == pytest.approx(math.sqrt(2.0), rel=0.05)
+
+
+def test_seeded_noise_stream_is_not_replayed_after_restart(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    from backend.federation import privacy
+
+    spec = privacy.NoiseSpec("gaussian", 1.0)
+    monkeypatch.setenv("KOLIBRI_DP_SEED", "00112233445566778899aabbccddeeff")
+    monkeypatch.setenv("KOLIBRI_DP_COUNTER_PATH", str(tmp_path / "dp_noise_counter.json"))
+
+    def _boot() -> "privacy.NoiseGenerator":
+        monkeypatch.setattr(privacy, "_default_generator", None)
+        return privacy.default_generator()
+
+    first_run = _boot()
+    released = [first_run.sample(64, spec) for _ in range(3)]
+    second_run = _boot()
+    assert second_run.counter == 3
+    after_restart = second_run.sample(64, spec)
+    # Export k after a restart must not carry the noise of export k from the previous run.
+    assert not any((after_restart == noise).all() for noise in released)
+    # The stream is still determined by the seed and the counter.
+    expected = privacy.NoiseGenerator(bytes.fromhex("00112233445566778899aabbccddeeff"), counter=3)
+    assert (expected.sample(64, spec) == after_restart).all()
+
+
+def test_privacy_accountant_refuses_exports_over_budget(tmp_path: Path) -> None:
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from backend.feedback_service.theta import get_theta_updater
+    from backend.federation.privacy import NoiseSpec, PrivacyAccountant, PrivacyBudgetExceeded
+    from backend.federation.router import get_privacy_accountant, router
+
+    spec = NoiseSpec.calibrate(0.4)
+    accountant = PrivacyAccountant(1.0, path=tmp_path / "dp.json")
+    accountant.spend(spec)
+    assert PrivacyAccountant(1.0, path=tmp_path / "dp.json").epsilon_spent == pytest.approx(0.4)
+
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_theta_updater] = lambda: ThetaUpdater(path=tmp_path / "theta.json")
+    app.dependency_overrides[get_privacy_accountant] = lambda: accountant
+    client = TestClient(app)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("KOLIBRI_DP_EPSILON", "0.4")
+        assert client.post("/api/federation/export").status_code == 200
+        assert client.post("/api/federation/export").status_code == 429
+    assert accountant.exports == 2
+    with pytest.raises(PrivacyBudgetExceeded):
+        accountant.spend(spec)
@@ -0,0 +1,223 @@
+"""Проверка фоновой синхронизации федерации на ASGI-пирах без сети."""
+
+from __future__ import annotations
+
+import asyncio
+from functools import partial
+from pathlib import Path
+from types import SimpleNamespace
+from uuid import uuid4
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from backend.agent import main as agent_main
+from backend.feedback_service import theta as theta_module
+from backend.feedback_service.dedup import DedupIndex
+from backend.feedback_service.main import app as feedback_app
+from backend.feedback_service.repository import FeedbackRepository, get_repository
+from backend.feedback_service.schemas import FeedbackPayload, FeedbackRecord
+from backend.feedback_service.theta import ThetaState, ThetaUpdater, get_theta_updater
+from backend.federation import scheduler as scheduler_module
+from backend.federation.router import get_peer_bases, router
+from backend.federation.scheduler import FederationSyncScheduler
+from backend.federation.sparse import PeerBaseStore
+
+KEY = b"kolibri-federation"
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class _HostRouter(httpx.AsyncBaseTransport):
+    """Отправляет запрос в ASGI-приложение по имени хоста."""
+
+    def __init__(self, apps: dict[str, FastAPI]) -> None:
+        self.transports = {host: httpx.ASGITransport(app=app) for host, app in apps.items()}
+        self.requests: list[str] = []
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request.url.host)
+        return await self.transports[request.url.host].handle_async_request(request)
+
+
+def _peer(tmp_path: Path, name: str) -> tuple[FastAPI, ThetaUpdater]:
+    updater = ThetaUpdater(path=tmp_path / f"{name}.json")
+    bases = PeerBaseStore()
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_theta_updater] = lambda: updater
+    app.dependency_overrides[get_peer_bases] = lambda: bases
+    return app, updater
+
+
+def _broken() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/api/federation/merge_sparse")
+    async def _fail() -> None:
+        raise RuntimeError("peer down")
+
+    return app
+
+
+def test_scheduler_pushes_skips_current_peers_and_backs_off(tmp_path: Path) -> None:
+    apps = {"a": _peer(tmp_path, "a"), "b": _peer(tmp_path, "b")}
+    transport = _HostRouter({"a": apps["a"][0], "b": apps["b"][0], "down": _broken()})
+    local = ThetaUpdater(path=tmp_path / "local.json")
+
+    async def _work() -> list[dict[str, str]]:
+        async with httpx.AsyncClient(transport=transport) as client:
+            scheduler = FederationSyncScheduler(
+                local,
+                ["http://a", "http://b", "http://down/"],
+                key=KEY,
+                node_id="local",
+                concurrency=2,
+                backoff_base=60.0,
+                client=client,
+            )
+            rounds = [await scheduler.sync_once(), await scheduler.sync_once()]
+            state = await local.current_state()
+            await local.persist_state(
+                ThetaState(
+                    theta=[value + 0.25 for value in state.theta],
+                    pi=state.pi,
+                    rho=state.rho,
+                    updates=state.updates + 10,
+                )
+            )
+            rounds.append(await scheduler.sync_once())
+            snapshot = scheduler.snapshot()
+            await scheduler.stop()
+        assert snapshot["peers"]["http://a"]["full_pushes"] == 1
+        assert snapshot["peers"]["http://down"]["failures"] == 1
+        return rounds
+
+    first, second, third = _run(_work())
+    assert first == {"http://a": "pushed", "http://b": "pushed", "http://down": "failed"}
+    assert second == {"http://a": "current", "http://b": "current", "http://down": "backoff"}
+    assert third["http://a"] == third["http://b"] == "pushed" and third["http://down"] == "backoff"
+    # 2 пира × 2 толкания + одна неудачная попытка; второй раунд сети не трогал.
+    assert sorted(transport.requests) == ["a", "a", "b", "b", "down"]
+
+
+def test_scheduler_loop_coalesces_notifications(tmp_path: Path) -> None:
+    app, _ = _peer(tmp_path, "a")
+    transport = _HostRouter({"a": app})
+    local = ThetaUpdater(path=tmp_path / "local.json")
+
+    async def _work() -> int:
+        async with httpx.AsyncClient(transport=transport) as client:
+            scheduler = FederationSyncScheduler(
+                local, ["http://a"], key=KEY, node_id="n", interval=60.0, coalesce=0.0, client=client
+            )
+            scheduler.start()
+            await asyncio.sleep(0.05)
+            for _ in range(5):
+                scheduler.notify()
+            await asyncio.sleep(0.05)
+            await scheduler.stop()
+            return scheduler.rounds
+
+    assert _run(_work()) == 2
+    assert transport.requests == ["a"]
+
+
+def test_local_theta_updates_wake_the_scheduler_once_per_burst(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    app, _ = _peer(tmp_path, "a")
+    transport = _HostRouter({"a": app})
+    local = ThetaUpdater(path=tmp_path / "local.json")
+
+    def _record(idx: int) -> FeedbackRecord:
+        payload = FeedbackPayload(
+            conversation_id="conv", message_id=f"msg-{idx}", rating="useful", assistant_message="Ответ"
+        )
+        return FeedbackRecord.create(record_id=uuid4(), payload=payload)
+
+    async def _work() -> tuple[int, int]:
+        async with httpx.AsyncClient(transport=transport) as client:
+            scheduler = FederationSyncScheduler(
+                local, ["http://a"], key=KEY, node_id="n", interval=60.0, coalesce=0.1, client=client
+            )
+            local.add_listener(scheduler.notify)
+            scheduler.start()
+            await asyncio.sleep(0.05)
+            idle_rounds = scheduler.rounds
+            for idx in range(5):
+                await local.update(_record(idx))
+            await asyncio.sleep(0.4)
+            local.remove_listener(scheduler.notify)
+            await scheduler.stop()
+            return idle_rounds, scheduler.rounds
+
+    idle_rounds, rounds = _run(_work())
+    # Без уведомлений второй раунд пришёл бы только через interval=60 с.
+    assert (idle_rounds, rounds) == (1, 2)
+    assert transport.requests == ["a", "a"]
+
+
+class _Sink:
+    async def save_records(self, records: list[FeedbackRecord]) -> None:
+        pass
+
+    async def append(self, record: FeedbackRecord) -> None:
+        pass
+
+
+def test_agent_scheduler_pushes_theta_updated_by_the_feedback_service(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    shared = tmp_path / "knp_theta.json"
+    monkeypatch.setenv("KNP_THETA_STATE_PATH", str(shared))
+    monkeypatch.setenv("KOLIBRI_AGENT_CACHE_SIZE", "0")
+    monkeypatch.setenv("KOLIBRI_FEDERATION_PEERS", "http://a")
+    monkeypatch.setenv("KOLIBRI_FEDERATION_SYNC_INTERVAL", "60")
+    monkeypatch.setenv("KOLIBRI_FEDERATION_SYNC_COALESCE", "0")
+    monkeypatch.setenv("KOLIBRI_FEDERATION_WATCH_INTERVAL", "0.05")
+    monkeypatch.setattr(theta_module, "_theta_updater", None)
+    monkeypatch.setattr(agent_main, "_agent", None)
+    peer_app, _ = _peer(tmp_path, "a")
+    transport = _HostRouter({"a": peer_app})
+    fake_httpx = SimpleNamespace(AsyncClient=partial(httpx.AsyncClient, transport=transport), Limits=httpx.Limits)
+    monkeypatch.setattr(scheduler_module, "_load_httpx", lambda: fake_httpx)
+    # Сервис отзывов — отдельный процесс со своим апдейтером над теми же файлами θ.
+    service = ThetaUpdater(path=shared)
+    repository = FeedbackRepository(_Sink(), _Sink(), service, DedupIndex(tmp_path / "dedup.keys"))
+    feedback_app.dependency_overrides[get_repository] = lambda: repository
+    body = [
+        {"conversation_id": "conv", "message_id": f"msg-{idx}", "rating": "useful", "assistant_message": "Ответ"}
+        for idx in range(3)
+    ]
+
+    async def _work() -> tuple[int, ThetaState, ThetaState]:
+        await agent_main._startup()
+        try:
+            await asyncio.sleep(0.1)
+            idle_rounds = agent_main._sync_scheduler.rounds
+            async with httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=feedback_app), base_url="http://feedback"
+            ) as client:
+                response = await client.post("/api/feedback/batch", json=body)
+            assert response.status_code == 200
+            await asyncio.sleep(0.3)
+            pushed = await (await get_theta_updater()).current_state()
+        finally:
+            await agent_main._shutdown()
+            await theta_module.shutdown_theta_updater()
+        return idle_rounds, pushed, await service.current_state()
+
+    try:
+        idle_rounds, pushed, applied = _run(_work())
+    finally:
+        feedback_app.dependency_overrides.clear()
+    assert idle_rounds == 1
+    assert applied.updates == 3 and pushed.theta == applied.theta
+    # Первый раунд отдал исходное состояние, второй — θ после отзывов, без ожидания interval=60 с.
+    assert transport.requests == ["a", "a"]
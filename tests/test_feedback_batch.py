@@ -0,0 +1,86 @@
+"""Проверка пакетного приёма отзывов."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+from backend.feedback_service.dedup import DedupIndex
+from backend.feedback_service.main import app
+from backend.feedback_service.repository import FeedbackRepository, get_repository
+from backend.feedback_service.schemas import FeedbackRecord
+
+
+class _Storage:
+    def __init__(self) -> None:
+        self.batches: list[list[FeedbackRecord]] = []
+
+    async def save_records(self, records: list[FeedbackRecord]) -> None:
+        self.batches.append(list(records))
+
+
+class _Dataset:
+    def __init__(self) -> None:
+        self.appended: list[FeedbackRecord] = []
+
+    async def append(self, record: FeedbackRecord) -> None:
+        self.appended.append(record)
+
+
+class _Theta:
+    def __init__(self) -> None:
+        self.batches: list[int] = []
+
+    async def update_many(self, records: list[FeedbackRecord]) -> None:
+        self.batches.append(len(records))
+
+
+def _item(idx: int) -> dict:
+    return {"conversation_id": "conv-1", "message_id": f"msg-{idx}", "rating": "useful", "assistant_message": "Ответ"}
+
+
+def _client(tmp_path: Path) -> tuple[TestClient, _Storage, _Dataset, _Theta]:
+    storage, dataset, theta = _Storage(), _Dataset(), _Theta()
+    repository = FeedbackRepository(storage, dataset, theta, DedupIndex(tmp_path / "dedup.keys"))
+    app.dependency_overrides[get_repository] = lambda: repository
+    return TestClient(app), storage, dataset, theta
+
+
+def test_batch_reports_status_per_item(tmp_path: Path) -> None:
+    client, storage, dataset, theta = _client(tmp_path)
+    try:
+        body = [_item(0), {"conversation_id": "conv-1", "rating": "useful"}, _item(0), _item(2)]
+        response = client.post("/api/feedback/batch", json=body)
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["status"] for item in data["items"]] == ["accepted", "invalid", "duplicate", "accepted"]
+    assert (data["accepted"], data["duplicates"], data["rejected"]) == (2, 1, 1)
+    assert "message_id" in data["items"][1]["error"]
+    assert [len(batch) for batch in storage.batches] == [2] and theta.batches == [2]
+    assert [record.message_id for record in dataset.appended] == ["msg-0", "msg-2"]
+
+
+def test_batch_accepts_ndjson_and_enforces_limit(tmp_path: Path, monkeypatch) -> None:
+    client, storage, _, _ = _client(tmp_path)
+    try:
+        lines = [json.dumps(_item(idx), ensure_ascii=False) for idx in range(3)] + ["{not json"]
+        response = client.post(
+            "/api/feedback/batch",
+            content="\n".join(lines).encode("utf-8"),
+            headers={"content-type": "application/x-ndjson"},
+        )
+        monkeypatch.setenv("FEEDBACK_BATCH_MAX_ITEMS", "2")
+        too_large = client.post("/api/feedback/batch", json=[_item(idx) for idx in range(10, 13)])
+        not_array = client.post("/api/feedback/batch", json=_item(20))
+    finally:
+        app.dependency_overrides.clear()
+
+    assert [item["status"] for item in response.json()["items"]] == ["accepted"] * 3 + ["invalid"]
+    assert too_large.status_code == 413
+    assert not_array.status_code == 422
+    assert sum(len(batch) for batch in storage.batches) == 3
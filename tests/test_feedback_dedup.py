@@ -0,0 +1,188 @@
+"""Проверка идемпотентного приёма отзывов."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+
+from backend.feedback_service.dedup import BloomFilter, DedupIndex, feedback_key
+from backend.feedback_service.repository import FeedbackRepository
+from backend.feedback_service.schemas import FeedbackPayload, FeedbackRecord
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+class _Storage:
+    def __init__(self, fail: bool = False) -> None:
+        self.saved: list[FeedbackRecord] = []
+        self.fail = fail
+
+    async def save_feedback(self, payload: FeedbackPayload) -> FeedbackRecord:
+        if self.fail:
+            raise RuntimeError("storage down")
+        record = FeedbackRecord.create(record_id=uuid4(), payload=payload)
+        self.saved.append(record)
+        return record
+
+
+class _Dataset:
+    def __init__(self) -> None:
+        self.appended: list[FeedbackRecord] = []
+
+    async def append(self, record: FeedbackRecord) -> None:
+        self.appended.append(record)
+
+
+class _Theta:
+    def __init__(self) -> None:
+        self.updates = 0
+
+    async def update(self, record: FeedbackRecord) -> None:
+        self.updates += 1
+
+
+def _payload(message_id: str = "msg-1") -> FeedbackPayload:
+    return FeedbackPayload(
+        conversation_id="conv-1", message_id=message_id, rating="useful", assistant_message="Ответ"
+    )
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    bloom = BloomFilter(1000, error_rate=0.01)
+    keys = [feedback_key("conv", str(idx)) for idx in range(1000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    false_positives = sum(feedback_key("other", str(idx)) in bloom for idx in range(5000))
+    assert false_positives < 150
+
+
+def test_bloom_bulk_add_matches_single_adds() -> None:
+    keys = [feedback_key("conv", str(idx)) for idx in range(500)]
+    single, bulk = BloomFilter(500), BloomFilter(500)
+    for key in keys:
+        single.add(key)
+    bulk.add_many(b"".join(keys))
+    assert bulk._array == single._array
+
+
+def test_repeat_older_than_lru_window_is_caught_by_key_log(tmp_path: Path) -> None:
+    index = DedupIndex(tmp_path / "dedup.keys", lru_size=2)
+    keys = [feedback_key("conv", str(idx)) for idx in range(5)]
+    for key in keys:
+        assert index.reserve(key)
+        index.commit(key)
+
+    assert not _run(index.areserve(keys[0]))
+    assert index.stats()["log_checks"] == 1
+    assert not index.reserve(keys[0]), "найденный в журнале ключ возвращается в LRU"
+    assert index.stats()["log_checks"] == 1
+    index.close()
+
+
+def test_bloom_false_positive_does_not_lose_feedback(tmp_path: Path) -> None:
+    index = DedupIndex(tmp_path / "dedup.keys", lru_size=1)
+    index.commit(feedback_key("conv", "old"))
+
+    class _AlwaysHit:
+        def __contains__(self, key: bytes) -> bool:
+            return True
+
+        def add(self, key: bytes) -> None:
+            return None
+
+    index._bloom = _AlwaysHit()  # type: ignore[assignment]
+    assert _run(index.areserve(feedback_key("conv", "new")))
+    assert index.stats()["log_checks"] == 1
+    index.close()
+
+
+def test_compaction_runs_off_the_lock_in_a_thread(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    index = DedupIndex(tmp_path / "dedup.keys", capacity=4, lru_size=1)
+    keys = [feedback_key("conv", str(idx)) for idx in range(12)]
+    building, release = threading.Event(), threading.Event()
+    original = BloomFilter.add_many
+
+    def _slow_add_many(self: BloomFilter, data: bytes) -> None:
+        if threading.current_thread() is not threading.main_thread() and not release.is_set():
+            building.set()
+            assert release.wait(5.0)
+        original(self, data)
+
+    monkeypatch.setattr(BloomFilter, "add_many", _slow_add_many)
+
+    async def _work() -> None:
+        for key in keys[:9]:
+            index.commit(key)
+        compaction = index._compaction
+        assert compaction is not None
+        assert await asyncio.to_thread(building.wait, 5.0)
+        # Пока фильтр строится в потоке, индекс продолжает принимать ключи.
+        assert index.reserve(keys[9])
+        index.commit(keys[9])
+        release.set()
+        await compaction
+
+    _run(_work())
+    data = (tmp_path / "dedup.keys").read_bytes()
+    assert data == b"".join(keys[5:10])
+    assert not index.reserve(keys[9]) and not index.reserve(keys[5])
+    assert index.reserve(keys[0])
+    index.close()
+
+
+def test_repository_skips_retried_feedback(tmp_path: Path) -> None:
+    storage, dataset, theta = _Storage(), _Dataset(), _Theta()
+    index = DedupIndex(tmp_path / "dedup.keys")
+    repository = FeedbackRepository(storage, dataset, theta, index)
+
+    first = _run(repository.create_feedback(_payload()))
+    retry = _run(repository.create_feedback(_payload()))
+    other = _run(repository.create_feedback(_payload("msg-2")))
+
+    assert first is not None and other is not None
+    assert retry is None
+    assert len(storage.saved) == len(dataset.appended) == theta.updates == 2
+    index.close()
+
+    restarted = DedupIndex(tmp_path / "dedup.keys")
+    assert not restarted.reserve(feedback_key("conv-1", "msg-1"))
+    assert restarted.reserve(feedback_key("conv-1", "msg-3"))
+
+
+def test_failed_feedback_can_be_retried(tmp_path: Path) -> None:
+    storage = _Storage(fail=True)
+    index = DedupIndex(tmp_path / "dedup.keys")
+    repository = FeedbackRepository(storage, _Dataset(), _Theta(), index)
+
+    with pytest.raises(RuntimeError):
+        _run(repository.create_feedback(_payload()))
+    storage.fail = False
+    assert _run(repository.create_feedback(_payload())) is not None
+    index.close()
+    assert (tmp_path / "dedup.keys").stat().st_size == 16
+
+
+def test_feedback_endpoint_acknowledges_duplicates(tmp_path: Path) -> None:
+    from fastapi.testclient import TestClient
+
+    from backend.feedback_service.main import app
+    from backend.feedback_service.repository import get_repository
+
+    repository = FeedbackRepository(_Storage(), _Dataset(), _Theta(), DedupIndex(tmp_path / "dedup.keys"))
+    app.dependency_overrides[get_repository] = lambda: repository
+    try:
+        client = TestClient(app)
+        body = _payload().model_dump(mode="json")
+        first = client.post("/api/feedback", json=body)
+        second = client.post("/api/feedback", json=body)
+    finally:
+        app.dependency_overrides.clear()
+    assert first.status_code == 201 and first.json() == {"status": "ok", "duplicate": False}
+    assert second.status_code == 200 and second.json() == {"status": "ok", "duplicate": True}
@@ -0,0 +1,286 @@
+"""Проверка конвейера приёма отзывов."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+from uuid import uuid4
+
+from backend.feedback_service.pipeline import FeedbackPipeline, RetryPolicy, build_feedback_pipeline
+from backend.feedback_service.repository import FeedbackRepository
+from backend.feedback_service.schemas import FeedbackPayload, FeedbackRecord
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _payload(idx: int) -> FeedbackPayload:
+    return FeedbackPayload(
+        conversation_id="conv-1", message_id=f"msg-{idx}", rating="useful", assistant_message="Ответ"
+    )
+
+
+def _record(idx: int) -> FeedbackRecord:
+    return FeedbackRecord.create(record_id=uuid4(), payload=_payload(idx))
+
+
+class _Storage:
+    def __init__(self) -> None:
+        self.saved: list[FeedbackRecord] = []
+        self.release = asyncio.Event()
+
+    async def save_records(self, records: list[FeedbackRecord]) -> None:
+        await self.release.wait()
+        self.saved.extend(records)
+
+
+class _Dataset:
+    def __init__(self) -> None:
+        self.appended: list[FeedbackRecord] = []
+
+    async def append(self, record: FeedbackRecord) -> None:
+        self.appended.append(record)
+
+    async def flush(self) -> None:
+        return None
+
+
+class _Theta:
+    def __init__(self) -> None:
+        self.updates = 0
+
+    async def update_many(self, records: list[FeedbackRecord]) -> None:
+        self.updates += len(records)
+
+
+def test_accept_does_not_wait_for_slow_consumers(tmp_path: Path) -> None:
+    storage, dataset, theta = _Storage(), _Dataset(), _Theta()
+    pipeline = build_feedback_pipeline(tmp_path, storage, dataset, theta)
+    repository = FeedbackRepository(storage, dataset, theta, pipeline=pipeline)
+
+    async def _work() -> dict:
+        records = await asyncio.wait_for(
+            asyncio.gather(*(repository.create_feedback(_payload(idx)) for idx in range(20))),
+            timeout=1.0,
+        )
+        assert all(record is not None for record in records)
+        await pipeline.drain(timeout=0.2)
+        stalled = pipeline.metrics()
+        storage.release.set()
+        assert await pipeline.drain(timeout=2.0)
+        await pipeline.close()
+        return stalled
+
+    stalled = _run(_work())
+    consumers = stalled["consumers"]
+    assert stalled["accepted"] == 20
+    assert consumers["storage"]["lag_records"] == 20
+    assert consumers["dataset"]["lag_records"] == consumers["theta"]["lag_records"] == 0
+    assert len(storage.saved) == len(dataset.appended) == theta.updates == 20
+    lines = (tmp_path / "wal.jsonl").read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["seq"] for line in lines] == list(range(1, 21))
+
+
+def test_consumer_retries_and_dead_letters(tmp_path: Path) -> None:
+    calls = {"flaky": 0}
+    delivered: list[str] = []
+
+    async def _flaky(records: list[FeedbackRecord]) -> None:
+        calls["flaky"] += 1
+        if calls["flaky"] < 3:
+            raise RuntimeError("temporary")
+        delivered.extend(record.message_id for record in records)
+
+    async def _broken(records: list[FeedbackRecord]) -> None:
+        raise RuntimeError("permanent")
+
+    pipeline = FeedbackPipeline(tmp_path)
+    pipeline.add_consumer("flaky", _flaky, retry=RetryPolicy(max_attempts=5, base_delay=0.001))
+    pipeline.add_consumer("broken", _broken, retry=RetryPolicy(max_attempts=2, base_delay=0.001))
+
+    async def _work() -> dict:
+        await pipeline.accept(_record(0))
+        assert await pipeline.drain(timeout=2.0)
+        metrics = pipeline.metrics()
+        await pipeline.close()
+        return metrics
+
+    metrics = _run(_work())
+    assert delivered == ["msg-0"]
+    assert metrics["consumers"]["flaky"]["retries"] == 2
+    assert metrics["consumers"]["broken"]["dead_lettered"] == 1
+    dead = [json.loads(line) for line in (tmp_path / "broken.dead.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert dead[0]["seq"] == 1 and dead[0]["record"]["message_id"] == "msg-0"
+
+
+def test_restart_replays_unprocessed_tail(tmp_path: Path) -> None:
+    processed: list[str] = []
+
+    async def _consume(records: list[FeedbackRecord]) -> None:
+        processed.extend(record.message_id for record in records)
+
+    first = FeedbackPipeline(tmp_path)
+    first.add_consumer("sink", _consume)
+
+    async def _before_crash() -> None:
+        for idx in range(3):
+            await first.accept(_record(idx))
+        await first.close()
+        # Следующие записи приняты, но процесс «падает» до их обработки.
+        blocked = FeedbackPipeline(tmp_path)
+        gate = asyncio.Event()
+
+        async def _stuck(records: list[FeedbackRecord]) -> None:
+            await gate.wait()
+
+        blocked.add_consumer("sink", _stuck)
+        for idx in range(3, 5):
+            await blocked.accept(_record(idx))
+
+    _run(_before_crash())
+    assert processed == ["msg-0", "msg-1", "msg-2"]
+
+    restarted = FeedbackPipeline(tmp_path)
+    restarted.add_consumer("sink", _consume)
+
+    async def _resume() -> None:
+        await restarted.start()
+        assert await restarted.drain(timeout=2.0)
+        seq = await restarted.accept(_record(5))
+        assert seq == 6
+        await restarted.close()
+
+    _run(_resume())
+    assert processed == [f"msg-{idx}" for idx in range(6)]
+
+
+def test_restart_does_not_replay_into_non_idempotent_consumer(tmp_path: Path) -> None:
+    replayed: list[str] = []
+    applied: list[str] = []
+
+    async def _sink(records: list[FeedbackRecord]) -> None:
+        replayed.extend(record.message_id for record in records)
+
+    async def _theta(records: list[FeedbackRecord]) -> None:
+        applied.extend(record.message_id for record in records)
+
+    async def _before_crash() -> None:
+        crashed = FeedbackPipeline(tmp_path)
+        gate = asyncio.Event()
+
+        async def _stuck(records: list[FeedbackRecord]) -> None:
+            await gate.wait()
+
+        crashed.add_consumer("sink", _stuck)
+        crashed.add_consumer("theta", _stuck, replay=False)
+        for idx in range(3):
+            await crashed.accept(_record(idx))
+
+    _run(_before_crash())
+
+    restarted = FeedbackPipeline(tmp_path)
+    restarted.add_consumer("sink", _sink)
+    restarted.add_consumer("theta", _theta, replay=False)
+
+    async def _resume() -> dict:
+        await restarted.start()
+        await restarted.accept(_record(3))
+        assert await restarted.drain(timeout=2.0)
+        metrics = restarted.metrics()
+        await restarted.close()
+        return metrics
+
+    metrics = _run(_resume())
+    assert replayed == [f"msg-{idx}" for idx in range(4)]
+    assert applied == ["msg-3"]
+    assert metrics["consumers"]["theta"]["checkpoint"] == 4
+
+
+def test_wal_is_not_truncated_while_group_commit_is_in_flight(tmp_path: Path) -> None:
+    processed: list[str] = []
+
+    async def _consume(records: list[FeedbackRecord]) -> None:
+        processed.extend(record.message_id for record in records)
+
+    pipeline = FeedbackPipeline(tmp_path, checkpoint_interval=0, max_wal_bytes=1)
+    pipeline.add_consumer("sink", _consume)
+    wal_path = tmp_path / "wal.jsonl"
+
+    async def _work() -> tuple[int, int]:
+        await pipeline.accept(_record(0))
+        assert await pipeline.drain(timeout=2.0)
+        # Пачка уже в журнале, но _seq ещё не продвинут: обнулять журнал нельзя.
+        pipeline._commit_in_flight = True
+        await asyncio.to_thread(pipeline._write_checkpoints)
+        during = wal_path.stat().st_size
+        pipeline._commit_in_flight = False
+        await asyncio.to_thread(pipeline._write_checkpoints)
+        after = wal_path.stat().st_size
+        await pipeline.close()
+        return during, after
+
+    during, after = _run(_work())
+    assert during > 0 and after == 0
+    assert processed == ["msg-0"]
+
+
+def test_stalled_consumer_applies_backpressure_to_accept(tmp_path: Path) -> None:
+    processed: list[int] = []
+
+    pipeline = FeedbackPipeline(tmp_path, max_pending=4)
+
+    async def _work() -> tuple[int, int]:
+        gate = asyncio.Event()
+
+        async def _stalled(records: list[FeedbackRecord]) -> None:
+            await gate.wait()
+            processed.extend(int(record.message_id.split("-")[1]) for record in records)
+
+        pipeline.add_consumer("storage", _stalled, max_batch=1)
+        tasks = [asyncio.create_task(pipeline.accept(_record(idx))) for idx in range(20)]
+        await asyncio.sleep(0.1)
+        queued = pipeline.metrics()["consumers"]["storage"]["queued"]
+        accepted = sum(task.done() for task in tasks)
+        gate.set()
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=2.0)
+        assert await pipeline.drain(timeout=2.0)
+        await pipeline.close()
+        return queued, accepted
+
+    queued, accepted = _run(_work())
+    assert queued == 4
+    # Одна запись у потребителя, четыре в очереди, не больше четырёх в ожидающем коммите.
+    assert accepted <= 9
+    assert processed == list(range(20))
+
+
+def test_replay_longer_than_the_queue_keeps_order(tmp_path: Path) -> None:
+    crashed = FeedbackPipeline(tmp_path, checkpoint_interval=0)
+
+    async def _stuck(records: list[FeedbackRecord]) -> None:
+        await asyncio.Event().wait()
+
+    async def _before_crash() -> None:
+        crashed.add_consumer("sink", _stuck)
+        for idx in range(6):
+            await crashed.accept(_record(idx))
+
+    _run(_before_crash())
+
+    processed: list[str] = []
+
+    async def _sink(records: list[FeedbackRecord]) -> None:
+        processed.extend(record.message_id for record in records)
+
+    restarted = FeedbackPipeline(tmp_path, max_pending=2)
+    restarted.add_consumer("sink", _sink, max_batch=1)
+
+    async def _resume() -> None:
+        await restarted.accept(_record(6))
+        assert await restarted.drain(timeout=2.0)
+        await restarted.close()
+
+    _run(_resume())
+    assert processed == [f"msg-{idx}" for idx in range(7)]
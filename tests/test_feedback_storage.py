@@ -0,0 +1,323 @@
+"""Проверка групповой записи отзывов в PostgreSQL на поддельном asyncpg."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from uuid import uuid4
+
+import pytest
+
+from backend.feedback_service import database
+from backend.feedback_service.buffered_writer import BufferedRecordWriter
+from backend.feedback_service.database import PostgresFeedbackStorage
+from backend.feedback_service.schemas import FeedbackPayload, FeedbackRecord
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _payload(idx: int) -> FeedbackPayload:
+    return FeedbackPayload(
+        conversation_id=f"conv-{idx % 7}",
+        message_id=f"msg-{idx}",
+        rating="useful",
+        assistant_message=f"Ответ {idx}",
+    )
+
+
+class _CheckViolation(Exception):
+    sqlstate = "23514"
+
+
+class _FakeConnection:
+    def __init__(self, pool: "_FakePool") -> None:
+        self._pool = pool
+        self._staged: list[tuple] = []
+
+    async def execute(self, query):
+        self._pool.check()
+        if query.startswith("INSERT INTO feedback"):
+            assert query.endswith("ON CONFLICT (id) DO NOTHING")
+            staged, self._staged = self._staged, []
+            self._pool.calls.append(("merge", len(staged)))
+            self._pool.insert(staged)
+
+    async def copy_records_to_table(self, table, *, records, columns):
+        self._pool.check()
+        assert table == "feedback_staging"
+        self._pool.calls.append(("copy", len(records)))
+        self._staged.extend(records)
+
+    async def executemany(self, query, rows):
+        self._pool.check()
+        assert query.endswith("ON CONFLICT (id) DO NOTHING")
+        self._pool.calls.append(("executemany", len(rows)))
+        self._pool.insert(rows)
+
+    def transaction(self):
+        return _AsyncNullContext(None)
+
+
+class _AsyncNullContext:
+    def __init__(self, value) -> None:
+        self._value = value
+
+    async def __aenter__(self):
+        return self._value
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class _FakePool:
+    def __init__(self) -> None:
+        self.rows: list[tuple] = []
+        self.calls: list[tuple[str, int]] = []
+        self.available = True
+        self.poison: set[str] = set()
+
+    def check(self) -> None:
+        if not self.available:
+            raise ConnectionError("database is down")
+
+    def insert(self, rows) -> None:
+        # Как INSERT … ON CONFLICT (id) DO NOTHING: целиком или ничего, дубликаты id пропускаются.
+        if any(row[2] in self.poison for row in rows):
+            raise _CheckViolation("feedback_message_id_check")
+        stored = {row[0] for row in self.rows}
+        for row in rows:
+            if row[0] not in stored:
+                stored.add(row[0])
+                self.rows.append(row)
+
+    def acquire(self):
+        return _AsyncNullContext(_FakeConnection(self))
+
+    async def close(self) -> None:
+        return None
+
+
+@pytest.fixture
+def fake_pool(monkeypatch: pytest.MonkeyPatch) -> _FakePool:
+    pool = _FakePool()
+
+    async def create_pool(dsn):
+        return pool
+
+    monkeypatch.setattr(database, "_load_asyncpg", lambda: SimpleNamespace(create_pool=create_pool))
+    return pool
+
+
+def test_postgres_storage_group_commits_concurrent_saves(fake_pool: _FakePool, tmp_path: Path) -> None:
+    storage = PostgresFeedbackStorage("postgres://fake", batch_size=64, spill_path=tmp_path / "spill.jsonl")
+
+    async def _work() -> None:
+        await asyncio.gather(*(storage.save_feedback(_payload(idx)) for idx in range(200)))
+        await storage.close()
+
+    _run(_work())
+    assert len(fake_pool.rows) == 200
+    copies = [size for kind, size in fake_pool.calls if kind == "copy"]
+    assert [size for kind, size in fake_pool.calls if kind == "merge"] == copies
+    assert len(copies) <= 5
+    assert max(copies) == 64
+
+
+def test_postgres_storage_executemany_fallback(fake_pool: _FakePool) -> None:
+    storage = PostgresFeedbackStorage("postgres://fake", use_copy=False)
+
+    async def _work() -> None:
+        await asyncio.gather(*(storage.save_feedback(_payload(idx)) for idx in range(10)))
+        await storage.close()
+
+    _run(_work())
+    assert fake_pool.calls == [("executemany", 10)]
+
+
+def test_postgres_storage_spills_and_replays(fake_pool: _FakePool, tmp_path: Path) -> None:
+    spill_path = tmp_path / "spill.jsonl"
+    storage = PostgresFeedbackStorage("postgres://fake", spill_path=spill_path)
+    fake_pool.available = False
+
+    async def _work() -> list:
+        records = await asyncio.gather(*(storage.save_feedback(_payload(idx)) for idx in range(5)))
+        spilled = [json.loads(line)["message_id"] for line in spill_path.read_text(encoding="utf-8").splitlines()]
+        fake_pool.available = True
+        await storage.close()
+        return [records, spilled]
+
+    records, spilled = _run(_work())
+    assert spilled == [record.message_id for record in records]
+    assert not spill_path.exists()
+    assert [row[0] for row in fake_pool.rows] == [record.id for record in records]
+
+
+def test_postgres_storage_without_spill_reports_failure(fake_pool: _FakePool) -> None:
+    storage = PostgresFeedbackStorage("postgres://fake")
+    fake_pool.available = False
+
+    async def _work() -> None:
+        try:
+            await storage.save_feedback(_payload(0))
+        finally:
+            await storage.close()
+
+    with pytest.raises(database.FeedbackStorageError):
+        _run(_work())
+
+
+def test_postgres_storage_ignores_redelivered_records(fake_pool: _FakePool) -> None:
+    storage = PostgresFeedbackStorage("postgres://fake")
+    records = [FeedbackRecord.create(record_id=uuid4(), payload=_payload(idx)) for idx in range(3)]
+
+    async def _work() -> None:
+        await storage.save_records(records)
+        await storage.save_records(records[1:] + [records[0]])
+        await storage.close()
+
+    _run(_work())
+    assert [row[0] for row in fake_pool.rows] == [record.id for record in records]
+
+
+def test_postgres_storage_dead_letters_rejected_rows(fake_pool: _FakePool, tmp_path: Path) -> None:
+    dead_path = tmp_path / "dead.jsonl"
+    storage = PostgresFeedbackStorage(
+        "postgres://fake", batch_size=8, spill_path=tmp_path / "spill.jsonl", dead_letter_path=dead_path
+    )
+    fake_pool.poison.add("msg-5")
+
+    async def _work() -> list:
+        results = await asyncio.gather(
+            *(storage.save_feedback(_payload(idx)) for idx in range(8)), return_exceptions=True
+        )
+        await storage.close()
+        return results
+
+    results = _run(_work())
+    failed = [idx for idx, result in enumerate(results) if isinstance(result, BaseException)]
+    assert failed == [5]
+    assert isinstance(results[5], database.FeedbackStorageError)
+    assert sorted(row[2] for row in fake_pool.rows) == sorted(f"msg-{idx}" for idx in range(8) if idx != 5)
+    dead = [json.loads(line) for line in dead_path.read_text(encoding="utf-8").splitlines()]
+    assert [entry["record"]["message_id"] for entry in dead] == ["msg-5"]
+    assert "_CheckViolation" in dead[0]["error"]
+    assert storage.writer.stats()["rejected"] == 1
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+def test_spill_replay_skips_past_a_rejected_row(fake_pool: _FakePool, tmp_path: Path) -> None:
+    spill_path = tmp_path / "spill.jsonl"
+    dead_path = tmp_path / "dead.jsonl"
+    storage = PostgresFeedbackStorage("postgres://fake", spill_path=spill_path, dead_letter_path=dead_path)
+    fake_pool.available = False
+
+    async def _work() -> int:
+        await asyncio.gather(*(storage.save_feedback(_payload(idx)) for idx in range(5)))
+        fake_pool.available = True
+        fake_pool.poison.add("msg-1")
+        written = await storage.writer.replay_spill()
+        await storage.close()
+        return written
+
+    assert _run(_work()) == 4
+    assert not spill_path.exists()
+    assert sorted(row[2] for row in fake_pool.rows) == ["msg-0", "msg-2", "msg-3", "msg-4"]
+    dead = [json.loads(line)["record"]["message_id"] for line in dead_path.read_text(encoding="utf-8").splitlines()]
+    assert dead == ["msg-1"]
+
+
+def test_buffered_writer_applies_backpressure() -> None:
+    peak = {"pending": 0}
+
+    async def _work() -> None:
+        gate = asyncio.Event()
+        writer: BufferedRecordWriter
+
+        async def flush(records):
+            peak["pending"] = max(peak["pending"], writer.stats()["pending"] + len(records))
+            await gate.wait()
+
+        writer = BufferedRecordWriter(flush, max_batch=4, max_pending=8, flush_interval=0.001)
+        tasks = [
+            asyncio.create_task(writer.submit(FeedbackRecord.create(record_id=uuid4(), payload=_payload(idx))))
+            for idx in range(20)
+        ]
+        await asyncio.sleep(0.05)
+        gate.set()
+        await asyncio.gather(*tasks)
+        await writer.close()
+        assert writer.stats()["records"] == 20
+
+    _run(_work())
+    assert peak["pending"] <= 8
+
+
+class _FakeClickHouseClient:
+    def __init__(self, failures: int = 0) -> None:
+        self.inserts: list[dict] = []
+        self.failures = failures
+        self.closed = False
+
+    async def insert(self, table, data, *, column_names, column_oriented=False):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("clickhouse is busy")
+        self.inserts.append({"table": table, "data": data, "columns": column_names, "columnar": column_oriented})
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def _install_clickhouse(monkeypatch: pytest.MonkeyPatch, client: _FakeClickHouseClient) -> None:
+    async def get_async_client(**kwargs):
+        return client
+
+    module = SimpleNamespace(get_async_client=get_async_client)
+    monkeypatch.setattr(database, "_load_clickhouse_connect", lambda: module)
+
+
+def test_clickhouse_storage_inserts_columnar_batches(monkeypatch: pytest.MonkeyPatch) -> None:
+    client = _FakeClickHouseClient()
+    _install_clickhouse(monkeypatch, client)
+    storage = database.ClickHouseFeedbackStorage("clickhouse://localhost/kolibri", batch_size=50)
+
+    async def _work() -> dict:
+        await asyncio.gather(*(storage.save_feedback(_payload(idx)) for idx in range(120)))
+        stats = storage.writer.stats()
+        await storage.close()
+        return stats
+
+    stats = _run(_work())
+    assert client.closed
+    assert all(insert["columnar"] for insert in client.inserts)
+    assert sum(len(insert["data"][0]) for insert in client.inserts) == 120
+    first = client.inserts[0]
+    assert first["columns"][2] == "message_id"
+    assert first["data"][2][:3] == ["msg-0", "msg-1", "msg-2"]
+    assert all(isinstance(value, str) for value in first["data"][0])
+    assert stats["batch_size"]["count"] == len(client.inserts)
+    assert stats["flush_latency_seconds"]["count"] == len(client.inserts)
+
+
+def test_clickhouse_storage_retries_failed_flush(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    client = _FakeClickHouseClient(failures=2)
+    _install_clickhouse(monkeypatch, client)
+    storage = database.ClickHouseFeedbackStorage(
+        "clickhouse://localhost", spill_path=tmp_path / "spill.jsonl", retries=3, retry_backoff=0.001
+    )
+
+    async def _work() -> dict:
+        await storage.save_feedback(_payload(0))
+        stats = storage.writer.stats()
+        await storage.close()
+        return stats
+
+    stats = _run(_work())
+    assert stats["retried"] == 2
+    assert stats["spilled"] == 0
+    assert len(client.inserts) == 1
+    assert not (tmp_path / "spill.jsonl").exists()
@@ -0,0 +1,74 @@
+"""Проверка кэша результатов детерминированного инференса."""
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from backend.agent.engine import KolibriAgent
+from backend.agent.result_cache import InferenceResultCache, state_fingerprint
+
+
+def test_lru_eviction_and_hit_ratio() -> None:
+    cache = InferenceResultCache(max_entries=2, admission=False)
+    cache.put("a", 1, size=1)
+    cache.put("b", 2, size=1)
+    assert cache.get("a") == 1
+    cache.put("c", 3, size=1)
+
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hit_ratio"] == pytest.approx(2 / 3)
+
+
+def test_tinylfu_rejects_one_hit_wonders() -> None:
+    cache = InferenceResultCache(max_entries=2)
+    for key in ("hot-1", "hot-2"):
+        for _ in range(5):
+            cache.get(key)
+        cache.put(key, key, size=1)
+    cache.get("cold")
+    cache.put("cold", "cold", size=1)
+
+    assert cache.get("hot-1") == "hot-1"
+    assert cache.get("hot-2") == "hot-2"
+    assert cache.stats()["rejections"] == 1
+
+
+def test_version_change_clears_memory_tier() -> None:
+    cache = InferenceResultCache()
+    cache.observe_version(state_fingerprint([1.0, 0.3]))
+    cache.put("k", "v", size=1)
+    cache.observe_version(state_fingerprint([1.0, 0.31]))
+    assert cache.get("k") is None
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path: Path) -> None:
+    first = InferenceResultCache(disk_path=tmp_path / "results.sqlite")
+    second = InferenceResultCache(disk_path=tmp_path / "results.sqlite")
+    first.put(("infer", 1), [7, 0.5, -0.1])
+
+    assert second.get(("infer", 1)) == [7, 0.5, -0.1]
+    assert second.stats()["disk_hits"] == 1
+    first.close()
+    second.close()
+
+
+def test_agent_step_is_memoized(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.chdir(tmp_path)
+    cache = InferenceResultCache()
+    agent = KolibriAgent(theta_path=str(tmp_path / "theta.json"), result_cache=cache)
+
+    async def _work() -> tuple[dict, dict]:
+        first = await agent.step(42, beam=8, depth=4)
+        second = await agent.step(42, beam=8, depth=4)
+        return first, second
+
+    first, second = asyncio.run(_work())
+    assert first["trace"] == second["trace"]
+    assert first["best_id"] == second["best_id"]
+    assert cache.stats()["hits"] == 1
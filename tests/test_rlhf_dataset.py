@@ -0,0 +1,209 @@
+"""Проверка сегментированного писателя RLHF-датасета."""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+
+from backend.feedback_service.rlhf_dataset import RLHFDatasetWriter, open_segment, read_manifest
+from backend.feedback_service.schemas import FeedbackPayload, FeedbackRecord
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _record(idx: int, rating: str = "useful") -> FeedbackRecord:
+    payload = FeedbackPayload(
+        conversation_id=f"conv-{idx % 3}",
+        message_id=f"msg-{idx}",
+        rating=rating,
+        assistant_message=f"Ответ Колибри {idx}" * 4,
+        user_message="Вопрос",
+    )
+    return FeedbackRecord.create(record_id=uuid4(), payload=payload)
+
+
+def _read_segment(path: Path) -> list[dict]:
+    with open_segment(path) as handle:
+        return [json.loads(line) for line in handle]
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_writer_rotates_segments_and_writes_manifest(tmp_path: Path, compression: str) -> None:
+    writer = RLHFDatasetWriter(
+        tmp_path / "rlhf_feedback.jsonl", segment_bytes=2048, compression=compression, batch_size=8
+    )
+
+    async def _work() -> None:
+        for idx in range(60):
+            await writer.append(_record(idx))
+        await writer.close()
+
+    _run(_work())
+    directory = tmp_path / "rlhf_feedback"
+    manifest = read_manifest(directory)
+    segments = manifest["segments"]
+    assert len(segments) > 1
+    assert all(entry["sealed"] for entry in segments)
+    assert sum(entry["records"] for entry in segments) == 60
+
+    message_ids = []
+    for entry in segments:
+        path = directory / entry["name"]
+        assert entry["bytes"] == path.stat().st_size
+        assert entry["sha256"] == hashlib.sha256(path.read_bytes()).hexdigest()
+        rows = _read_segment(path)
+        assert len(rows) == entry["records"]
+        assert entry["first_created_at"] == rows[0]["created_at"]
+        message_ids.extend(row["message_id"] for row in rows)
+    assert message_ids == [f"msg-{idx}" for idx in range(60)]
+
+
+def test_writer_seals_segment_left_open_by_crash(tmp_path: Path) -> None:
+    writer = RLHFDatasetWriter(tmp_path / "rlhf", compression="gzip")
+
+    async def _crash() -> None:
+        for idx in range(5):
+            await writer.append(_record(idx))
+        await writer.flush()
+
+    _run(_crash())
+    manifest = read_manifest(tmp_path / "rlhf")
+    assert manifest["segments"][0]["sealed"] is False
+
+    restarted = RLHFDatasetWriter(tmp_path / "rlhf", compression="gzip")
+
+    async def _resume() -> None:
+        await restarted.append(_record(5))
+        await restarted.close()
+
+    _run(_resume())
+    segments = read_manifest(tmp_path / "rlhf")["segments"]
+    assert [entry["sealed"] for entry in segments] == [True, True]
+    assert [entry["records"] for entry in segments] == [5, 1]
+
+
+def test_idle_writer_seals_segment_by_age(tmp_path: Path) -> None:
+    writer = RLHFDatasetWriter(tmp_path / "rlhf", segment_seconds=0.1, flush_interval=0.0)
+
+    async def _work() -> list[dict]:
+        for idx in range(3):
+            await writer.append(_record(idx))
+        await writer.flush()
+        assert read_manifest(tmp_path / "rlhf")["segments"][0]["sealed"] is False
+        # Новых записей нет: сегмент должен закрыться по таймеру, без следующей пачки.
+        for _ in range(50):
+            await asyncio.sleep(0.02)
+            segments = read_manifest(tmp_path / "rlhf")["segments"]
+            if segments[0]["sealed"]:
+                break
+        await writer.close()
+        return segments
+
+    segments = _run(_work())
+    assert [(entry["sealed"], entry["records"]) for entry in segments] == [(True, 3)]
+
+
+def test_reader_streams_filters_and_deduplicates(tmp_path: Path) -> None:
+    from datetime import datetime, timedelta, timezone
+
+    from backend.feedback_service.rlhf_reader import iter_feedback
+
+    dataset = tmp_path / "rlhf_feedback.jsonl"
+    legacy = _record(0)
+    dataset.write_text(json.dumps(legacy.to_json(), ensure_ascii=False) + "\n", encoding="utf-8")
+    writer = RLHFDatasetWriter(dataset, segment_bytes=1024)
+    duplicate = _record(0)
+    records = [duplicate] + [_record(idx, "not_useful" if idx % 2 else "useful") for idx in range(1, 10)]
+
+    async def _work() -> None:
+        for record in records:
+            await writer.append(record)
+        await writer.close()
+
+    _run(_work())
+
+    rows = list(iter_feedback(dataset))
+    assert [row["message_id"] for row in rows] == [f"msg-{idx}" for idx in range(10)]
+    assert rows[0]["id"] == str(legacy.id)
+    assert len(list(iter_feedback(dataset, dedup=False))) == 11
+    assert all(row["rating"] == "not_useful" for row in iter_feedback(dataset, ratings={"not_useful"}))
+    future = datetime.now(timezone.utc) + timedelta(days=1)
+    assert list(iter_feedback(dataset, since=future)) == []
+    assert list(iter_feedback(dataset, modes={"Быстрый ответ"})) == []
+
+
+def test_pair_builder_writes_sharded_columns(tmp_path: Path) -> None:
+    np = pytest.importorskip("numpy")
+    from backend.feedback_service.rlhf_reader import build_preference_pairs, read_string_column
+
+    dataset = tmp_path / "rlhf_feedback.jsonl"
+    writer = RLHFDatasetWriter(dataset)
+
+    async def _work() -> None:
+        for idx in range(12):
+            await writer.append(_record(idx, "useful" if idx < 6 else "not_useful"))
+        await writer.close()
+
+    _run(_work())
+    summary = build_preference_pairs(dataset, tmp_path / "pairs", shards=2, workers=2)
+    assert summary["records"] == 12
+    # 3 диалога, в каждом по 2 полезных и 2 бесполезных ответа на один вопрос.
+    assert sum(shard["pairs"] for shard in summary["shards"]) == 12
+
+    chosen: list[str] = []
+    for shard in summary["shards"]:
+        directory = tmp_path / "pairs" / shard["name"]
+        offsets = np.load(directory / "chosen.offsets.npy")
+        assert offsets.dtype == np.int64 and len(offsets) == shard["pairs"] + 1
+        chosen.extend(read_string_column(directory, "chosen"))
+        conversations = set(read_string_column(directory, "conversation_id"))
+        assert all(conv.startswith("conv-") for conv in conversations)
+    assert len(chosen) == 12
+    assert not (tmp_path / "pairs" / ".partitions").exists()
+
+
+def test_write_failure_is_raised_from_flush_and_retried_by_the_pipeline(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    from backend.feedback_service.pipeline import build_feedback_pipeline
+
+    class _Sink:
+        async def save_records(self, records: list[FeedbackRecord]) -> None:
+            return None
+
+        async def update_many(self, records: list[FeedbackRecord]) -> None:
+            return None
+
+    writer = RLHFDatasetWriter(tmp_path / "rlhf", flush_interval=0.0)
+    write_batch = writer._write_batch
+    failures = {"left": 2}
+
+    def _failing_disk(payloads: list[dict]) -> None:
+        if failures["left"]:
+            failures["left"] -= 1
+            raise OSError(28, "No space left on device")
+        write_batch(payloads)
+
+    monkeypatch.setattr(writer, "_write_batch", _failing_disk)
+    pipeline = build_feedback_pipeline(tmp_path / "pipeline", _Sink(), writer, _Sink(), fsync=False)
+
+    async def _work() -> dict:
+        for idx in range(3):
+            await pipeline.accept(_record(idx))
+        assert await pipeline.drain(timeout=5.0)
+        metrics = pipeline.metrics()["consumers"]["dataset"]
+        await pipeline.close()
+        await writer.close()
+        return metrics
+
+    metrics = _run(_work())
+    assert metrics["retries"] >= 1 and metrics["dead_lettered"] == 0
+    (segment,) = sorted((tmp_path / "rlhf").glob("segment-*.jsonl"))
+    assert {row["message_id"] for row in _read_segment(segment)} == {"msg-0", "msg-1", "msg-2"}
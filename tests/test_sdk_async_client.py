@@ -0,0 +1,134 @@
+"""Проверка асинхронного клиента SDK на ASGI-приложении агента без сети."""
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+SDK = ROOT / "sdk" / "python"
+if str(SDK) not in sys.path:
+    sys.path.insert(0, str(SDK))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from kolibri_sdk import AsyncKolibriAgentClient, LazyTrace, step_load  # noqa: E402
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_step_many_keeps_order_and_decodes_lazily(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from backend.agent import main
+    from backend.agent.engine import KolibriAgent
+    from backend.feedback_service import theta
+
+    # Память агента и обновителя лежит по относительным путям data/…; уводим их во временный каталог.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(theta, "_LTM", theta._UNLOADED)
+    monkeypatch.setattr(main, "_agent", KolibriAgent(theta_path=str(tmp_path / "theta.json")))
+
+    async def scenario() -> None:
+        transport = httpx.ASGITransport(app=main.app)
+        async with AsyncKolibriAgentClient("http://agent", transport=transport, max_concurrency=4) as plain:
+            expected = [await plain.step(q=q, beam=4, depth=3) for q in (3, 1, 2)]
+        async with AsyncKolibriAgentClient("http://agent", transport=transport, max_concurrency=2, fast=True) as fast:
+            steps = await fast.step_many([3, 1, 2], beam=4, depth=3)
+            assert [step.q for step in steps] == [3, 1, 2]
+            assert isinstance(steps[0].trace, LazyTrace)
+            assert steps[0].trace == expected[0].trace and len(steps[0].trace) == len(expected[0].trace)
+            assert steps[0].trace[0].level == expected[0].trace[0].level
+
+            report = await step_load(fast, concurrency=4, requests=20, beam=4, depth=3)
+            assert report.requests == 20 and report.errors == 0
+            assert report.summary()["throughput_rps"] > 0
+
+    _run(scenario())
+
+
+def test_retries_transient_statuses_with_backoff() -> None:
+    app = FastAPI()
+    calls = {"count": 0}
+
+    @app.get("/api/agent/state")
+    async def state():
+        calls["count"] += 1
+        if calls["count"] < 3:
+            from fastapi.responses import JSONResponse
+
+            return JSONResponse({"detail": "busy"}, status_code=503)
+        return {"theta": [1.0], "updates": 7, "working_memory": []}
+
+    async def scenario() -> None:
+        transport = httpx.ASGITransport(app=app)
+        async with AsyncKolibriAgentClient("http://agent", transport=transport, backoff_base=0.001) as client:
+            state = await client.state()
+            assert state.updates == 7 and client.retried == 2
+        async with AsyncKolibriAgentClient("http://agent", transport=transport, retries=0) as client:
+            calls["count"] = 0
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.state()
+
+    _run(scenario())
+
+
+class _FailingTransport(httpx.AsyncBaseTransport):
+    """Падает заданной ошибкой транспорта, затем отдаёт запрос приложению."""
+
+    def __init__(self, app: FastAPI, error: type[httpx.TransportError]) -> None:
+        self.inner = httpx.ASGITransport(app=app)
+        self.error = error
+        self.failures = 1
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.failures:
+            self.failures -= 1
+            raise self.error("boom", request=request)
+        return await self.inner.handle_async_request(request)
+
+
+def test_step_is_retried_only_when_the_request_never_reached_the_agent() -> None:
+    app = FastAPI()
+    calls = {"step": 0, "state": 0}
+
+    @app.post("/api/agent/step")
+    async def step(body: dict):
+        calls["step"] += 1
+        if calls["step"] == 1:
+            from fastapi.responses import JSONResponse
+
+            return JSONResponse({"detail": "bad gateway"}, status_code=502)
+        fields = dict.fromkeys(("modulated_q", "chi", "phi", "score", "best_id", "beam", "depth"), 0)
+        return {"q": body["q"], "trace": [], **fields}
+
+    @app.get("/api/agent/state")
+    async def state():
+        calls["state"] += 1
+        return {"theta": [1.0], "updates": 1, "working_memory": []}
+
+    def _client(transport: httpx.AsyncBaseTransport) -> AsyncKolibriAgentClient:
+        return AsyncKolibriAgentClient("http://agent", transport=transport, backoff_base=0.001)
+
+    async def scenario() -> None:
+        # 502 на POST мог прийти уже после шага: повтора нет.
+        async with _client(httpx.ASGITransport(app=app)) as client:
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.step(q=1)
+            assert client.retried == 0
+        # Ошибка чтения: шаг мог выполниться, поэтому POST не повторяется, а GET повторяется.
+        async with _client(_FailingTransport(app, httpx.ReadError)) as client:
+            with pytest.raises(httpx.ReadError):
+                await client.step(q=2)
+            assert client.retried == 0
+        async with _client(_FailingTransport(app, httpx.ReadError)) as client:
+            assert (await client.state()).updates == 1 and client.retried == 1
+        # Соединение не установлено: агент шага не видел, повтор безопасен.
+        async with _client(_FailingTransport(app, httpx.ConnectError)) as client:
+            assert (await client.step(q=3)).q == 3 and client.retried == 1
+
+    _run(scenario())
+    assert calls == {"step": 2, "state": 1}
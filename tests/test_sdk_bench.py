@@ -0,0 +1,105 @@
+"""Проверка нагрузочного теста SDK: HDR-гистограмма, generate_load и открытый/замкнутый циклы."""
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+import random
+import sys
+
+ROOT = Path(__file__).resolve().parents[1]
+SDK = ROOT / "sdk" / "python"
+if str(SDK) not in sys.path:
+    sys.path.insert(0, str(SDK))
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+
+from kolibri_sdk.bench import LatencyHistogram, LoadBench, LoadResult, generate_load, step_target  # noqa: E402
+from kolibri_sdk.cli import _build_parser  # noqa: E402
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_histogram_percentiles_stay_within_relative_error() -> None:
+    rng = random.Random(3)
+    samples = [rng.lognormvariate(-6.0, 1.5) for _ in range(20_000)]
+    histogram = LatencyHistogram()
+    for value in samples:
+        histogram.record(value)
+
+    ordered = sorted(int(value * 1_000_000) for value in samples)
+    for p in (50.0, 95.0, 99.0, 99.9):
+        exact = ordered[max(1, int(p / 100.0 * len(ordered) + 0.5)) - 1]
+        assert exact <= histogram.percentile_us(p) <= exact * 1.016 + 1
+    summary = histogram.summary()
+    assert summary["count"] == 20_000 and summary["max_ms"] == ordered[-1] / 1000.0
+    assert set(summary) >= {"p50_ms", "p95_ms", "p99_ms", "p999_ms"}
+
+
+def test_generate_load_open_loop_stops_after_requests() -> None:
+    seen: list[tuple[int, bool]] = []
+
+    async def call(index: int) -> None:
+        await asyncio.sleep(0)
+        if index % 4 == 3:
+            raise RuntimeError("boom")
+
+    result = _run(
+        generate_load(call, rps=1000, requests=20, observe=lambda index, latency: seen.append((index, latency is None)))
+    )
+    assert (result.requests, result.errors, result.histogram.count) == (20, 5, 15)
+    assert sorted(seen) == [(index, index % 4 == 3) for index in range(20)]
+    # Перцентили у всех отчётов считает одна гистограмма.
+    assert result.percentile(99.0) == result.histogram.percentile_us(99.0) / 1_000_000
+    assert result.summary()["latency"] == result.histogram.summary()
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    seen: list[int] = []
+
+    @app.post("/api/agent/step")
+    async def step(payload: dict):
+        seen.append(payload["q"])
+        await asyncio.sleep(0.005)
+        if payload["q"] % 10 == 9:
+            from fastapi.responses import JSONResponse
+
+            return JSONResponse({"detail": "boom"}, status_code=500)
+        return {"q": payload["q"]}
+
+    app.state.seen = seen
+    return app
+
+
+def test_open_loop_keeps_the_offered_rate() -> None:
+    app = _app()
+    bench = LoadBench(
+        [step_target("http://agent")], duration=0.5, rps=80, transport=httpx.ASGITransport(app=app)
+    )
+    report = _run(bench.run())
+
+    assert report["mode"] == "open" and report["requests"] == 40 == len(app.state.seen)
+    assert report["errors"] == 4 and report["targets"]["step"]["status"] == {"200": 36, "500": 4}
+    assert report["latency"]["p50_ms"] >= 5.0 and report["targets"]["step"]["latency"]["count"] == 36
+
+
+def test_closed_loop_and_cli_arguments() -> None:
+    app = _app()
+    bench = LoadBench(
+        [step_target("http://agent")], duration=0.2, concurrency=4, transport=httpx.ASGITransport(app=app)
+    )
+    report = _run(bench.run())
+    assert report["mode"] == "closed" and report["requests"] == len(app.state.seen) > 4
+    assert report["throughput_rps"] > 0
+    assert isinstance(bench.result, LoadResult) and report["latency"] == bench.result.histogram.summary()
+
+    parser = _build_parser()
+    args = parser.parse_args(["bench", "--rps", "50", "--duration", "1", "--feedback-url", "http://fb"])
+    assert args.rps == 50 and args.concurrency is None and args.feedback_url == "http://fb"
+    with pytest.raises(SystemExit):
+        parser.parse_args(["bench", "--rps", "5", "--concurrency", "2"])
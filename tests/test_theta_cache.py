@@ -0,0 +1,54 @@
+"""Проверка процессного кэша θ для infer API."""
+
+from __future__ import annotations
+
+import asyncio
+import os
+from pathlib import Path
+
+from backend.feedback_service.theta import ThetaUpdater
+from backend.feedback_service.theta_cache import ThetaCache, get_theta_cache, parse_theta_text
+
+
+def test_parse_theta_text_supports_both_formats() -> None:
+    assert parse_theta_text("1.0,0.5,-0.25\n") == [1.0, 0.5, -0.25]
+    assert parse_theta_text("θ:1,2\nπ:0,0\nσ:0.2\n") == [1.0, 2.0]
+    assert parse_theta_text("не число") == []
+
+
+def test_cache_refreshes_only_on_file_change(tmp_path: Path) -> None:
+    csv_path = tmp_path / "theta.csv"
+    csv_path.write_text("1.0,0.3\n", encoding="utf-8")
+    cache = ThetaCache(csv_path)
+
+    assert cache.refresh() is True
+    assert cache.snapshot().theta == (1.0, 0.3)
+    version = cache.version
+    assert cache.refresh() is False
+
+    csv_path.write_text("θ:2.0,0.3,0.1\n", encoding="utf-8")
+    stat = csv_path.stat()
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert cache.refresh() is True
+    assert cache.snapshot().theta == (2.0, 0.3, 0.1)
+    assert cache.version == version + 1
+
+
+def test_updater_publishes_into_registered_cache(tmp_path: Path) -> None:
+    state_path = tmp_path / "theta.json"
+    cache = get_theta_cache(state_path.with_suffix(".csv"))
+    assert cache.version == 0
+
+    updater = ThetaUpdater(path=state_path)
+
+    class _Record:
+        rating = "useful"
+        assistant_message = "Ответ Колибри"
+        user_message = None
+        comment = None
+        mode = None
+
+    asyncio.run(updater.update(_Record()))
+    theta = asyncio.run(updater.current_theta())
+    assert cache.version == 1
+    assert cache.snapshot().theta == tuple(theta)
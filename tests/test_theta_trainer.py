@@ -0,0 +1,113 @@
+"""Проверка офлайн-переобучения θ по RLHF-датасету."""
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from backend.feedback_service.rlhf_dataset import RLHFDatasetWriter
+from backend.feedback_service.schemas import FeedbackPayload, FeedbackRecord
+from backend.feedback_service.theta import ThetaUpdater
+from backend.feedback_service.rlhf_reader import iter_feedback
+from backend.feedback_service.theta_trainer import _feature_rows, accumulate, basis_matrix, retrain
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def _write_dataset(path: Path, count: int) -> None:
+    writer = RLHFDatasetWriter(path, segment_bytes=4096)
+
+    async def _work() -> None:
+        for idx in range(count):
+            useful = idx % 3 != 0
+            payload = FeedbackPayload(
+                conversation_id=f"conv-{idx % 5}",
+                message_id=f"msg-{idx}",
+                rating="useful" if useful else "not_useful",
+                assistant_message="Колибри " * (30 if useful else 3 + idx % 7),
+                user_message="Вопрос" if idx % 2 else None,
+                mode="Быстрый ответ" if idx % 4 else None,
+            )
+            await writer.append(FeedbackRecord.create(record_id=uuid4(), payload=payload))
+        await writer.close()
+
+    _run(_work())
+
+
+@pytest.mark.parametrize("n_theta", [1, 4, 7, 10])
+def test_basis_matrix_matches_online_basis(n_theta: int) -> None:
+    updater = ThetaUpdater(path=Path("/nonexistent/theta.json"))
+    signals = np.linspace(0.0, 1.0, 11)
+    expected = np.array([updater._basis_values(float(x), n_theta) for x in signals])
+    assert np.allclose(basis_matrix(signals, n_theta), expected)
+
+
+def test_retrain_solves_ridge_system_and_persists(tmp_path: Path) -> None:
+    dataset = tmp_path / "rlhf_feedback.jsonl"
+    _write_dataset(dataset, 300)
+    updater = ThetaUpdater(path=tmp_path / "theta.json")
+
+    state = _run(retrain(dataset, updater, workers=2))
+    assert state.updates == 300
+
+    files = sorted((tmp_path / "rlhf_feedback").glob("segment-*.jsonl"))
+    assert len(files) > 1
+    sums = accumulate(files, len(state.theta), len(state.pi), workers=1)
+    system = sums.gram / sums.count + updater.l2 * np.eye(len(state.theta))
+    expected = np.clip(np.linalg.solve(system, sums.reward_basis / sums.count), -updater.clip, updater.clip)
+    assert np.allclose(state.theta, expected)
+
+    reloaded = ThetaUpdater(path=tmp_path / "theta.json")
+    assert _run(reloaded.current_theta()) == pytest.approx(state.theta)
+    assert _run(reloaded.current_state()).updates == 300
+
+
+def test_retrain_with_filters_reads_single_stream(tmp_path: Path) -> None:
+    dataset = tmp_path / "rlhf_feedback.jsonl"
+    _write_dataset(dataset, 40)
+    updater = ThetaUpdater(path=tmp_path / "theta.json")
+
+    state = _run(retrain(dataset, updater, dry_run=True, ratings={"useful"}))
+    assert state.updates == sum(1 for idx in range(40) if idx % 3 != 0)
+    assert not (tmp_path / "theta.bin").exists()
+
+
+def test_retrain_fits_pi_rho_by_ridge_and_keeps_update_count(tmp_path: Path) -> None:
+    dataset = tmp_path / "rlhf_feedback.jsonl"
+    _write_dataset(dataset, 120)
+    updater = ThetaUpdater(path=tmp_path / "theta.json")
+
+    first = _run(retrain(dataset, updater))
+    state = _run(retrain(dataset, updater))
+    assert (first.updates, state.updates) == (120, 120), "повторное переобучение не раздувает счётчик"
+
+    online = _run(updater.current_state())
+    online.updates = 150  # живое состояние видело больше отзывов, чем попало в датасет
+    _run(updater.persist_state(online))
+    assert _run(retrain(dataset, updater, dry_run=True)).updates == 150
+
+    # Признаки каждой записи строятся напрямую, как в ThetaUpdater._apply_batch.
+    assistant, user, comment, mode, reward = _feature_rows(iter_feedback(dataset)).T
+    signal = np.clip(0.45 * assistant + 0.2 * mode + 0.15 * user + comment, 0.0, 1.0)
+    prediction = basis_matrix(signal, len(state.theta)) @ np.asarray(state.theta)
+    zeros, ones = np.zeros_like(signal), np.ones_like(signal)
+    pi_features = np.stack([assistant, user, mode, zeros, signal, reward, zeros, zeros], axis=1)
+    rho_features = np.stack(
+        [reward, reward - prediction, prediction, zeros, state.sigma * ones, signal, ones, zeros], axis=1
+    )
+
+    def _ridge(features: np.ndarray) -> np.ndarray:
+        width = features.shape[1]
+        system = features.T @ features / len(reward) + updater.l2 * np.eye(width)
+        return np.clip(np.linalg.solve(system, features.T @ reward / len(reward)), -updater.clip, updater.clip)
+
+    assert np.allclose(state.pi, _ridge(pi_features[:, : len(state.pi)]))
+    assert np.allclose(state.rho, _ridge(rho_features[:, : len(state.rho)]))
+    assert max(abs(value) for value in state.pi) < updater.clip
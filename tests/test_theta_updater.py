@@ -50,7 +50,9 @@ def test_theta_updater_accumulates_feedback(tmp_path: Path) -> None:
 
     assert theta_after_positive, "вектор θ не должен быть пустым"
     assert theta_after_positive[0] > 1.0
-    assert state_path.exists()
+    assert state_path.with_suffix(".wal").exists()
+    _run(updater.flush())
+    assert state_path.exists(), "JSON-экспорт обновляется вместе со снимком"
     assert state_path.with_suffix(".csv").exists()
     bin_path = state_path.with_suffix(".bin")
     assert bin_path.exists()
@@ -68,3 +70,204 @@ def test_theta_updater_accumulates_feedback(tmp_path: Path) -> None:
     payload = json.loads(state_path.read_text(encoding="utf-8"))
     assert len(payload.get("pi", [])) >= 1
     assert len(payload.get("rho", [])) >= 1
+
+
+def test_theta_updater_batches_and_coalesces_persistence(tmp_path: Path) -> None:
+    state_path = tmp_path / "theta.json"
+    updater = ThetaUpdater(path=state_path, learning_rate=0.4, batch_size=8, persist_every=100)
+
+    async def _work() -> list[float]:
+        for index in range(5):
+            await updater.update(_make_record("useful" if index % 2 == 0 else "not_useful"))
+        await updater._queue.join()  # type: ignore[union-attr]
+        assert not state_path.with_suffix(".bin").exists(), "сохранение должно быть отложено до порога"
+        await updater.aclose()
+        return await updater.current_theta()
+
+    theta = _run(_work())
+    payload = json.loads(state_path.read_text(encoding="utf-8"))
+    assert payload["updates"] == 5
+    assert payload["theta"] == pytest.approx(theta)
+
+
+def test_theta_updater_persists_every_n_updates(tmp_path: Path) -> None:
+    state_path = tmp_path / "theta.json"
+    updater = ThetaUpdater(path=state_path, persist_every=3)
+    snapshot_path = state_path.with_suffix(".bin")
+
+    async def _work() -> None:
+        await updater.update(_make_record("useful"))
+        await updater.update(_make_record("useful"))
+        assert not snapshot_path.exists()
+        await updater.update(_make_record("useful"))
+        assert snapshot_path.exists()
+
+    _run(_work())
+
+
+def test_theta_updater_recovers_from_wal_after_crash(tmp_path: Path) -> None:
+    state_path = tmp_path / "theta.json"
+    updater = ThetaUpdater(path=state_path, persist_every=2)
+    for rating in ("useful", "useful", "not_useful"):
+        _run(updater.update(_make_record(rating)))
+    expected = _run(updater.current_state())
+
+    wal_path = state_path.with_suffix(".wal")
+    with wal_path.open("ab") as handle:
+        handle.write(b"\x01\x00\x00")  # оборванный кадр после «падения»
+
+    recovered = _run(ThetaUpdater(path=state_path).current_state())
+    assert recovered.updates == expected.updates == 3
+    assert recovered.theta == expected.theta
+    assert recovered.sigma == expected.sigma
+
+
+def test_theta_snapshot_rejects_torn_file(tmp_path: Path) -> None:
+    from backend.feedback_service.theta_store import decode_snapshot, encode_snapshot
+
+    data = encode_snapshot([1.0, 0.5], [0.1], [0.2], updates=7, ema_reward=0.3, sigma=0.2)
+    snapshot = decode_snapshot(data)
+    assert snapshot.theta == [1.0, 0.5] and snapshot.updates == 7
+    with pytest.raises(ValueError):
+        decode_snapshot(data[:-5])
+
+
+def test_theta_wal_appends_after_torn_tail(tmp_path: Path) -> None:
+    state_path = tmp_path / "theta.json"
+    _run(ThetaUpdater(path=state_path).update(_make_record("useful")))
+    with state_path.with_suffix(".wal").open("ab") as handle:
+        handle.write(b"\x02\x00")
+
+    updater = ThetaUpdater(path=state_path)
+    _run(updater.update(_make_record("not_useful")))
+    expected = _run(updater.current_state())
+
+    recovered = _run(ThetaUpdater(path=state_path).current_state())
+    assert recovered.updates == 2
+    assert recovered.theta == expected.theta
+
+
+def test_gradient_diagnostics_are_sampled_off_the_update_path(tmp_path: Path) -> None:
+    updater = ThetaUpdater(path=tmp_path / "theta.json", diagnostics_every=2)
+
+    async def _work() -> dict:
+        for _ in range(6):
+            await updater.update(_make_record("useful"))
+        await updater._diagnostics.drain()
+        snapshot = updater.diagnostics()
+        await updater.aclose()
+        return snapshot
+
+    snapshot = _run(_work())
+    assert snapshot["enabled"] is True
+    assert snapshot["sampled"] == 3
+    assert snapshot["corr_4_8"]["buckets"]["+Inf"] == 3
+
+
+def test_gradient_diagnostics_disabled_by_default(tmp_path: Path) -> None:
+    updater = ThetaUpdater(path=tmp_path / "theta.json")
+    _run(updater.update(_make_record("useful")))
+    assert updater.diagnostics()["sampled"] == 0
+
+
+def test_theta_updater_batches_memory_writes_off_the_lock(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from backend.feedback_service import theta as theta_module
+    from core.memory import LongTermMemory
+    from core.representations import SymbolicEmbeddingSpace
+
+    memory = LongTermMemory(SymbolicEmbeddingSpace(), path=tmp_path / "ltm.jsonl")
+    monkeypatch.setattr(theta_module, "_LTM", memory)
+    updater = ThetaUpdater(path=tmp_path / "theta.json", memory_flush_interval=0.01)
+
+    async def _work() -> None:
+        await asyncio.gather(*(updater.update(_make_record("useful", f"Ответ {idx}")) for idx in range(5)))
+        await updater.aclose()
+
+    _run(_work())
+    memory.close()
+    lines = (tmp_path / "ltm.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 10
+    assert {json.loads(line)["meta"]["role"] for line in lines} == {"assistant", "user"}
+
+
+def test_theta_updater_conversation_context_mode(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from backend.feedback_service import theta as theta_module
+    from core.memory import LongTermMemory
+    from core.representations import SymbolicEmbeddingSpace
+
+    memory = LongTermMemory(SymbolicEmbeddingSpace(), path=tmp_path / "ltm.jsonl")
+    monkeypatch.setattr(theta_module, "_LTM", memory)
+    updater = ThetaUpdater(path=tmp_path / "theta.json", context_mode="conversation")
+    record = _make_record("useful", "Колибри летает быстро")
+
+    async def _strengths() -> list[float]:
+        first = await updater._context_strength(record)
+        second = await updater._context_strength(record)
+        await updater.aclose()
+        return [first, second]
+
+    first, second = _run(_strengths())
+    memory.close()
+    assert first == 0.0
+    assert second == pytest.approx(1.0)
+
+
+def test_theta_import_does_not_load_long_term_memory() -> None:
+    import subprocess
+
+    probe = "import backend.feedback_service.theta as t; print(t._LTM is t._UNLOADED)"
+    output = subprocess.run(
+        [sys.executable, "-c", probe], check=True, capture_output=True, text=True, cwd=ROOT
+    ).stdout
+    assert output.strip() == "True"
+
+
+def test_long_term_memory_is_loaded_on_warm_up(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from backend.feedback_service import theta as theta_module
+
+    memory_path = tmp_path / "ltm.jsonl"
+    memory_path.write_text(json.dumps({"text": "Колибри", "embedding": [1.0, 0.0]}) + "\n", encoding="utf-8")
+    monkeypatch.setenv("KNP_LTM_PATH", str(memory_path))
+    monkeypatch.setattr(theta_module, "_LTM", theta_module._UNLOADED)
+
+    memory = _run(theta_module.warm_long_term_memory())
+    assert memory is not None and memory.path == memory_path
+    assert [record.text for record in memory.records] == ["Колибри"]
+    assert theta_module.get_long_term_memory() is memory
+    memory.close()
+
+
+def test_vectorised_batch_step_matches_per_record_gradients(tmp_path: Path) -> None:
+    updater = ThetaUpdater(path=tmp_path / "theta.json", learning_rate=0.3, l2=0.01, clip=1.5)
+    state = _run(updater.current_state())
+    records = [_make_record("useful" if idx % 3 else "not_useful", "Колибри " * (idx + 1)) for idx in range(7)]
+    items = [(updater._extract_reward(record), updater._collect_features(record)[1]) for record in records]
+
+    # Эталон: прежний цикл по записям с усреднением градиентов.
+    theta, pi, rho = list(state.theta), list(state.pi), list(state.rho)
+    grads = [[0.0] * len(theta), [0.0] * len(pi), [0.0] * len(rho)]
+    for reward, metrics in items:
+        basis = updater._basis_values(metrics["signal"], len(theta))
+        prediction = sum(value * feature for value, feature in zip(theta, basis))
+        error = reward - prediction
+        pi_base = [metrics[name] for name in ("assistant_length", "user_component", "mode_component")]
+        pi_base += [metrics["context_strength"], metrics["signal"], reward]
+        rho_base = [reward, error, prediction, metrics["context_strength"], state.sigma, metrics["signal"], 1.0]
+        for grad, features, signal in zip(grads, (basis, pi_base, rho_base), (error, reward, reward)):
+            for idx in range(min(len(grad), len(features))):
+                grad[idx] += signal * features[idx]
+    lr = updater._effective_learning_rate(state.updates)
+    expected = [
+        [max(-1.5, min(1.5, value * (1.0 - rate * 0.01) + rate * grad / len(items))) for value, grad in zip(vector, g)]
+        for vector, g, rate in zip((theta, pi, rho), grads, (lr, lr * 0.6, lr * 0.4))
+    ]
+    sigma, ema = state.sigma, state.ema_reward
+    for reward, _ in items:
+        sigma, ema = max(0.05, sigma * 0.995), 0.9 * ema + 0.1 * reward
+
+    updater._apply_batch(state, items)
+    assert state.theta == pytest.approx(expected[0])
+    assert state.pi == pytest.approx(expected[1])
+    assert state.rho == pytest.approx(expected[2])
+    assert (state.sigma, state.ema_reward) == (pytest.approx(sigma), pytest.approx(ema))
+    assert state.updates == len(items)